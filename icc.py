@@ -5,7 +5,13 @@
 from jp2utils import *
 import getopt
 import sys
+import array
+import hashlib
+import cPickle
+import collections
 
+# Print curves, CLUTs and LUT tables entry by entry instead of a summary
+dump_tables = False
 
 def readlong(buffer):
     return (((ord(buffer[0])) << 24) +
@@ -123,6 +129,66 @@ def readsignature(buffer):
     else:
         return buffer[0:4]
 
+#
+# Tables are decoded in bulk into arrays of unsigned 8 or 16 bit
+# big-endian entries and summarized unless dump_tables is set.
+#
+
+def decode_table(buffer,count,prec):
+    if prec == 1:
+        return array.array('B',buffer[0:count])
+    data  = buffer[0:2 * count]
+    table = array.array('H',data[0:len(data) & ~1])
+    if sys.byteorder == "little":
+        table.byteswap()
+    return table
+
+def ramp(count,maxval,repeat = 1):
+    if count < 2:
+        return [[0] * repeat] * 2
+    exact = [i * float(maxval) / (count - 1) for i in range(count)]
+    return [[int(v) for v in exact for r in range(repeat)],
+            [int(v + 0.5) for v in exact for r in range(repeat)]]
+
+def print_table_summary(table,maxval,indent):
+    print_indent("Entries          : %d" % len(table),indent)
+    if len(table) == 0:
+        return
+    values = table.tolist()
+    lo     = min(values)
+    hi     = max(values)
+    print_indent("Range            : %d .. %d = %g .. %g" % (lo,hi,lo * 1.0 / maxval,hi * 1.0 / maxval),indent)
+    print_indent("Mean             : %g" % (sum(values) * 1.0 / len(values) / maxval),indent)
+    if values == sorted(values):
+        mono = "increasing"
+    elif values == sorted(values,reverse = True):
+        mono = "decreasing"
+    else:
+        mono = "no"
+    print_indent("Monotonic        : %s" % mono,indent)
+    if values in ramp(len(values),maxval):
+        ident = "yes"
+    else:
+        ident = "no"
+    print_indent("Identity         : %s" % ident,indent)
+
+def print_clut_summary(table,grid,oc,maxval,indent):
+    ident = len(grid) == oc and len(table) == oc * reduce(lambda a,b: a * b,grid,1)
+    for k in range(oc):
+        values = table[k::oc].tolist()
+        if len(values) == 0:
+            continue
+        print_indent("Output channel %d : min %d max %d mean %g" % \
+                     (k,min(values),max(values),sum(values) * 1.0 / len(values)),indent)
+        if ident:
+            stride = reduce(lambda a,b: a * b,grid[k+1:],1)
+            repeat = len(values) / (stride * grid[k])
+            ident  = values in [r * repeat for r in ramp(grid[k],maxval,stride)]
+    if ident:
+        print_indent("Identity         : yes",indent)
+    else:
+        print_indent("Identity         : no",indent)
+
 def print_curve(buffer,indent):
     count = readlong(buffer[0:4])
     if count == 0:
@@ -130,6 +196,8 @@ def print_curve(buffer,indent):
     elif count == 1:
         gamma = readshort(buffer[4:6])
         print_indent("Gamma mapping, gamma : 0x%04x = %g" % (gamma,gamma * 1.0 / 256.0),indent)
+    elif not dump_tables:
+        print_table_summary(decode_table(buffer[4:],count,2),65535,indent)
     else:
         off   = 4
         for i in range(count):
@@ -196,6 +264,10 @@ def print_clut(buffer,ic,oc,indent):
     print_indent("Total number of entries: %d" % prod,indent)
     prec  = ord(buffer[16:17])
     print_indent("Precision              : %d" % prec,indent)
+    if not dump_tables and (prec == 1 or prec == 2):
+        grid = [ord(buffer[i:i+1]) for i in range(ic)]
+        print_clut_summary(decode_table(buffer[20:],prod * oc,prec),grid,oc,(1 << (8 * prec)) - 1,indent)
+        return
     of    = 20
     for j in range(prod):
         entry = ""
@@ -239,6 +311,21 @@ def print_lutmAB(buffer,indent):
         print_indent("Affine Trafo      :",indent)
         print_matrix(buffer[mtffs-8:],indent+2)
     
+def print_lut_summary(buffer,ic,oc,g,n,m,prec,indent):
+    maxval = (1 << (8 * prec)) - 1
+    of     = 0
+    for i in range(ic):
+        print_indent("Input  table %d :" % i,indent)
+        print_table_summary(decode_table(buffer[of:],n,prec),maxval,indent+1)
+        of += prec*n
+    print_indent("CLUT table :",indent)
+    print_clut_summary(decode_table(buffer[of:],pow(g,ic)*oc,prec),[g] * ic,oc,maxval,indent+1)
+    of += prec*pow(g,ic)*oc
+    for i in range(oc):
+        print_indent("Output table %d :" % i,indent)
+        print_table_summary(decode_table(buffer[of:],m,prec),maxval,indent+1)
+        of += prec*m
+
 def print_lut8(buffer,indent):
     print_lutheader(buffer,indent)
     ic = ord(buffer[0:1])
@@ -248,6 +335,9 @@ def print_lut8(buffer,indent):
     m  = 256
     print_indent("Input  entries   : %d" % 256,indent)
     print_indent("Output entries   : %d" % 256,indent)
+    if not dump_tables:
+        print_lut_summary(buffer[40:],ic,oc,g,n,m,1,indent)
+        return
     of = 40
     for i in range(ic):
         print_indent("Input  table %d :" % i,indent)
@@ -270,6 +360,9 @@ def print_lut16(buffer,indent):
     m  = readshort(buffer[42:44])
     print_indent("Input  entries   : %d" % readshort(buffer[40:42]),indent)
     print_indent("Output entries   : %d" % readshort(buffer[42:44]),indent)
+    if not dump_tables:
+        print_lut_summary(buffer[44:],ic,oc,g,n,m,2,indent)
+        return
     of = 44
     for i in range(ic):
         print_indent("Input  table %d :" % i,indent)
@@ -402,7 +495,23 @@ def print_desctag(buffer,indent):
 
     
     
-def parse_icc(indent,buffer):
+#
+# A tag cut off by the end of the profile, or too short for its type,
+# is reported as such instead of ending the dump of the whole profile.
+#
+
+def print_tag_data(buffer,size,indent):
+    if len(buffer) < size:
+        print_indent("*** ICC tag extends beyond the end of the profile",indent)
+        return
+    try:
+        print_tag(buffer,size,indent)
+    except (IndexError, TypeError, ValueError):
+        print_indent("*** ICC tag data is truncated or invalid",indent)
+
+def print_icc(indent,buffer,profile = None):
+    if len(buffer) < 132:
+        raise JP2Error("ICC profile too short")
     indent += 1
     print_indent("ICC profile size        : %d bytes" % readlong(buffer[0:4]),indent)
     print_indent("Preferred CMM type      : %d" % readlong(buffer[0:8]),indent)
@@ -436,25 +545,233 @@ def parse_icc(indent,buffer):
     print_indent("Profile creator         : %s" % readsignature(buffer[80:84]),indent)
     print_indent("Profile MD5 sum         : %08lx%08lx%08x%08lx" % (
         readlong(buffer[84:88]),readlong(buffer[88:92]),readlong(buffer[92:96]),readlong(buffer[96:100])),indent)
-    count = readlong(buffer[128:132])
-    print_indent("Number of ICC tags      : %d" % count,indent)
-    off   = 128+4
+    if profile is None:
+        profile = ICCProfile(buffer)
+    print_indent("Number of ICC tags      : %d" % len(profile.directory),indent)
+    for sign,offset,size in profile.directory:
+        print_indent("ICC tag %s at offset %d size %d:" % (sign,offset,size),indent+1)
+        profile.print_tag(offset,size,indent+2)
+
+#
+# Decoding of the tag values. Text, XYZ, signature, date and s15Fixed16
+# array types become Python values, all other types are returned as the
+# raw tag data, type signature included, e.g. for icctransform.
+#
+
+def decode_mluc(buffer):
+    count   = readlong(buffer[8:12])
+    recs    = readlong(buffer[12:16])
+    offs    = 16
+    entries = []
     for i in range(count):
-        offset    = readlong(buffer[off+4:off+8])
-        size      = readlong(buffer[off+8:off+12])
-        print_indent("ICC tag %s at offset %d size %d:" % (buffer[off:off+4],offset,size),indent+1)
-        print_tag(buffer[offset:offset+size],size,indent+2)
-        off      += 12
-    
-    
-    
+        lang  = buffer[offs:offs+2]
+        cntr  = buffer[offs+2:offs+4]
+        lnth  = readlong(buffer[offs+4:offs+8])
+        disp  = readlong(buffer[offs+8:offs+12])
+        offs  = offs + recs
+        entries.append((lang,cntr,buffer[disp:disp+lnth].decode("utf-16-be","replace")))
+    return entries
+
+def decode_tag(buffer):
+    sign = buffer[0:4]
+    if sign == "desc":
+        return buffer[12:12+readlong(buffer[8:12])-1]
+    elif sign == "text":
+        return buffer[8:len(buffer)-1]
+    elif sign == "mluc":
+        return decode_mluc(buffer)
+    elif sign == "XYZ ":
+        return [tuple([s15d(readlong(buffer[off+i:off+i+4])) for i in (0,4,8)])
+                for off in range(8,len(buffer)-11,12)]
+    elif sign == "sig ":
+        return readsignature(buffer[8:12])
+    elif sign == "dtim":
+        return tuple([readshort(buffer[off:off+2]) for off in range(8,20,2)])
+    elif sign == "sf32":
+        return [s15d(readlong(buffer[off:off+4])) for off in range(8,len(buffer)-3,4)]
+    return buffer
+
+#
+# An ICC profile whose header and tag directory are read up front and
+# whose tags are only decoded, or printed, when asked for. The results
+# are kept per (offset,size) of the tag data, so tags sharing their data
+# with other directory entries, as rTRC/gTRC/bTRC often do, are decoded
+# once.
+#
+
+class ICCProfile:
+    def __init__(self,buffer):
+        if len(buffer) < 132:
+            raise JP2Error("ICC profile too short")
+        self.buffer           = buffer
+        self.size             = readlong(buffer[0:4])
+        self.version          = (ord(buffer[8]),ord(buffer[9]) >> 4)
+        self.profile_class    = buffer[12:16]
+        self.colour_space     = buffer[16:20]
+        self.pcs              = buffer[20:24]
+        self.rendering_intent = readlong(buffer[64:68])
+        self.creator          = readsignature(buffer[80:84])
+        self.profile_id       = buffer[84:100]
+        self.directory        = []
+        self.tags             = {}
+        self.values           = {}
+        self.outputs          = {}
+        count = readlong(buffer[128:132])
+        off   = 128+4
+        if off+12*count > len(buffer):
+            raise JP2Error("ICC tag directory truncated")
+        for i in range(count):
+            sign   = buffer[off:off+4]
+            offset = readlong(buffer[off+4:off+8])
+            size   = readlong(buffer[off+8:off+12])
+            self.directory.append((sign,offset,size))
+            if not sign in self.tags:
+                self.tags[sign] = (offset,size)
+            off   += 12
+
+    def __contains__(self,sign):
+        return sign in self.tags
+
+    def signatures(self):
+        return [sign for sign,offset,size in self.directory]
+
+    def tag(self,sign):
+        if not sign in self.tags:
+            raise JP2Error("ICC tag %s not present" % sign)
+        offset,size = self.tags[sign]
+        if not (offset,size) in self.values:
+            self.values[(offset,size)] = decode_tag(self.buffer[offset:offset+size])
+        return self.values[(offset,size)]
+
+    def tag_type(self,sign):
+        if not sign in self.tags:
+            raise JP2Error("ICC tag %s not present" % sign)
+        offset,size = self.tags[sign]
+        return self.buffer[offset:offset+4]
+
+    def text(self,sign):
+        if not sign in self.tags:
+            return None
+        type = self.tag_type(sign)
+        if not type in ("desc","text","mluc"):
+            raise JP2Error("ICC tag %s is of type %s, not a text" % (sign,type))
+        value = self.tag(sign)
+        if type == "mluc":
+            if len(value) == 0:
+                return ""
+            for lang,cntr,text in value:
+                if lang == "en":
+                    return text.encode("utf-8")
+            return value[0][2].encode("utf-8")
+        return value
+
+    def description(self):
+        return self.text("desc")
+
+    def copyright(self):
+        return self.text("cprt")
+
+    def print_tag(self,offset,size,indent):
+        key = (offset,size,indent,dump_tables)
+        if not key in self.outputs:
+            self.outputs[key] = capture_output(print_tag_data,self.buffer[offset:offset+size],size,indent)
+        sys.stdout.write(self.outputs[key])
+
+#
+# Most images embed one of a few common profiles. Each profile is kept
+# in a process-wide LRU cache as its ICCProfile, with the tags decoded
+# so far, and the output of parse_icc as a list of lines without the
+# indentation of the caller, such that the same profile embedded in
+# JP2, JPEG and JXR files shares one entry. The key is the profile ID of
+# the header, or the MD5 sum of the profile if the ID is not set, and
+# dump_tables. The profile is None if its tag directory is unreadable.
+# The cache can be saved to and loaded from disk.
+#
+
+icc_cache      = collections.OrderedDict()
+icc_cache_size = 64
+
+def icc_key(buffer):
+    profileid = str(buffer[84:100])
+    if profileid == "\0" * 16 or len(profileid) < 16:
+        profileid = hashlib.md5(buffer).digest()
+    return (profileid,dump_tables)
+
+def cached_icc(buffer):
+    key = icc_key(buffer)
+    if key in icc_cache:
+        entry = icc_cache.pop(key)
+    else:
+        try:
+            profile = ICCProfile(buffer)
+        except JP2Error:
+            profile = None
+        lines = capture_output(print_icc,-1,buffer,profile).splitlines()
+        if profile is not None:
+            # The printed tags are held as lines already
+            profile.outputs = {}
+        entry = (profile,lines)
+    icc_cache[key] = entry
+    while len(icc_cache) > icc_cache_size:
+        icc_cache.popitem(last = False)
+    return entry
+
+def icc_profile(buffer):
+    if icc_cache_size > 0:
+        profile = cached_icc(buffer)[0]
+        if profile is not None:
+            return profile
+    return ICCProfile(buffer)
+
+def parse_icc(indent,buffer):
+    if icc_cache_size <= 0:
+        print_icc(indent,buffer)
+        return
+    profile,lines = cached_icc(buffer)
+    prefix = "  " * (indent + 1)
+    sys.stdout.write("".join([(line and prefix + line) + "\n" for line in lines]))
+
+def load_icc_cache(filename):
+    try:
+        file = open(filename,"rb")
+    except IOError:
+        return
+    try:
+        try:
+            entries = cPickle.load(file)
+        finally:
+            file.close()
+        cache = collections.OrderedDict()
+        for key,entry in entries:
+            if isinstance(entry,tuple) and len(entry) == 2 and isinstance(entry[1],list):
+                cache[key] = entry
+    except Exception:
+        # A corrupt or truncated cache file is ignored
+        return
+    icc_cache.update(cache)
+
+def save_icc_cache(filename):
+    file = open(filename,"wb")
+    try:
+        cPickle.dump(icc_cache.items(),file,cPickle.HIGHEST_PROTOCOL)
+    finally:
+        file.close()
+
 if __name__ == "__main__":
     
     # Read Arguments
-    (args, files) = getopt.getopt(sys.argv[1:], "")
+    (args, files) = getopt.getopt(sys.argv[1:], "dc:", ["dump", "cache="])
+    cache = None
+    for (o, a) in args:
+        if o in ("-d", "--dump"):
+            dump_tables = True
+        elif o in ("-c", "--cache"):
+            cache = a
 
     if len(files) != 1:
         print "Usage: [OPTIONS] %s FILE" % (sys.argv[0])
+        print "  -d        print curves, CLUTs and LUT tables entry by entry"
+        print "  -c FILE   keep the parsed profiles in the cache file FILE"
         sys.exit(1)
 
     print "###############################################################"
@@ -466,9 +783,13 @@ if __name__ == "__main__":
 
     # Parse Files
     file = open(files[0],"rb")
+    if cache is not None:
+        load_icc_cache(cache)
     try:
         buffer = file.read()
         parse_icc(0,buffer)
         
     except JP2Error, e:
         print '***', str(e)
+    if cache is not None:
+        save_icc_cache(cache)
@@ -0,0 +1,403 @@
+#!/usr/bin/python
+
+# $Id$
+
+import sys
+import getopt
+import struct
+
+from jp2utils import *
+from icc import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#
+# Evaluation of ICC profiles. A profile tag, or the colorant and TRC
+# tags of a matrix/TRC profile, is turned into a pipeline of curves,
+# matrices with offsets and colour lookup tables that is applied to
+# NumPy arrays of colours, one colour per row. Device and PCS values
+# are normalized to 0..1 in the encoding of the tag, except for the
+# XYZ output of matrix/TRC profiles which is in PCS XYZ units.
+#
+
+class ICCTransformError(JP2Error):
+    def __init__(self, reason):
+        JP2Error.__init__(self, 'ICC transform: %s' % reason)
+
+def s15f(buffer, count):
+    return [v / 65536.0 for v in struct.unpack(">%dl" % count,buffer[0:4 * count])]
+
+class CurveStage:
+    def __init__(self, curves):
+        self.curves = curves
+
+    def describe(self):
+        return "Curves   : %s" % ", ".join([curve[0] for curve in self.curves])
+
+    def apply(self, x):
+        y = numpy.empty_like(x)
+        for c in range(len(self.curves)):
+            kind,params = self.curves[c]
+            v = x[:,c]
+            if kind == "identity":
+                y[:,c] = v
+            elif kind == "gamma":
+                y[:,c] = numpy.power(numpy.clip(v,0.0,None),params)
+            elif kind == "sampled":
+                y[:,c] = numpy.interp(v,numpy.linspace(0.0,1.0,len(params)),params)
+            else:
+                y[:,c] = parametric_curve(v,params)
+        return y
+
+def parametric_curve(x, params):
+    func = int(params[0])
+    g,a,b,c,d,e,f = (list(params[1:]) + [0.0] * 7)[0:7]
+    if func == 0:
+        return numpy.power(numpy.clip(x,0.0,None),g)
+    elif func == 1:
+        return numpy.where(x >= -b / a,numpy.power(numpy.clip(a * x + b,0.0,None),g),0.0)
+    elif func == 2:
+        return numpy.where(x >= -b / a,numpy.power(numpy.clip(a * x + b,0.0,None),g) + c,c)
+    elif func == 3:
+        return numpy.where(x >= d,numpy.power(numpy.clip(a * x + b,0.0,None),g),c * x)
+    return numpy.where(x >= d,numpy.power(numpy.clip(a * x + b,0.0,None),g) + e,c * x + f)
+
+class MatrixStage:
+    def __init__(self, matrix, offset = None):
+        self.matrix = matrix
+        self.offset = offset
+
+    def describe(self):
+        if self.offset is None:
+            return "Matrix   : %s" % " ".join(["%g" % v for row in self.matrix for v in row])
+        return "Matrix   : %s offset %s" % (" ".join(["%g" % v for row in self.matrix for v in row]),
+                                            " ".join(["%g" % v for v in self.offset]))
+
+    def apply(self, x):
+        y = numpy.dot(x,numpy.array(self.matrix).T)
+        if self.offset is not None:
+            y = y + numpy.array(self.offset)
+        return y
+
+#
+# The grid is stored with the first input channel varying slowest.
+# Trilinear (multilinear) interpolation weights all 2^n corners of the
+# enclosing cell; tetrahedral (simplex) interpolation walks from the
+# base corner along the axes in the order of decreasing fractions and
+# uses n+1 corners only.
+#
+
+class CLUTStage:
+    def __init__(self, grid, table, interpolation = "tetrahedral"):
+        self.grid          = grid
+        self.table         = table
+        self.interpolation = interpolation
+
+    def describe(self):
+        return "CLUT     : %s grid, %d outputs, %s" % \
+               ("x".join([str(g) for g in self.grid]),self.table.shape[1],self.interpolation)
+
+    def apply(self, x):
+        grid    = numpy.array(self.grid)
+        strides = numpy.array([int(numpy.prod(self.grid[i+1:])) for i in range(len(self.grid))])
+        pos     = numpy.clip(x,0.0,1.0) * (grid - 1)
+        base    = numpy.clip(numpy.floor(pos).astype(int),0,numpy.maximum(grid - 2,0))
+        frac    = pos - base
+        index   = numpy.dot(base,strides)
+        if self.interpolation == "trilinear":
+            y = numpy.zeros((x.shape[0],self.table.shape[1]))
+            for corner in range(1 << len(self.grid)):
+                if len([i for i in range(len(self.grid)) if corner & (1 << i) and self.grid[i] == 1]) > 0:
+                    continue
+                weight = numpy.ones(x.shape[0])
+                offset = numpy.zeros(x.shape[0],dtype = int)
+                for i in range(len(self.grid)):
+                    if corner & (1 << i):
+                        weight = weight * frac[:,i]
+                        offset = offset + strides[i]
+                    else:
+                        weight = weight * (1.0 - frac[:,i])
+                y += weight[:,numpy.newaxis] * self.table[index + offset]
+            return y
+        order  = numpy.argsort(-frac,axis = 1)
+        rows   = numpy.arange(x.shape[0])
+        sorted = frac[rows[:,numpy.newaxis],order]
+        y      = (1.0 - sorted[:,0])[:,numpy.newaxis] * self.table[index]
+        for k in range(len(self.grid)):
+            axis   = order[:,k]
+            index  = index + numpy.where(grid[axis] > 1,strides[axis],0)
+            if k + 1 < len(self.grid):
+                weight = sorted[:,k] - sorted[:,k + 1]
+            else:
+                weight = sorted[:,k]
+            y += weight[:,numpy.newaxis] * self.table[index]
+        return y
+
+class ICCTransform:
+    def __init__(self, stages):
+        self.stages = stages
+
+    def channels(self):
+        stage = self.stages[0]
+        if isinstance(stage,CurveStage):
+            return len(stage.curves)
+        elif isinstance(stage,CLUTStage):
+            return len(stage.grid)
+        return len(stage.matrix[0])
+
+    def apply(self, colours):
+        if numpy is None:
+            raise ICCTransformError("evaluation requires NumPy")
+        try:
+            x = numpy.atleast_2d(numpy.asarray(colours,dtype = float))
+        except ValueError:
+            raise ICCTransformError("the colours differ in their number of channels")
+        if x.ndim != 2 or x.shape[1] != self.channels():
+            raise ICCTransformError("%d channels given, the transform takes %d" % \
+                                    (x.shape[-1],self.channels()))
+        for stage in self.stages:
+            x = stage.apply(x)
+        return x
+
+def decode_curve(buffer):
+    sign = buffer[0:4]
+    if sign == "curv":
+        count = readlong(buffer[8:12])
+        if count == 0:
+            return (("identity",None),12)
+        elif count == 1:
+            return (("gamma",readshort(buffer[12:14]) / 256.0),(14 + 3) & ~3)
+        table = decode_table(buffer[12:],count,2)
+        if numpy is not None:
+            table = numpy.array(table,dtype = float) / 65535.0
+        return (("sampled",table),(12 + 2 * count + 3) & ~3)
+    elif sign == "para":
+        func  = readshort(buffer[8:10])
+        count = [1,3,4,5,7]
+        if func >= len(count):
+            raise ICCTransformError("unknown parametric curve type %d" % func)
+        return (("parametric",[func] + s15f(buffer[12:],count[func])),12 + 4 * count[func])
+    raise ICCTransformError("unsupported curve type %s" % sign)
+
+def decode_curves(buffer, offset, count):
+    curves = []
+    for i in range(count):
+        curve,size = decode_curve(buffer[offset:])
+        curves.append(curve)
+        offset += size
+    return CurveStage(curves)
+
+def decode_clut(grid, buffer, outputs, prec, interpolation):
+    count = reduce(lambda a,b: a * b,grid,1) * outputs
+    table = numpy.array(decode_table(buffer,count,prec),dtype = float) / ((1 << (8 * prec)) - 1)
+    if len(table) != count:
+        raise ICCTransformError("CLUT is truncated")
+    return CLUTStage(grid,table.reshape((-1,outputs)),interpolation)
+
+def decode_lut(buffer, pcsinput, interpolation):
+    sign  = buffer[0:4]
+    ic    = ord(buffer[8])
+    oc    = ord(buffer[9])
+    g     = ord(buffer[10])
+    if sign == "mft1":
+        prec,n,m,of = 1,256,256,48
+    else:
+        prec,n,m,of = 2,readshort(buffer[48:50]),readshort(buffer[50:52]),52
+    stages = []
+    if pcsinput and ic == 3:
+        values = s15f(buffer[12:48],9)
+        stages.append(MatrixStage([values[0:3],values[3:6],values[6:9]]))
+    scale  = float((1 << (8 * prec)) - 1)
+    curves = []
+    for i in range(ic):
+        curves.append(("sampled",numpy.array(decode_table(buffer[of:],n,prec),dtype = float) / scale))
+        of += prec * n
+    stages.append(CurveStage(curves))
+    stages.append(decode_clut([g] * ic,buffer[of:],oc,prec,interpolation))
+    of += prec * pow(g,ic) * oc
+    curves = []
+    for i in range(oc):
+        curves.append(("sampled",numpy.array(decode_table(buffer[of:],m,prec),dtype = float) / scale))
+        of += prec * m
+    stages.append(CurveStage(curves))
+    return stages
+
+def decode_lutAB(buffer, interpolation):
+    sign  = buffer[0:4]
+    ic    = ord(buffer[8])
+    oc    = ord(buffer[9])
+    boffs,mtffs,moffs,coffs,aoffs = struct.unpack(">5L",buffer[12:32])
+    stages = {}
+    if sign == "mAB ":
+        mid = oc
+    else:
+        mid = ic
+    if boffs != 0:
+        stages["B"] = decode_curves(buffer,boffs,mid)
+    if moffs != 0:
+        stages["M"] = decode_curves(buffer,moffs,mid)
+    if mtffs != 0:
+        values = s15f(buffer[mtffs:],12)
+        stages["Matrix"] = MatrixStage([values[0:3],values[3:6],values[6:9]],values[9:12])
+    if coffs != 0:
+        grid = [ord(c) for c in buffer[coffs:coffs + ic]]
+        stages["CLUT"] = decode_clut(grid,buffer[coffs + 20:],oc,ord(buffer[coffs + 16]),interpolation)
+    if aoffs != 0:
+        if sign == "mAB ":
+            stages["A"] = decode_curves(buffer,aoffs,ic)
+        else:
+            stages["A"] = decode_curves(buffer,aoffs,oc)
+    if sign == "mAB ":
+        order = ["A","CLUT","M","Matrix","B"]
+    else:
+        order = ["B","Matrix","M","CLUT","A"]
+    return [stages[name] for name in order if name in stages]
+
+#
+# A check of the CLUT interpolation against a plain per-colour
+# reference: multilinear interpolation done one axis at a time, and
+# the exact values of linear tables, which both trilinear and
+# tetrahedral interpolation must reproduce. Grids include axes of a
+# single point.
+#
+
+def reference_multilinear(grid, table, colour):
+    if len(grid) == 0:
+        return table[0]
+    n    = grid[0]
+    rest = len(table) / n
+    if n == 1:
+        return reference_multilinear(grid[1:],table[0:rest],colour[1:])
+    pos  = min(max(colour[0],0.0),1.0) * (n - 1)
+    i    = min(int(pos),n - 2)
+    frac = pos - i
+    low  = reference_multilinear(grid[1:],table[i * rest:(i + 1) * rest],colour[1:])
+    high = reference_multilinear(grid[1:],table[(i + 1) * rest:(i + 2) * rest],colour[1:])
+    return (1.0 - frac) * low + frac * high
+
+def check_interpolation(trials = 200, seed = 1):
+    if numpy is None:
+        raise ICCTransformError("evaluation requires NumPy")
+    random = numpy.random.RandomState(seed)
+    for trial in range(trials):
+        grid    = [int(g) for g in random.randint(1,6,random.randint(1,5))]
+        outputs = random.randint(1,4)
+        nodes   = numpy.array([[float((k / int(numpy.prod(grid[i+1:]))) % grid[i]) / max(grid[i] - 1,1)
+                                for i in range(len(grid))] for k in range(int(numpy.prod(grid)))])
+        colours = random.uniform(0.0,1.0,(8,len(grid)))
+        for i in range(len(grid)):
+            if grid[i] == 1:
+                colours[:,i] = 0.0
+        matrix  = random.uniform(-1.0,1.0,(len(grid),outputs))
+        linear  = numpy.dot(nodes,matrix) + random.uniform(-1.0,1.0,outputs)
+        table   = random.uniform(0.0,1.0,(len(nodes),outputs))
+        expect  = numpy.dot(colours,matrix) + linear[0] - numpy.dot(nodes[0],matrix)
+        for interpolation in ("trilinear","tetrahedral"):
+            if not numpy.allclose(CLUTStage(grid,linear,interpolation).apply(colours),expect):
+                raise ICCTransformError("%s interpolation of a linear %s table is wrong" % \
+                                        (interpolation,"x".join([str(g) for g in grid])))
+        result = CLUTStage(grid,table,"trilinear").apply(colours)
+        for c in range(len(colours)):
+            if not numpy.allclose(result[c],reference_multilinear(grid,table,colours[c])):
+                raise ICCTransformError("trilinear interpolation of a %s table differs from the reference" % \
+                                        "x".join([str(g) for g in grid]))
+    return trials
+
+#
+# The profile size and the tag directory are checked against the
+# buffer before any tag is decoded, a tag that is inconsistent with
+# its own structure is reported as truncated.
+#
+
+def read_profile(buffer):
+    if len(buffer) < 132 or buffer[36:40] != "acsp":
+        raise ICCTransformError("not an ICC profile")
+    try:
+        profile = icc_profile(buffer)
+    except JP2Error, e:
+        raise ICCTransformError(str(e))
+    if profile.size > len(buffer):
+        raise ICCTransformError("profile is truncated, %d of %d bytes present" % \
+                                (len(buffer),profile.size))
+    for sign,offset,size in profile.directory:
+        if offset + size > profile.size:
+            raise ICCTransformError("tag %s extends beyond the end of the profile" % sign)
+    return profile
+
+def tag_data(profile, sign):
+    if not sign in profile:
+        raise ICCTransformError("%s tag missing" % sign)
+    offset,size = profile.tags[sign]
+    return profile.buffer[offset:offset + size]
+
+def icc_transform(buffer, tag = "A2B0", interpolation = "tetrahedral"):
+    if numpy is None:
+        raise ICCTransformError("evaluation requires NumPy")
+    profile = read_profile(buffer)
+    try:
+        if tag in profile:
+            data = tag_data(profile,tag)
+            sign = data[0:4]
+            if sign == "mft1" or sign == "mft2":
+                return ICCTransform(decode_lut(data,tag.startswith("B2A") and profile.pcs == "XYZ ",interpolation))
+            elif sign == "mAB " or sign == "mBA ":
+                return ICCTransform(decode_lutAB(data,interpolation))
+            raise ICCTransformError("unsupported tag type %s" % sign)
+        if tag.startswith("A2B") and "rXYZ" in profile and "gXYZ" in profile and "bXYZ" in profile:
+            curves  = [decode_curve(tag_data(profile,name))[0] for name in ("rTRC","gTRC","bTRC")]
+            columns = [s15f(tag_data(profile,name)[8:20],3) for name in ("rXYZ","gXYZ","bXYZ")]
+            matrix  = [[columns[c][r] for c in range(3)] for r in range(3)]
+            return ICCTransform([CurveStage(curves),MatrixStage(matrix)])
+        if tag.startswith("A2B") and "kTRC" in profile:
+            return ICCTransform([CurveStage([decode_curve(tag_data(profile,"kTRC"))[0]])])
+    except (IndexError, struct.error, ValueError):
+        raise ICCTransformError("tag %s is truncated" % tag)
+    raise ICCTransformError("the profile has no %s tag" % tag)
+
+if __name__ == "__main__":
+    # Read Arguments
+    (args, files) = getopt.getopt(sys.argv[1:], "t:i:s", ["tag=", "interpolation=", "self-check"])
+    tag           = "A2B0"
+    interpolation = "tetrahedral"
+    for (o, a) in args:
+        if o in ("-t", "--tag"):
+            tag = a
+        elif o in ("-i", "--interpolation"):
+            interpolation = a
+        elif o in ("-s", "--self-check"):
+            try:
+                print "Interpolation check passed, %d grids" % check_interpolation()
+            except JP2Error, e:
+                print '***', str(e)
+                sys.exit(1)
+            sys.exit(0)
+
+    if len(files) < 1 or not interpolation in ("tetrahedral", "trilinear"):
+        print "Usage: %s [OPTIONS] FILE [C1,C2,... ...]" % (sys.argv[0])
+        print "  -t TAG             the tag to evaluate, default A2B0"
+        print "  -i INTERPOLATION   tetrahedral (default) or trilinear"
+        print "  -s                 check the interpolation against a reference and exit"
+        print "Colours are given as comma separated values in 0..1, the corners"
+        print "of the input space are evaluated if no colours are given."
+        sys.exit(1)
+
+    file   = open(files[0],"rb")
+    buffer = file.read()
+    file.close()
+    try:
+        transform = icc_transform(buffer,tag,interpolation)
+        for stage in transform.stages:
+            print stage.describe()
+        if len(files) > 1:
+            colours = [[float(v) for v in colour.split(",")] for colour in files[1:]]
+        else:
+            channels = transform.channels()
+            colours = [[(c >> i) & 1 for i in range(channels - 1,-1,-1)] for c in range(1 << channels)]
+        result = transform.apply(colours)
+        for colour,value in zip(colours,result):
+            print "%s -> %s" % (" ".join(["%g" % v for v in colour])," ".join(["%.6f" % v for v in value]))
+    except JP2Error, e:
+        print '***', str(e)
@@ -4,6 +4,7 @@
 
 import sys
 import string
+import jp2utils
 
 from jp2utils import *
 
@@ -31,6 +32,7 @@ class JP2Box:
         self.boxsize    = 0
         self.target     = 0
         self.bodysize   = 0
+        self.type       = None
 
     def print_indent(self, buffer, nl = 1):
 	print_indent(buffer, self.indent, nl)
@@ -124,13 +126,59 @@ class JP2Box:
         self.boxsize = length
         return (length,id)
 
-    def readbody(self):
-        # Read Box Content
-        if self.bodysize > 0:
-            buf = self.infile.read(self.bodysize)
+    def remaining(self):
+        # Bytes of the box body behind the file position, None up to EOF
+        if self.bodysize is None:
+            return None
+        return max(self.target - self.infile.tell(),0)
+
+    def readbody(self, limit = None):
+        # Read Box Content, or at most limit bytes of it
+        size = self.remaining()
+        if limit is not None and (size is None or size > limit):
+            size = limit
+        if size is None:
+            return self.infile.read()
+        return self.infile.read(size)
+
+    def readchunks(self, chunksize = 1 << 16):
+        # Read Box Content piece by piece
+        while True:
+            size = self.remaining()
+            if size == 0:
+                return
+            if size is None or size > chunksize:
+                size = chunksize
+            data = self.infile.read(size)
+            if data == "":
+                return
+            yield data
+
+    def available(self):
+        # Bytes of the file behind the file position
+        if isinstance(self.infile,Buffer):
+            return max(self.infile.rest_len(),0)
+        pos = self.infile.tell()
+        self.infile.seek(0,2)
+        end = self.infile.tell()
+        self.infile.seek(pos)
+        return max(end - pos,0)
+
+    def print_body_hex(self, prefix = ""):
+        # Hex dump of prefix and the rest of the body, up to jp2utils.hex_limit.
+        # Only the bytes present in the file are counted, a body that runs
+        # past the end of the file is a box length error
+        size = self.available()
+        body = self.remaining()
+        if body is not None and body < size:
+            size = body
+        if jp2utils.hex_limit > 0:
+            data = prefix + self.readbody(max(jp2utils.hex_limit - len(prefix),0))
         else:
-            buf = self.infile.read()
-        return buf
+            data = prefix + self.readbody()
+        print_hex(data,self.indent,size = size + len(prefix))
+        if body is not None and body > size:
+            raise InvalidBoxLength(self.boxname(self.type))
         
     def parse(self, hook):
         "Parse a container box and call the hook for each sub-box."
@@ -141,6 +189,9 @@ class JP2Box:
 		return
 	    if len(header) == 1:
 		id = header[0]
+                self.type     = id
+                self.bodysize = None
+                self.target   = 0
 		self.new_box("\"%s\"" % (id))
 		hook(self,id,"all up to EOF")
 		self.end_box()
@@ -148,6 +199,7 @@ class JP2Box:
 
             length = header[0]
             id     = header[1]
+            self.type     = id
             self.bodysize = length
             self.target   = self.infile.tell() + length
 
@@ -9,6 +9,7 @@ import jxrfile
 import jpgcodestream
 import jxscodestream
 import jp2codestream
+import jp2utils
 from jp2box import *
 from jp2utils import *
 from icc import *
@@ -283,8 +284,9 @@ def parse_rreq_box(box,buffer):
             off += 1
         print
 
-def parse_uuid_box(box,buffer):
+def parse_uuid_box(box):
     print "UUID box"
+    buffer = box.readbody(20)
     if len(buffer) < 16:
         box.print_indent("invalid box")
         return
@@ -303,12 +305,12 @@ def parse_uuid_box(box,buffer):
     box.print_indent("UUID Data :")
     if avbrand and len(buffer) >= 20:
         box.print_indent("Pegasus Version: %d " % ordl(buffer[16:20]))
-        if len(buffer) > 20:
+        if box.remaining() != 0:
             print "Additional Data:"
-            box.print_hex(buffer[20:])
+            box.print_body_hex()
     else:
         print
-        box.print_hex(buffer[16:])
+        box.print_body_hex(buffer[16:])
 
 def parse_filetype_box(box,buffer):
     box.print_indent("File Type box");
@@ -947,13 +949,26 @@ def parse_signature_box(box,buffer):
     else:
         print "yes"
 
-def parse_xml_box(box,buffer):
+#
+# Print the body as print_indent would, chunk by chunk. As before, a
+# trailing NUL is removed along with the character in front of it.
+#
+
+def print_text_body(box):
+    sys.stdout.write("  " * box.indent)
+    pending = ""
+    for data in box.readchunks():
+        pending = pending + data
+        sys.stdout.write(pending[:-2])
+        pending = pending[-2:]
+    if pending[-1:] == "\0":
+        pending = pending[:-2]
+    sys.stdout.write(pending + "\n")
+
+def parse_xml_box(box):
     print "XML box"
     box.print_indent("Data:")
-    s = buffer
-    if s[len(s) - 1] == "\0":
-        s = s[:len(s) - 2]
-    box.print_indent(s)
+    print_text_body(box)
 
 def parse_uuidlist_box(box,buffer):
     print "UUID List box"
@@ -1988,7 +2003,7 @@ def testBit(int_type, offset):
 
 def parse_jumd_box(box):
     box.print_indent("JUMBF Description box")
-    buffer = box.infile.read()
+    buffer = box.readbody()
     type= buffer[0:16]
     box.print_indent("TYPE: %02x %02x %02x %02x %02x %02x %02x %02x %02x %02x %02x %02x %02x %02x %02x %02x" % \
            (ord(type[ 0]), ord(type[ 1]), ord(type[ 2]), ord(type[ 3]),
@@ -2029,19 +2044,151 @@ def parse_jumd_box(box):
     else:
         box.print_indent("No Signature")
 
-def parse_json_box(box,buffer):
+def parse_json_box(box):
     print "JSON box"
     box.print_indent("Data:")
-    s = buffer
-    if s[len(s) - 1] == "\0":
-        s = s[:len(s) - 2]
-    box.print_indent(s)
+    print_text_body(box)
 
 def parse_superbox(box,boxtype):
     print boxtype
     box = JP2Box(box,box.infile)
     box.parse(superbox_hook)
     
+def parse_capture_resolution_box(box,buffer):
+    print "Capture Resolution box"
+    parse_resolution_box(box,buffer)
+
+def parse_display_resolution_box(box,buffer):
+    print "Default Display Resolution box"
+    parse_resolution_box(box,buffer)
+
+#
+# The parsers of the boxes that are not superboxes and whose body is read
+# in one piece. Unknown boxes are dumped without reading more than the
+# dump shows, XML, JSON and UUID boxes are streamed.
+#
+
+leaf_box_parsers = {
+    "jP  " : parse_signature_box,
+    "jXS " : parse_signature_box,
+    "phld" : parse_placeholder_box,
+    "ftyp" : parse_filetype_box,
+    "rreq" : parse_rreq_box,
+    "cref" : parse_cref_box,
+    "ihdr" : parse_image_header_box,
+    "bpcc" : parse_bpc_box,
+    "colr" : parse_colorspec_box,
+    "pclr" : parse_palette_box,
+    "cmap" : parse_cmap_box,
+    "cdef" : parse_cdef_box,
+    "lbl " : parse_label_box,
+    "resc" : parse_capture_resolution_box,
+    "resd" : parse_display_resolution_box,
+    "opct" : parse_opct_box,
+    "creg" : parse_creg_box,
+    "ulst" : parse_uuidlist_box,
+    "url " : parse_url_box,
+    "flst" : parse_flst_box,
+    "nlst" : parse_nlst_box,
+    "copt" : parse_copt_box,
+    "inst" : parse_inst_box,
+    "roid" : parse_roi_box,
+    "mvhd" : parse_mvhd_box,
+    "tkhd" : parse_tkhd_box,
+    "mdhd" : parse_mdhd_box,
+    "mhdr" : parse_mhdr_box,
+    "hdlr" : parse_hdlr_box,
+    "vmhd" : parse_vmhd_box,
+    "smhd" : parse_smhd_box,
+    "dref" : parse_dref_box,
+    "stts" : parse_stts_box,
+    "stsd" : parse_stsd_box,
+    "mjp2" : parse_mjp2_box,
+    "jxsm" : parse_jxsm_box,
+    "jp2p" : parse_jp2p_box,
+    "jp2x" : parse_jp2x_box,
+    "stsc" : parse_stsc_box,
+    "stsz" : parse_stsz_box,
+    "stco" : parse_stco_box,
+    "co64" : parse_co64_box,
+    "twos" : lambda box,buffer: parse_audio_box(box,buffer,"Audio sample entry (signed)"),
+    "raw " : lambda box,buffer: parse_audio_box(box,buffer,"Audio sample entry (unsigned)"),
+    "trex" : parse_trex_box,
+    "mfhd" : parse_mfhd_box,
+    "tfhd" : parse_tfhd_box,
+    "trun" : parse_trun_box,
+    "fiel" : parse_fiel_box,
+    "jsub" : parse_jsub_box,
+    "elst" : parse_elst_box,
+    "cprt" : parse_cprt_box,
+    "jp2i" : parse_jp2i_box,
+    "pxfm" : parse_pxfm_box,
+    "TONE" : parse_TONE_box,
+    "FTON" : parse_FTON_box,
+    "RFIN" : lambda box,buffer: parse_RFIN_box(box,buffer,"RFIN"),
+    "FINE" : lambda box,buffer: parse_RFIN_box(box,buffer,"FINE"),
+    "AFIN" : lambda box,buffer: parse_RFIN_box(box,buffer,"AFIN"),
+    "ARRF" : lambda box,buffer: parse_RFIN_box(box,buffer,"ARRF"),
+    "LCHK" : parse_LCHK_box,
+    "LTRF" : parse_XTColorTrafo_box,
+    "RTRF" : parse_XTColorTrafo_box,
+    "CTRF" : parse_XTColorTrafo_box,
+    "DTRF" : parse_XTColorTrafo_box,
+    "STRF" : parse_XTColorTrafo_box,
+    "LPTS" : parse_XTNLT_box,
+    "QPTS" : parse_XTNLT_box,
+    "RPTS" : parse_XTNLT_box,
+    "CPTS" : parse_XTNLT_box,
+    "SPTS" : parse_XTNLT_box,
+    "DPTS" : parse_XTNLT_box,
+    "PPTS" : parse_XTNLT_box,
+    "OCON" : parse_OCON_box,
+    "RSPC" : parse_RSPC_box,
+    "CURV" : parse_CURV_box,
+    "LDCT" : parse_DCT_box,
+    "RDCT" : parse_DCT_box,
+    "MTRX" : parse_MTRX_box,
+    "FTRX" : parse_FTRX_box,
+    "AMUL" : parse_AMUL_box,
+    "jxpl" : parse_jxpl_box,
+    "bmdm" : parse_bmdm_box,
+    "dmon" : parse_dmon_box,
+    "jptp" : parse_jptp_box,
+    "jpvi" : parse_jpvi_box
+}
+
+#
+# The superboxes, whose bodies are parsed as a sequence of boxes, by
+# the names they are printed with.
+#
+
+superbox_names = {
+    "jp2h" : "JP2 Header box",
+    "jpch" : "Codestream Header box",
+    "jplh" : "Compositing Layer Header box",
+    "uinf" : "UUID Info box",
+    "ftbl" : "Fragment table box",
+    "comp" : "Composition box",
+    "asoc" : "Association box",
+    "res " : "Resolution box",
+    "cgrp" : "Color Group box",
+    "moov" : "Movie box",
+    "trak" : "Track box",
+    "mdia" : "Media box",
+    "minf" : "Media information box",
+    "dinf" : "Data information box",
+    "stbl" : "Sample table box",
+    "edts" : "Edit box",
+    "traf" : "Track fragment box",
+    "mvex" : "Movie extends box",
+    "moof" : "Movie fragment box",
+    "udta" : "User data box",
+    "SPEC" : "JPEG XT Merging Specification box",
+    "ASPC" : "JPEG XT Alpha Merging Specification box",
+    "jpvs" : "JPEG XS Video Support box",
+    "jumb" : "JUMBF Box",
+}
+
 def superbox_hook(box,id,length):
     if id == "jp2c" or id == "jxsH" or id == "RESI" or id == "ARES" or id == "ALFA":
         if id == "jp2c":
@@ -2080,237 +2227,44 @@ def superbox_hook(box,id,length):
  	print "Free space box (skipping raw box contents of %s bytes)" % length
     elif id == "skip":
  	print "Free space box (skipping raw box contents of %s bytes)" % length
-    elif id == "jp2h":
-        parse_superbox(box,"JP2 Header box")
-    elif id == "jpch":
-        parse_superbox(box,"Codestream Header box")
-    elif id == "jplh":
-        parse_superbox(box,"Compositing Layer Header box")
-    elif id == "uinf":
-        parse_superbox(box,"UUID Info box")
-    elif id == "ftbl":
-        parse_superbox(box,"Fragment table box")
-    elif id == "comp":
-        parse_superbox(box,"Composition box")
-    elif id == "asoc":
-        parse_superbox(box,"Association box")
-    elif id == "res ":
-        parse_superbox(box,"Resolution box")
-    elif id == "cgrp":
-        parse_superbox(box,"Color Group box")
-    elif id == "moov":
-        parse_superbox(box,"Movie box")
-    elif id == "trak":
-        parse_superbox(box,"Track box")
-    elif id == "mdia":
-        parse_superbox(box,"Media box")
-    elif id == "minf":
-        parse_superbox(box,"Media information box")
-    elif id == "dinf":
-        parse_superbox(box,"Data information box")
-    elif id == "stbl":
-        parse_superbox(box,"Sample table box")
-    elif id == "edts":
-        parse_superbox(box,"Edit box")
-    elif id == "traf":
-        parse_superbox(box,"Track fragment box")
-    elif id == "mvex":
-        parse_superbox(box,"Movie extends box")
-    elif id == "moof":
-        parse_superbox(box,"Movie fragment box")
-    elif id == "udta":
-        parse_superbox(box,"User data box")
-    elif id == "SPEC":
-        parse_superbox(box,"JPEG XT Merging Specification box")
-    elif id == "ASPC":
-        parse_superbox(box,"JPEG XT Alpha Merging Specification box")
-    elif id == "jpvs":
-        parse_superbox(box,"JPEG XS Video Support box")
-    elif id == "jumb":
-        parse_superbox(box,"JUMBF Box")
+    elif id in superbox_names:
+        parse_superbox(box,superbox_names[id])
     elif id == 'jumd':
         # because there is a null term in the box, we need to do it this way...
         parse_jumd_box(box)
+    elif id == "xml ":
+        parse_xml_box(box)
+    elif id == "json":
+        parse_json_box(box)
+    elif id == "uuid":
+        parse_uuid_box(box)
+    elif id in leaf_box_parsers:
+        leaf_box_parsers[id](box,box.readbody())
     else:
-        buffer = box.readbody()
-        if id == "jP  ": # JP2 Signature Box
-            parse_signature_box(box,buffer)
-        elif id == "jXS ": # JPEG XS signature box
-            parse_signature_box(box,buffer)
-        elif id == "phld":
-            parse_placeholder_box(box,buffer)
-        elif id == "ftyp":
-            parse_filetype_box(box,buffer)
-        elif id == "xml ":
-            parse_xml_box(box,buffer)
-        elif id == "uuid":
-            parse_uuid_box(box,buffer)
-        elif id == "rreq":
-            parse_rreq_box(box,buffer)
-        elif id == "cref":
-            parse_cref_box(box,buffer)
-        elif id == "ihdr":
-            parse_image_header_box(box,buffer)
-        elif id == "bpcc":
-            parse_bpc_box(box,buffer)
-        elif id == "colr":
-            parse_colorspec_box(box,buffer)
-        elif id == "pclr":
-            parse_palette_box(box,buffer)
-        elif id == "cmap":
-            parse_cmap_box(box,buffer)
-        elif id == "cdef":
-            parse_cdef_box(box,buffer)
-        elif id == "lbl ":
-            parse_label_box(box,buffer)
-        elif id == "free":
-            print "Free box"
-            box.print_hex(buffer)
-        elif id == "resc":
-            print "Capture Resolution box"
-            parse_resolution_box(box,buffer)
-        elif id == "resd":	
-            print "Default Display Resolution box"
-            parse_resolution_box(box,buffer)
-        elif id == "opct":
-            parse_opct_box(box,buffer)
-        elif id == "creg":
-            parse_creg_box(box,buffer)
-        elif id == "ulst":
-            parse_uuidlist_box(box,buffer)
-        elif id == "url ":
-            parse_url_box(box,buffer)
-        elif id == "flst":
-            parse_flst_box(box,buffer)
-        elif id == "nlst":
-            parse_nlst_box(box,buffer)
-        elif id == "copt":
-            parse_copt_box(box,buffer)
-        elif id == "inst":
-            parse_inst_box(box,buffer)
-        elif id == "roid":
-            parse_roi_box(box,buffer)
-        elif id == "mvhd":
-            parse_mvhd_box(box,buffer)
-        elif id == "tkhd":
-            parse_tkhd_box(box,buffer)
-        elif id == "mdhd":
-            parse_mdhd_box(box,buffer)
-        elif id == "mhdr":
-            parse_mhdr_box(box,buffer)
-        elif id == "hdlr":
-            parse_hdlr_box(box,buffer)
-        elif id == "vmhd":
-            parse_vmhd_box(box,buffer)
-        elif id == "smhd":
-            parse_smhd_box(box,buffer)
-        elif id == "dref":
-            parse_dref_box(box,buffer)
-        elif id == "stts":
-            parse_stts_box(box,buffer)
-        elif id == "stsd":
-            parse_stsd_box(box,buffer)
-        elif id == "mjp2":
-            parse_mjp2_box(box,buffer)
-        elif id == "jxsm":
-            parse_jxsm_box(box,buffer)
-        elif id == "jp2p":
-            parse_jp2p_box(box,buffer)
-        elif id == "jp2x":
-            parse_jp2x_box(box,buffer)
-        elif id == "stsc":
-            parse_stsc_box(box,buffer)
-        elif id == "stsz":
-            parse_stsz_box(box,buffer)
-        elif id == "stco":
-            parse_stco_box(box,buffer)
-        elif id == "co64":
-            parse_co64_box(box,buffer)
-        elif id == "twos":
-            parse_audio_box(box,buffer,"Audio sample entry (signed)")
-        elif id == "raw ":
-            parse_audio_box(box,buffer,"Audio sample entry (unsigned)")
-        elif id == "trex":
-            parse_trex_box(box,buffer)
-        elif id == "mfhd":
-            parse_mfhd_box(box,buffer)
-        elif id == "tfhd":
-            parse_tfhd_box(box,buffer)
-        elif id == "trun":
-            parse_trun_box(box,buffer)
-        elif id == "fiel":
-            parse_fiel_box(box,buffer)
-        elif id == "jsub":
-            parse_jsub_box(box,buffer)
-        elif id == "elst":
-            parse_elst_box(box,buffer)
-        elif id == "cprt":
-            parse_cprt_box(box,buffer)
-        elif id == "jp2i":
-            parse_jp2i_box(box,buffer)
-        elif id == 'pxfm':
-            parse_pxfm_box(box,buffer)
-        elif id == 'TONE':
-            parse_TONE_box(box,buffer)
-        elif id == 'FTON':
-            parse_FTON_box(box,buffer)
-        elif id == 'RFIN':
-            parse_RFIN_box(box,buffer,id)
-        elif id == 'FINE':
-            parse_RFIN_box(box,buffer,id)
-        elif id == 'AFIN':
-            parse_RFIN_box(box,buffer,id)
-        elif id == 'ARRF':
-            parse_RFIN_box(box,buffer,id)
-        elif id == 'LCHK':
-            parse_LCHK_box(box,buffer)
-        elif id == 'LTRF' or id == 'RTRF' or id == 'CTRF' or id == 'DTRF' or id == 'STRF':
-            parse_XTColorTrafo_box(box,buffer)
-        elif id == 'LPTS' or id == 'QPTS' or id == 'RPTS' or id == 'CPTS' or id == 'SPTS' or id == 'DPTS' or id == 'PPTS':
-            parse_XTNLT_box(box,buffer)
-        elif id == 'OCON':
-            parse_OCON_box(box,buffer)
-        elif id == 'RSPC':
-            parse_RSPC_box(box,buffer)
-        elif id == 'CURV':
-            parse_CURV_box(box,buffer)
-        elif id == 'LDCT' or id == 'RDCT':
-            parse_DCT_box(box,buffer)
-        elif id == 'MTRX':
-            parse_MTRX_box(box,buffer)
-        elif id == 'FTRX':
-            parse_FTRX_box(box,buffer)
-        elif id == 'AMUL':
-            parse_AMUL_box(box,buffer)
-        elif id == 'jxvs':
-            parse_jxvs_box(box,buffer)
-        elif id == 'jxpl':
-            parse_jxpl_box(box,buffer)
-        elif id == 'bmdm':
-            parse_bmdm_box(box,buffer)
-        elif id == 'dmon':
-            parse_dmon_box(box,buffer)
-        elif id == 'jptp':
-            parse_jptp_box(box,buffer)
-        elif id == 'jpvi':
-            parse_jpvi_box(box,buffer)
-        elif id == 'json':
-            parse_json_box(box,buffer)
-        else:
-            box.print_indent("(unknown box)")
-            box.print_hex(buffer)    
+        box.print_indent("(unknown box)")
+        box.print_body_hex()
 
 ignore_codestream = 0
 if __name__ == "__main__":
     
     # Read Arguments
-    (args, files) = getopt.getopt(sys.argv[1:], "C", "ignore-codestream")
+    (args, files) = getopt.getopt(sys.argv[1:], "Cx:c:", ["ignore-codestream", "hex-limit=", "cache="])
+    jp2utils.hex_limit = 1 << 16
+    cache = None
     for (o, a) in args:
         if o in ("-C", "--ignore-codestream"):
             ignore_codestream = 1
+        elif o in ("-x", "--hex-limit"):
+            jp2utils.hex_limit = int(a)
+        elif o in ("-c", "--cache"):
+            cache = a
 
     if len(files) != 1:
         print "Usage: [OPTIONS] %s FILE" % (sys.argv[0])
+        print "  -C        do not parse codestreams"
+        print "  -x BYTES  stop hex dumps after BYTES bytes, default 65536,"
+        print "            0 dumps everything"
+        print "  -c FILE   keep the parsed ICC profiles in the cache file FILE"
         sys.exit(1)
 
     print "###############################################################"
@@ -2322,6 +2276,8 @@ if __name__ == "__main__":
     file = open(files[0],"rb")
     type = file.read(2)
     file.seek(0)
+    if cache is not None:
+        load_icc_cache(cache)
     try:
         if ord(type[0]) == 0xff and ord(type[1]) == 0x4f:
             jp2 = jp2codestream.JP2Codestream()
@@ -2347,3 +2303,5 @@ if __name__ == "__main__":
             
     except JP2Error, e:
         print '***', str(e)
+    if cache is not None:
+        save_icc_cache(cache)
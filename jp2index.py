@@ -0,0 +1,189 @@
+#!/usr/bin/python
+
+# $Id$
+
+import sys
+import getopt
+
+from jp2utils import *
+from jp2box import *
+import jp2file
+
+class IndexedBox:
+    def __init__(self, type, offset, hdrsize, bodysize, parent, number, depth):
+        self.type     = type
+        self.offset   = offset
+        self.hdrsize  = hdrsize
+        self.bodysize = bodysize
+        self.parent   = parent
+        self.number   = number
+        self.depth    = depth
+        self.children = []
+
+    def body(self):
+        return self.offset + self.hdrsize
+
+    def end(self):
+        return self.offset + self.hdrsize + self.bodysize
+
+#
+# An index of the boxes of a file built from the box headers alone:
+# the bodies of leaf boxes are seeked over, superboxes are entered up
+# to the given depth. Boxes are then found by paths such as jp2h/colr
+# or moov/trak[2]/mdia/mdhd, where [n] selects the n-th box of this
+# type within its parent, counting from one, and no index selects all
+# of them. Only the boxes found are read and decoded.
+#
+
+class JP2BoxIndex:
+    def __init__(self, infile, maxdepth = 16):
+        self.infile   = infile
+        self.maxdepth = maxdepth
+        self.boxes    = []
+        self.top      = []
+        self.counts   = {}
+        self.errors   = []
+        self.build()
+
+    def file_size(self):
+        if isinstance(self.infile,Buffer):
+            return len(self.infile)
+        self.infile.seek(0,2)
+        return self.infile.tell()
+
+    def build(self):
+        size   = self.file_size()
+        header = JP2Box(None,self.infile)
+        stack  = [(None,size)]
+        pos    = 0
+        while len(stack) > 0:
+            parent,end = stack[-1]
+            if pos >= end:
+                stack.pop()
+                continue
+            try:
+                self.infile.seek(pos)
+                buffer = self.infile.read(16)
+                if len(buffer) < 8:
+                    raise UnexpectedEOF()
+                rest,length,id = header.parse_string_header(buffer)
+                hdrsize = len(buffer) - len(rest)
+                if length == 0:
+                    length = end - pos - hdrsize
+                if pos + hdrsize + length > end:
+                    raise InvalidBoxLength(header.boxname(id))
+            except JP2Error, e:
+                # The boxes indexed so far are kept, the rest of the
+                # parent, or of the file, is skipped
+                self.errors.append("%s at offset %d" % (str(e).strip(),pos))
+                stack.pop()
+                pos = end
+                continue
+            if parent is None:
+                siblings = self.top
+            else:
+                siblings = parent.children
+            key    = (parent,id)
+            number = self.counts.get(key,0) + 1
+            self.counts[key] = number
+            box = IndexedBox(id,pos,hdrsize,length,parent,number,len(stack) - 1)
+            self.boxes.append(box)
+            siblings.append(box)
+            if id in jp2file.superbox_names and len(stack) <= self.maxdepth:
+                stack.append((box,box.end()))
+                pos = box.body()
+            else:
+                pos = box.end()
+
+    def path(self, box):
+        names = []
+        while box is not None:
+            if self.counts[(box.parent,box.type)] > 1:
+                names.append("%s[%d]" % (box.type.rstrip(),box.number))
+            else:
+                names.append(box.type.rstrip())
+            box = box.parent
+        names.reverse()
+        return "/".join(names)
+
+    def find(self, path):
+        boxes = [None]
+        for name in path.strip("/").split("/"):
+            number = None
+            if name.endswith("]") and "[" in name:
+                name,number = name[:-1].split("[",1)
+                if not number.isdigit() or int(number) < 1:
+                    raise JP2Error("invalid box index in %s" % path)
+                number = int(number)
+            if len(name) > 4:
+                raise JP2Error("invalid box type %s in %s" % (name,path))
+            name  = name.ljust(4)
+            found = []
+            for parent in boxes:
+                if parent is None:
+                    children = self.top
+                else:
+                    children = parent.children
+                for box in children:
+                    if box.type == name and (number is None or box.number == number):
+                        found.append(box)
+            boxes = found
+        return boxes
+
+    def read(self, box):
+        self.infile.seek(box.body())
+        return self.infile.read(box.bodysize)
+
+    def parse(self, box, hook = jp2file.superbox_hook):
+        jp2 = JP2Box(None,self.infile)
+        jp2.hdrsize  = box.hdrsize
+        jp2.offset   = box.body()
+        jp2.boxsize  = box.bodysize
+        jp2.bodysize = box.bodysize
+        jp2.target   = box.end()
+        jp2.type     = box.type
+        self.infile.seek(jp2.offset)
+        jp2.new_box("\"%s\"" % box.type)
+        hook(jp2,box.type,"%d" % box.bodysize)
+        jp2.end_box()
+
+    def list(self):
+        for box in self.boxes:
+            print_indent("%-8d: %-24s header %2d body %d" % \
+                         (box.offset,self.path(box),box.hdrsize,box.bodysize),box.depth)
+
+if __name__ == "__main__":
+    # Read Arguments
+    (args, files) = getopt.getopt(sys.argv[1:], "d:C", ["depth=", "ignore-codestream"])
+    maxdepth = 16
+    for (o, a) in args:
+        if o in ("-d", "--depth"):
+            maxdepth = int(a)
+        elif o in ("-C", "--ignore-codestream"):
+            jp2file.ignore_codestream = 1
+
+    if len(files) < 1:
+        print "Usage: %s [OPTIONS] FILE [PATH ...]" % (sys.argv[0])
+        print "  -d DEPTH  do not index boxes nested deeper than DEPTH superboxes"
+        print "  -C        do not parse codestreams"
+        print "Lists the boxes of FILE, or parses the boxes found by the paths,"
+        print "e.g. jp2h/colr or moov/trak[2]/mdia/mdhd."
+        sys.exit(1)
+
+    file = open(files[0],"rb")
+    try:
+        index = JP2BoxIndex(file,maxdepth)
+        if len(files) == 1:
+            index.list()
+        for path in files[1:]:
+            boxes = index.find(path)
+            if len(boxes) == 0:
+                print "No box %s" % path
+            for box in boxes:
+                print "%s:" % index.path(box)
+                index.parse(box)
+        for error in index.errors:
+            print '***', error
+    except JP2Error, e:
+        print '***', str(e)
+    file.close()
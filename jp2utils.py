@@ -2,31 +2,52 @@
 
 # $Id: jp2utils.py,v 1.19 2016/06/01 16:18:59 thor Exp $
 
+import sys
+import struct
+import binascii
+import cStringIO
+
 class JP2Error(Exception):
     def __init__(self, reason):
         Exception.__init__(self, reason)
 
-def print_hex(buffer, indent = 0, sec_indent = -1):
+# Hex dumps stop after this many bytes, 0 dumps everything
+hex_limit = 0
+
+hex_printable = "".join([(c >= 32 and c < 127) and chr(c) or "." for c in range(256)])
+hex_line      = [" ".join(["%s%s"] * count) for count in range(17)]
+
+#
+# Print a hex dump, 16 bytes per line, formatted a block of lines at a
+# time. size is the length of the data the buffer starts, if the caller
+# only read part of it; the number of bytes not shown is printed at the
+# end.
+#
+
+def print_hex(buffer, indent = 0, sec_indent = -1, size = None):
     if sec_indent == -1:
         sec_indent = indent
-    buff = ""
-    for i in range(len(buffer)):
-        if i % 16 == 0:
-            if i != 0:
-                print "  ",buff
-                indent = sec_indent
-                buff   = ""
-            for j in range(indent):
-                print " ",
-        if ord(buffer[i]) >= 32 and ord(buffer[i]) < 127:
-            buff += buffer[i]
-        else:
-            buff += "."
-        print "%02x" % (ord(buffer[i])),
-    for j in range((16 - (len(buffer) % 16)) % 16):
-        print "  ",
-    print "  ",buff
-    
+    if size is None:
+        size = len(buffer)
+    if hex_limit > 0 and len(buffer) > hex_limit:
+        buffer = buffer[0:hex_limit]
+    if len(buffer) == 0:
+        print "  ",""
+    prefix = "  " * indent
+    for off in range(0,len(buffer),4096):
+        block  = buffer[off:off + 4096]
+        text   = block.translate(hex_printable)
+        digits = binascii.hexlify(block)
+        lines  = []
+        for i in range(0,len(block),16):
+            count = min(len(block) - i,16)
+            lines.append(prefix + hex_line[count] % tuple(digits[2 * i:2 * i + 2 * count]) + \
+                         "   " * (16 - count) + "    " + text[i:i + 16])
+            prefix = "  " * sec_indent
+        print "\n".join(lines)
+    if size > len(buffer):
+        print_indent("... %d more bytes" % (size - len(buffer)),sec_indent)
+
 def print_indent(buffer, indent = 0, nl = 1):
     for i in range(indent):
         print " ",
@@ -82,6 +103,55 @@ def ieee_double_to_float(data):
     else:
 	return 0.0
 
+# Run a parser function and return everything it printed as a string,
+# used by the worker processes that parse several images in parallel.
+
+def capture_output(function, *args):
+    saved      = sys.stdout
+    sys.stdout = cStringIO.StringIO()
+    try:
+        try:
+            function(*args)
+        except JP2Error, e:
+            print '***', str(e)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = saved
+
+# Advance a file by the given number of bytes. Seekable files are
+# positioned directly, pipes and other streams are consumed in chunks
+# of bounded size.
+
+def skip_bytes(file, length, bufsize = 1 << 16):
+    try:
+        file.seek(file.tell() + length)
+        return
+    except (AttributeError, IOError):
+        pass
+    while length > 0:
+        chunk = file.read(min(length, bufsize))
+        if len(chunk) == 0:
+            return
+        length = length - len(chunk)
+
+# Serialize an array.array in the NumPy .npy format (version 1.0), such
+# that NumPy is not required for writing it.
+
+def npy_bytes(data, shape = None):
+    if shape is None:
+        shape = (len(data),)
+    if data.itemsize == 1:
+        order = "|"
+    elif sys.byteorder == "little":
+        order = "<"
+    else:
+        order = ">"
+    kind   = {'b':'i','B':'u','h':'i','H':'u','i':'i','I':'u','l':'i','L':'u','f':'f','d':'f'}[data.typecode]
+    header = "{'descr': '%s%s%d', 'fortran_order': False, 'shape': %s, }" % \
+             (order,kind,data.itemsize,repr(tuple(shape)))
+    header = header + " " * (63 - (10 + len(header)) % 64) + "\n"
+    return "\x93NUMPY\x01\x00" + struct.pack("<H",len(header)) + header + data.tostring()
+
 # This is a fake substitution for the file class that operates on a memory
 # buffer.
 
@@ -3,11 +3,19 @@
 # $Id: jpgcodestream.py,v 1.16 2017/01/31 12:29:35 thor Exp $
 
 import sys
+import struct
+import cStringIO
+import array
+import getopt
+import itertools
+import multiprocessing
 
 from jp2utils import *
 from jpgxtbox import *
 from jp2box import *
 from jp2file import *
+from icc import *
+from tiffifd import *
 
 #
 # Some Exceptions
@@ -42,6 +50,212 @@ class MisplacedData(JP2Error):
     def __init__(self):
         JP2Error.__init__(self, 'marker expected')
 
+#
+# Reassembly of ICC profiles split over several APP2 markers
+#
+
+class ICCChunkList:
+    def __init__(self):
+        self.chunks  = dict()
+        self.count   = 0
+        self.size    = 0
+        self.profile = None
+
+    def addChunk(self,chunk,seq,count):
+        if seq == 0 or seq > count or seq in self.chunks:
+            return False
+        if self.count != 0 and count != self.count:
+            return False
+        self.count = count
+        self.chunks[seq] = chunk
+        self.size += len(chunk)
+        return True
+
+    def isComplete(self):
+        return self.count > 0 and len(self.chunks) == self.count
+
+    def missingChunks(self):
+        return [seq for seq in range(1,self.count + 1) if not seq in self.chunks]
+
+    def toProfile(self):
+        profile = bytearray(self.size)
+        offset  = 0
+        for seq in range(1,self.count + 1):
+            chunk = self.chunks[seq]
+            profile[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        self.profile = str(profile)
+        self.chunks  = dict()
+        return self.profile
+
+#
+# The MP index IFD of the Multi-Picture Format (CIPA DC-007)
+#
+
+class MPFParser(IFDParser):
+    def __init__(self,reader,indent,base):
+        IFDParser.__init__(self,reader,indent)
+        self.base    = base
+        self.entries = []
+
+    def image_type(self,attr):
+        code = attr & 0xffffff
+        if code == 0x030000:
+            return "baseline MP primary image"
+        elif code == 0x010001:
+            return "large thumbnail (VGA)"
+        elif code == 0x010002:
+            return "large thumbnail (full HD)"
+        elif code == 0x020001:
+            return "multi-frame panorama"
+        elif code == 0x020002:
+            return "multi-frame disparity"
+        elif code == 0x020003:
+            return "multi-frame multi-angle"
+        elif code == 0x000000:
+            return "undefined"
+        else:
+            return "reserved (0x%06x)" % code
+
+    def parse_tag(self,entry):
+        tag    = entry.tag
+        values = entry.values
+        if tag == 0xb000:
+            self.print_indent("MPF Version       : %s" % entry.data)
+        elif tag == 0xb001:
+            self.print_indent("Number of Images  : %d" % values[0])
+        elif tag == 0xb002:
+            fmt = ifd_endian[self.reader.endian] + "LLLHH"
+            for i in range(len(entry.data) / 16):
+                attr,size,offset,dep1,dep2 = struct.unpack_from(fmt,entry.data,16 * i)
+                if i > 0:
+                    offset += self.base
+                self.print_indent("MP Entry %d :" % i)
+                self.indent += 1
+                self.print_indent("Image Type        : %s" % self.image_type(attr))
+                self.print_indent("Image Format      : %s" % ("JPEG" if (attr >> 24) & 7 == 0 else "reserved"))
+                self.print_indent("Dependent Parent  : %d" % ((attr >> 31) & 1))
+                self.print_indent("Dependent Child   : %d" % ((attr >> 30) & 1))
+                self.print_indent("Representative    : %d" % ((attr >> 29) & 1))
+                self.print_indent("Image Size        : %d bytes" % size)
+                self.print_indent("Image Offset      : %d" % offset)
+                self.print_indent("Dependent Images  : %d %d" % (dep1,dep2))
+                self.indent -= 1
+                self.entries.append((i,offset,size))
+        elif tag == 0xb003:
+            self.print_indent("Image UID List    : %d bytes" % len(entry.data))
+        elif tag == 0xb004:
+            self.print_indent("Total Frames      : %d" % values[0])
+        else:
+            IFDParser.parse_tag(self,entry)
+
+#
+# Parse a complete JPEG image at the given file offset, this runs in a
+# worker process and returns the log as a string. Table segments that
+# repeat bytewise from image to image are only decoded once per process.
+#
+
+table_cache = dict()
+
+def parse_jpeg_image(job):
+    filename,offset,indent = job
+    file = open(filename,"rb")
+    try:
+        file.seek(offset)
+        jpg = JPGCodestream(indent)
+        if len(table_cache) > 256:
+            table_cache.clear()
+        jpg.tables = table_cache
+        return capture_output(jpg.stream_parse,file,offset)
+    finally:
+        file.close()
+
+def parse_jpeg_images(jobs,processes = None):
+    if processes == 1 or len(jobs) <= 1:
+        for log in itertools.imap(parse_jpeg_image,jobs):
+            yield log
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for log in pool.imap(parse_jpeg_image,jobs,16):
+            yield log
+    finally:
+        pool.close()
+        pool.join()
+
+#
+# Locate the frames of a Motion-JPEG stream, i.e. JPEG images written
+# back to back. A frame ends where an EOI is directly followed by the
+# SOI of the next frame, or at the last EOI of the file. Returns the
+# offsets and lengths of the frames as two arrays. The index file holds
+# the frame count, the offsets and the lengths as little-endian 64 bit
+# values.
+#
+
+def index_frames(file,blocksize = 1 << 20):
+    offsets = array.array('L')
+    lengths = array.array('L')
+    data    = ""
+    pos     = 0
+    start   = -1
+    last    = -1
+    eof     = False
+    file.seek(0)
+    while not eof:
+        block = file.read(blocksize)
+        eof   = len(block) == 0
+        data  = data + block
+        i     = 0
+        if start < 0:
+            i = data.find("\xff\xd8")
+            if i >= 0:
+                start = pos + i
+        if start >= 0:
+            while True:
+                j = data.find("\xff\xd9\xff\xd8",i)
+                if j < 0:
+                    break
+                offsets.append(start)
+                lengths.append(pos + j + 2 - start)
+                start = pos + j + 2
+                i     = j + 2
+            j = data.rfind("\xff\xd9",max(start - pos,0))
+            if j >= 0:
+                last = max(last,pos + j + 2)
+            if eof:
+                if last > start:
+                    end = last
+                else:
+                    end = pos + len(data)
+                offsets.append(start)
+                lengths.append(end - start)
+        keep = data[-3:]
+        pos  = pos + len(data) - len(keep)
+        data = keep
+    return offsets,lengths
+
+def write_frame_index(filename,offsets,lengths):
+    file = open(filename,"wb")
+    try:
+        file.write(struct.pack("<Q",len(offsets)))
+        for values in (offsets,lengths):
+            file.write(struct.pack("<%dQ" % len(values),*values))
+    finally:
+        file.close()
+
+def parse_frames(filename,offsets,lengths,processes = None):
+    jobs = itertools.izip(itertools.repeat(filename),offsets,itertools.repeat(1))
+    logs = parse_jpeg_images(list(jobs),processes)
+    for frame,log in enumerate(logs):
+        print
+        print "Frame %d at offset %d, %d bytes:" % (frame,offsets[frame],lengths[frame])
+        print
+        sys.stdout.write(log)
+    print
+    print "Frames    : %d" % len(offsets)
+    if len(offsets) > 0:
+        print "Avg. Size : %d bytes" % (sum(lengths) / len(lengths))
+
 #
 # The Codestream Class
 #
@@ -57,6 +271,10 @@ class JPGCodestream:
         self.c0        = 0
         self.c1        = 0
         self.boxlist   = BoxList()
+        self.icclist   = ICCChunkList()
+        self.icc_profile = None
+        self.mpentries = []
+        self.tables    = None
         if hook == None:
             self.superhook = superbox_hook
         else:
@@ -92,7 +310,7 @@ class JPGCodestream:
 
     def load_marker(self, file, marker):
         mrk    = ordw(marker)
-        if (mrk >= 0xffd0 and mrk <= 0xffd9):
+        if (mrk >= 0xffd0 and mrk <= 0xffd9) or mrk == 0xff01:
             self.buffer = marker
         elif mrk >= 0xffc0 or mrk == 0xffb1 or mrk == 0xffb2 or mrk == 0xffb3 or mrk == 0xffb9 or mrk == 0xffba or mrk == 0xffbb:
             size   = file.read(2)
@@ -122,8 +340,30 @@ class JPGCodestream:
             self.load_marker(file,marker)
             self.offset = self.offset + len(self.buffer)
 
+    def parse_cached(self, name, description, decode):
+        self.new_marker(name, description)
+        if self.tables is None:
+            decode()
+        else:
+            key = (self.indent, self.buffer)
+            if not self.tables.has_key(key):
+                saved      = sys.stdout
+                sys.stdout = cStringIO.StringIO()
+                try:
+                    decode()
+                    self.tables[key] = sys.stdout.getvalue()
+                finally:
+                    log        = sys.stdout.getvalue()
+                    sys.stdout = saved
+                    if not self.tables.has_key(key):
+                        sys.stdout.write(log)
+            sys.stdout.write(self.tables[key])
+        self.end_marker()
+
     def parse_DQT(self):
-        self.new_marker("DQT", "Define quantization table")
+        self.parse_cached("DQT", "Define quantization table", self.decode_DQT)
+
+    def decode_DQT(self):
         self.pos = 4
         while self.pos < len(self.buffer):
             tq = ord(self.buffer[self.pos:self.pos + 1])
@@ -162,7 +402,6 @@ class JPGCodestream:
                 for x in range(8):
                     line = "%s %5d" % (line,q[scanorder[x + y * 8]])
                 self.print_indent(line)
-        self.end_marker()
 
     def parse_DAC(self):
         self.new_marker("DAC", "Define arithmetic coding conditioning")
@@ -188,7 +427,9 @@ class JPGCodestream:
         self.end_marker()
         
     def parse_DHT(self):
-        self.new_marker("DHT", "Define huffman table")
+        self.parse_cached("DHT", "Define huffman table", self.decode_DHT)
+
+    def decode_DHT(self):
         self.pos = 4
         while self.pos < len(self.buffer):
             tc = ord(self.buffer[self.pos:self.pos+1])
@@ -213,7 +454,6 @@ class JPGCodestream:
                 if ln[i] > 0:
                     self.print_indent("%d symbols of size %2d        : %s" % (len(v),i+1,str(v)))
             print
-        self.end_marker()
 
     def parse_scan(self,file):
         self.new_marker("SOS", "Start of Scan")
@@ -321,12 +561,92 @@ class JPGCodestream:
             if self.boxlist.isComplete(segment):
                 box=self.boxlist.toBox(segment,self.indent + 1)
                 box.parse(self.superhook)
+        elif idx == 1 and self.buffer[4:10] == "Exif\0\0":
+            self.new_marker("APP1","EXIF Marker")
+            self.parse_Exif()
+        elif idx == 2 and self.buffer[4:8] == "MPF\0":
+            self.new_marker("APP2","Multi-Picture Format Marker")
+            self.parse_MPF()
+        elif idx == 2 and self.buffer[4:16] == "ICC_PROFILE\0":
+            self.new_marker("APP2","ICC Profile Marker")
+            self.parse_ICC()
         else:
             self.new_marker(("APP%x" % idx),("Application marker #%d" % idx))
             if len(self.buffer) < 256:
                 print_hex(self.buffer)
         self.end_marker()
         
+    def parse_Exif(self):
+        order = self.buffer[10:12]
+        if order == "II":
+            endian = 0
+        elif order == "MM":
+            endian = 1
+        else:
+            raise InvalidMarkerField("APP1","TIFF byte order")
+        reader = IFDReader(memoryview(self.buffer)[10:],endian,self.markerpos + 10)
+        if reader.read_short(2) != 42:
+            raise InvalidMarkerField("APP1","TIFF identifier")
+        parser  = IFDParser(reader,self.indent + 1)
+        offset  = reader.read_long(4)
+        visited = []
+        while offset != 0 and not offset in visited:
+            self.print_indent("IFD%d at offset      : 0x%04lx" % (len(visited),offset))
+            visited.append(offset)
+            offset = parser.parse_ifd(offset)
+
+    def parse_MPF(self):
+        order = self.buffer[8:10]
+        if order == "II":
+            endian = 0
+        elif order == "MM":
+            endian = 1
+        else:
+            raise InvalidMarkerField("APP2","MPF byte order")
+        reader = IFDReader(memoryview(self.buffer)[8:],endian,self.markerpos + 8)
+        if reader.read_short(2) != 42:
+            raise InvalidMarkerField("APP2","MPF identifier")
+        parser = MPFParser(reader,self.indent + 1,self.markerpos + 8)
+        offset = reader.read_long(4)
+        self.print_indent("MP Index IFD at offset : 0x%04lx" % offset)
+        parser.parse_ifd(offset)
+        if len(self.mpentries) == 0:
+            self.mpentries = parser.entries
+
+    def parse_sub_images(self,filename,processes = None):
+        jobs    = []
+        for idx,offset,size in self.mpentries:
+            if idx > 0:
+                jobs.append((filename,offset,self.indent + 1))
+        results = dict(zip([entry[0] for entry in self.mpentries if entry[0] > 0],
+                           parse_jpeg_images(jobs,processes)))
+        for idx,offset,size in self.mpentries:
+            if idx > 0:
+                print
+                self.print_indent("MP Entry %d, image at offset %d, %d bytes:" % (idx,offset,size))
+                print
+                sys.stdout.write(results[idx])
+
+    def parse_ICC(self):
+        if len(self.buffer) < 18:
+            raise InvalidSizedMarker("APP2")
+        seq   = ord(self.buffer[16:17])
+        count = ord(self.buffer[17:18])
+        self.print_indent("Chunk number        : %d" % seq)
+        self.print_indent("Total chunks        : %d" % count)
+        self.print_indent("Chunk size          : %d bytes" % (len(self.buffer) - 18))
+        if self.icclist.profile != None or not self.icclist.addChunk(memoryview(self.buffer)[18:],seq,count):
+            self.print_indent("Invalid or duplicate ICC chunk, ignored")
+        elif self.icclist.isComplete():
+            self.icc_profile = self.icclist.toProfile()
+            self.print_indent("ICC Colour Profile:")
+            parse_icc(self.indent,self.icc_profile)
+
+    def check_ICC(self):
+        if self.icclist.count > 0 and self.icclist.profile == None:
+            missing = ", ".join(["%d" % seq for seq in self.icclist.missingChunks()])
+            self.print_indent("ICC profile incomplete, missing chunks : %s" % missing)
+
     def parse_COM(self):
         self.new_marker("COM","Comment marker")
         if len(self.buffer) < 256:
@@ -441,6 +761,7 @@ class JPGCodestream:
 
         self.new_marker("EOI","End of image")
         self.end_marker()
+        self.check_ICC()
         oh = self.bytecount - self.datacount
         checksum = self.c0 + 256 * self.c1
         self.print_indent("Checksum  : 0x%04x" % checksum)
@@ -496,8 +817,24 @@ class JPGCodestream:
 
 if __name__ == "__main__":
     # Read Arguments
-    if len(sys.argv) != 2:
-        print "Usage: %s FILE" % (sys.argv[0])
+    (args, files) = getopt.getopt(sys.argv[1:], "j:si:c:", ["jobs=", "sequence", "index=", "cache="])
+    processes = None
+    sequence  = False
+    indexfile = None
+    cache     = None
+    for (o, a) in args:
+        if o in ("-j", "--jobs"):
+            processes = int(a)
+        elif o in ("-s", "--sequence"):
+            sequence  = True
+        elif o in ("-i", "--index"):
+            sequence  = True
+            indexfile = a
+        elif o in ("-c", "--cache"):
+            cache     = a
+
+    if len(files) != 1:
+        print "Usage: %s [OPTIONS] FILE" % (sys.argv[0])
         sys.exit(1)
 
     print "###############################################################"
@@ -506,10 +843,21 @@ if __name__ == "__main__":
     print
 
     # Parse Files
-    filename  = sys.argv[1]
+    filename  = files[0]
     file = open(filename,"rb")
     jpg  = JPGCodestream()
+    if cache is not None:
+        load_icc_cache(cache)
     try:
-        jpg.stream_parse(file,0)        
+        if sequence:
+            offsets,lengths = index_frames(file)
+            if indexfile:
+                write_frame_index(indexfile,offsets,lengths)
+            parse_frames(filename,offsets,lengths,processes)
+        else:
+            jpg.stream_parse(file,0)        
+            jpg.parse_sub_images(filename,processes)
     except JP2Error, e:
         print '***', str(e)
+    if cache is not None:
+        save_icc_cache(cache)
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+
+# $Id$
+
+import sys
+import getopt
+import shutil
+import os
+import tempfile
+
+from jp2utils import *
+from jpgcodestream import *
+
+#
+# Rewriting of the APPn and COM markers of a JPEG file. Everything
+# up to the first SOS marker is copied marker by marker, including
+# fill bytes, such that the output is bytewise identical to the input
+# except for the segments a rule applies to. The entropy coded data
+# and anything behind it are copied in large blocks without looking
+# at them. A replace rule replaces the first segment it matches and
+# drops all others, e.g. the further chunks of an ICC profile.
+#
+
+class Rule:
+    def __init__(self, marker, prefix, action, data = None):
+        self.marker = marker
+        self.prefix = prefix
+        self.action = action
+        self.data   = data
+
+    def matches(self, marker, payload):
+        return marker == self.marker and payload.startswith(self.prefix)
+
+def parse_marker_name(name):
+    if name == "COM":
+        return 0xfffe
+    elif name.startswith("APP") and name[3:].isdigit() and int(name[3:]) < 16:
+        return 0xffe0 + int(name[3:])
+    elif name.startswith("0x"):
+        return int(name,16)
+    raise JP2Error("unknown marker %s" % name)
+
+def parse_rule(spec, action):
+    data = None
+    if action == "replace":
+        spec,filename = spec.split("=",1)
+        file = open(filename,"rb")
+        data = file.read()
+        file.close()
+    if ":" in spec:
+        name,prefix = spec.split(":",1)
+    else:
+        name,prefix = spec,""
+    return Rule(parse_marker_name(name),prefix,action,data)
+
+class JPGRewriter:
+    def __init__(self, rules, dropall = False, blocksize = 1 << 20):
+        self.rules     = rules
+        self.dropall   = dropall
+        self.blocksize = blocksize
+        self.log       = []
+
+    def action(self, marker, payload):
+        for rule in self.rules:
+            if rule.matches(marker,payload):
+                return rule
+        if self.dropall and (marker == 0xfffe or (marker >= 0xffe0 and marker <= 0xffef)):
+            return Rule(marker,"","drop")
+        return None
+
+    def describe(self, marker, payload):
+        if marker == 0xfffe:
+            name = "COM"
+        else:
+            name = "APP%d" % (marker - 0xffe0)
+        ident = payload[:32].split("\0",1)[0]
+        if ident != "" and len(ident) < 32 and min(map(ord,ident)) >= 32 and max(map(ord,ident)) < 127:
+            return "%s (%s)" % (name,ident)
+        return name
+
+    def rewrite(self, infile, outfile):
+        jpg = JPGCodestream()
+        jpg.load_buffer(infile)
+        if len(jpg.buffer) != 2 or ordw(jpg.buffer) != 0xffd8:
+            raise RequiredMarkerMissing("d8")
+        outfile.write(jpg.buffer)
+        replaced = []
+        while True:
+            start = jpg.offset
+            jpg.load_buffer(infile)
+            if len(jpg.buffer) == 0:
+                raise UnexpectedEOC()
+            fill   = "\xff" * (jpg.markerpos - start)
+            marker = ordw(jpg.buffer)
+            pos    = jpg.markerpos
+            rule   = None
+            if marker == 0xfffe or (marker >= 0xffe0 and marker <= 0xffef):
+                rule = self.action(marker,jpg.buffer[4:])
+            if rule is None or rule.action == "keep":
+                outfile.write(fill + jpg.buffer)
+            elif rule.action == "drop" or rule in replaced:
+                self.log.append("Dropped  %-24s at %-8d: %d bytes" % \
+                                (self.describe(marker,jpg.buffer[4:]),pos,len(jpg.buffer)))
+            elif rule.action == "replace":
+                if len(rule.data) + 2 > 0xffff:
+                    raise InvalidSizedMarker("%04x" % marker)
+                outfile.write(fill + jpg.buffer[0:2] + chr((len(rule.data) + 2) >> 8) + \
+                              chr((len(rule.data) + 2) & 0xff) + rule.data)
+                self.log.append("Replaced %-24s at %-8d: %d -> %d bytes" % \
+                                (self.describe(marker,jpg.buffer[4:]),pos,len(jpg.buffer),len(rule.data) + 4))
+                replaced.append(rule)
+            if marker == 0xffd9:
+                return
+            if marker == 0xffda:
+                break
+        shutil.copyfileobj(infile,outfile,self.blocksize)
+
+if __name__ == "__main__":
+    # Read Arguments
+    (args, files) = getopt.getopt(sys.argv[1:], "d:k:r:a", ["drop=", "keep=", "replace=", "all"])
+    rules   = []
+    dropall = False
+    for (o, a) in args:
+        if o in ("-d", "--drop"):
+            rules.append(parse_rule(a,"drop"))
+        elif o in ("-k", "--keep"):
+            rules.append(parse_rule(a,"keep"))
+        elif o in ("-r", "--replace"):
+            rules.append(parse_rule(a,"replace"))
+        elif o in ("-a", "--all"):
+            dropall = True
+
+    if len(files) != 2:
+        print "Usage: %s [OPTIONS] INFILE OUTFILE" % (sys.argv[0])
+        print "  -d MARKER[:ID]        drop the matching APPn/COM markers"
+        print "  -k MARKER[:ID]        keep the matching APPn/COM markers"
+        print "  -r MARKER[:ID]=FILE   replace the payload of the matching markers"
+        print "  -a                    drop all APPn/COM markers not kept otherwise"
+        print "MARKER is APP0..APP15 or COM, ID a prefix of the marker payload,"
+        print "e.g. APP1:Exif or APP2:ICC_PROFILE. The first matching rule applies."
+        sys.exit(1)
+
+    # The output is written next to the target and renamed when complete
+    infile  = open(files[0],"rb")
+    fd,temp = tempfile.mkstemp(".tmp",os.path.basename(files[1]) + ".",
+                               os.path.dirname(os.path.abspath(files[1])))
+    outfile = os.fdopen(fd,"wb")
+    umask   = os.umask(0)
+    os.umask(umask)
+    os.chmod(temp,0666 & ~umask)
+    rewriter = JPGRewriter(rules,dropall)
+    done     = False
+    try:
+        try:
+            rewriter.rewrite(infile,outfile)
+            done = True
+        except JP2Error, e:
+            print '***', str(e)
+    finally:
+        infile.close()
+        outfile.close()
+        if done:
+            os.rename(temp,files[1])
+        else:
+            os.remove(temp)
+    for line in rewriter.log:
+        print line
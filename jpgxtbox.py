@@ -2,7 +2,7 @@
 # $Id: jpgxtbox.py,v 1.3 2016/06/01 16:18:59 thor Exp $
 
 import sys
-import StringIO
+import cStringIO
 
 from jp2utils import *
 from jp2box import *
@@ -50,30 +50,25 @@ class BoxIndex:
 class BoxList:
     def __init__(self):
         self.boxlist=dict()
+        self.boxsize=dict()
+        self.total=dict()
 
     def addBoxSegment(self,segment):
         index=BoxIndex(segment.type,segment.en)
         if not index in self.boxlist:
             self.boxlist[index] = list()
+            self.boxsize[index] = segment.body
+            self.total[index]   = 0
+        elif self.boxsize[index] != segment.body:
+            raise BoxSizesInconsistent()
         self.boxlist[index].append(segment)
+        self.total[index] += len(segment.buffer)
 
     def isComplete(self,segment):
         index=BoxIndex(segment.type,segment.en)
         if not index in self.boxlist:
             return False
-        else:
-            total=0
-            boxsize=None
-            for segment in self.boxlist[index]:
-                total = total+len(segment.buffer)
-                if boxsize == None:
-                    boxsize = segment.body
-                else:
-                    if boxsize != segment.body:
-                        raise BoxSizesInconsistent()
-            if boxsize != None and boxsize == total:
-                return True
-        return False
+        return self.boxsize[index] == self.total[index]
 
     def toBox(self,segment,indent):
         index=BoxIndex(segment.type,segment.en)
@@ -81,20 +76,19 @@ class BoxList:
             return None
         else:
             if segment.lbox > 0xffffffff:
-                buffer=chrl(1)+segment.type+chrq(segment.lbox)
+                header=chrl(1)+segment.type+chrq(segment.lbox)
             else:
-                buffer=chrl(segment.lbox)+segment.type
-            sortedlist=sorted(self.boxlist[index])
-            offset=sortedlist[0].offset
-            for seg in sortedlist:
-                buffer=buffer+seg.buffer
-            stringstream=StringIO.StringIO(buffer)
+                header=chrl(segment.lbox)+segment.type
+            buffer=bytearray(len(header)+self.total[index])
+            buffer[0:len(header)]=header
+            offset=len(header)
+            for seg in sorted(self.boxlist[index]):
+                buffer[offset:offset+len(seg.buffer)]=seg.buffer
+                offset=offset+len(seg.buffer)
+            del self.boxlist[index]
+            del self.boxsize[index]
+            del self.total[index]
+            stringstream=cStringIO.StringIO(str(buffer))
             box=JP2Box(None,stringstream)
             box.indent = indent
             return box
-
-        
-
-
-
-    
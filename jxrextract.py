@@ -0,0 +1,234 @@
+#!/usr/bin/python
+
+# $Id$
+
+import sys
+import getopt
+import struct
+import cStringIO
+import os
+import tempfile
+
+from jp2utils import *
+from tiffifd import *
+from jxrfile import *
+
+band_names = ["DC","LP","HP","FlexBits"]
+
+def encode_vlw_esc(value):
+    if value < 0xfb00:
+        return chr(value >> 8) + chr(value & 0xff)
+    elif value < (1 << 32):
+        return "\xfb" + struct.pack(">L",value)
+    return "\xfc" + struct.pack(">Q",value)
+
+def parse_band_count(spec):
+    if spec.isdigit() and int(spec) >= 1 and int(spec) <= 4:
+        return int(spec)
+    for i in range(len(band_names)):
+        if spec.lower() == band_names[i].lower():
+            return i + 1
+    raise JP2Error("unknown band %s" % spec)
+
+#
+# Extraction of the first bands of a frequency mode JPEG XR codestream.
+# The image plane headers lose the quantizers of the dropped bands,
+# the index table is rebuilt for the remaining entries and the band
+# payloads are copied byte by byte in their original order. The JXR
+# file format is supported if the IFD and its values are in front of
+# the image data, as usual; the codestreams are then written behind
+# them and the IFD entries describing them are patched in place.
+#
+
+class JXRBandExtractor:
+    def __init__(self, bands, blocksize = 1 << 20):
+        self.bands     = bands
+        self.blocksize = blocksize
+        self.log       = []
+
+    def copy(self, infile, outfile, offset, length):
+        infile.seek(offset)
+        while length > 0:
+            data = infile.read(min(length,self.blocksize))
+            if data == "":
+                raise JP2Error("unexpected end of file")
+            outfile.write(data)
+            length -= len(data)
+
+    def rewrite_plane(self, infile, plane):
+        start,lpbit,hpbit,end = plane
+        infile.seek(start)
+        data  = infile.read(end - start)
+        flags = ord(data[0])
+        bands = 4 - (flags & 0x0f)
+        if self.bands >= bands:
+            return data
+        if self.bands == 1:
+            cut = lpbit
+        elif self.bands == 2:
+            cut = hpbit
+        else:
+            cut = None
+        if cut is not None:
+            bits  = cut - (start << 3)
+            size  = (bits + 7) >> 3
+            value = int(data[:size].encode("hex"),16) & ~((1 << ((size << 3) - bits)) - 1)
+            data  = ("%0*x" % (size << 1,value)).decode("hex")
+        return chr((flags & 0xf0) | (4 - self.bands)) + data[1:]
+
+    def extract_codestream(self, infile, outfile, start, size):
+        infile.seek(start)
+        jxrc   = JXRCodestream(infile,0,size)
+        saved  = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        try:
+            jxrc.parse_headers()
+        finally:
+            sys.stdout = saved
+        if not jxrc.frequency_mode:
+            raise JP2Error("bands can only be dropped from frequency mode codestreams")
+        if not jxrc.index_table_present:
+            raise JP2Error("the codestream has no index table")
+        if self.bands > jxrc.num_bands:
+            raise JP2Error("the codestream has only %d bands" % jxrc.num_bands)
+        if self.bands == 1 and jxrc.dc_variable and jxrc.num_bands > 1:
+            raise JP2Error("the DC tile headers depend on the band count, DC cannot be extracted alone")
+        sizes = jxrc.entry_sizes()
+        kept  = []
+        for tile in range(jxrc.num_tiles):
+            for band in range(self.bands):
+                entry = tile * jxrc.num_bands + band
+                if sizes[entry] is None:
+                    raise JP2Error("the size of the last band is unknown")
+                kept.append(entry)
+        kept.sort(key = jxrc.tile_offsets.__getitem__)
+        offsets = {}
+        offset  = 0
+        for entry in kept:
+            offsets[entry] = offset
+            offset += sizes[entry]
+        header = cStringIO.StringIO()
+        infile.seek(start)
+        header.write(infile.read(jxrc.planes[0][0] - start))
+        for plane in jxrc.planes:
+            header.write(self.rewrite_plane(infile,plane))
+        infile.seek(jxrc.table_pos)
+        header.write(infile.read(2))
+        for tile in range(jxrc.num_tiles):
+            for band in range(self.bands):
+                header.write(encode_vlw_esc(offsets[tile * jxrc.num_bands + band]))
+        infile.seek(jxrc.subseq_pos)
+        header.write(infile.read(jxrc.base - jxrc.subseq_pos))
+        header = header.getvalue()
+        outfile.write(header)
+        for entry in kept:
+            self.copy(infile,outfile,jxrc.base + jxrc.tile_offsets[entry],sizes[entry])
+        self.log.append("Kept %s of %d bands in %d tiles: %d -> %d bytes" % \
+                        ("+".join(band_names[:self.bands]),jxrc.num_bands,jxrc.num_tiles,
+                         size,len(header) + offset))
+        return len(header) + offset
+
+    def patch_entry(self, header, entry, endian, value):
+        if entry.count != 1:
+            raise JP2Error("IFD entry 0x%04x has %d values" % (entry.tag,entry.count))
+        pos = entry.offset + 8
+        if entry.type == 1:
+            header[pos] = value
+        elif entry.type == 3:
+            header[pos:pos + 2] = ifd_short[endian].pack(value)
+        elif entry.type == 4:
+            header[pos:pos + 4] = ifd_long[endian].pack(value)
+        else:
+            raise JP2Error("IFD entry 0x%04x has an unexpected type" % entry.tag)
+
+    def extract_file(self, infile, outfile, endian):
+        reader = IFDFileReader(infile,endian)
+        ifdoffset = reader.read_long(4)
+        entries,next = reader.read_ifd(ifdoffset)
+        tags = {}
+        for entry in entries:
+            tags[entry.tag] = entry
+        if not 0xbcc0 in tags or not 0xbcc1 in tags:
+            raise JP2Error("the image data is not located by the IFD")
+        streams = [(tags[0xbcc0].values[0],tags[0xbcc1].values[0],0xbcc0,0xbcc1)]
+        if 0xbcc2 in tags and 0xbcc3 in tags and tags[0xbcc2].values[0] != 0:
+            streams.append((tags[0xbcc2].values[0],tags[0xbcc3].values[0],0xbcc2,0xbcc3))
+        streams.sort()
+        first = streams[0][0]
+        if ifdoffset + 6 + 12 * len(entries) > first or next != 0:
+            raise JP2Error("the IFD must be the only one and precede the image data")
+        for entry in entries:
+            if entry.voffset != NotImplemented and entry.voffset + len(entry.data) > first:
+                raise JP2Error("the value of IFD entry 0x%04x is behind the image data" % entry.tag)
+        infile.seek(0)
+        header = bytearray(infile.read(first))
+        outfile.write(header)
+        offset = first
+        for start,size,otag,stag in streams:
+            length = self.extract_codestream(infile,outfile,start,size)
+            self.patch_entry(header,tags[otag],endian,offset)
+            self.patch_entry(header,tags[stag],endian,length)
+            offset += length
+        for tag in (0xbcc4,0xbcc5):
+            if tag in tags:
+                self.patch_entry(header,tags[tag],endian,max(tags[tag].values[0],4 - self.bands))
+        outfile.seek(0)
+        outfile.write(header)
+
+    def extract(self, infile, outfile):
+        type = infile.read(2)
+        if type == "WM":
+            infile.seek(0,2)
+            size = infile.tell()
+            self.extract_codestream(infile,outfile,0,size)
+        elif type == "II":
+            self.extract_file(infile,outfile,0)
+        elif type == "MM":
+            self.extract_file(infile,outfile,1)
+        else:
+            raise JP2Error("input file is neither a JXR codestream nor a JXR file")
+
+if __name__ == "__main__":
+    # Read Arguments
+    (args, files) = getopt.getopt(sys.argv[1:], "b:", ["bands="])
+    bands = 2
+    try:
+        for (o, a) in args:
+            if o in ("-b", "--bands"):
+                bands = parse_band_count(a)
+    except JP2Error, e:
+        print '***', str(e)
+        sys.exit(1)
+
+    if len(files) != 2:
+        print "Usage: %s [OPTIONS] INFILE OUTFILE" % (sys.argv[0])
+        print "  -b BAND   keep all bands up to and including BAND, which is"
+        print "            DC, LP, HP or FlexBits or their count 1..4, default LP"
+        sys.exit(1)
+
+    # The output is written to a temporary file next to OUTFILE and
+    # renamed once complete, a failed extraction leaves no output behind
+    infile  = open(files[0],"rb")
+    fd,temp = tempfile.mkstemp(".tmp",os.path.basename(files[1]) + ".",
+                               os.path.dirname(os.path.abspath(files[1])))
+    outfile = os.fdopen(fd,"wb")
+    umask   = os.umask(0)
+    os.umask(umask)
+    os.chmod(temp,0666 & ~umask)
+    extractor = JXRBandExtractor(bands)
+    done      = False
+    try:
+        try:
+            extractor.extract(infile,outfile)
+            done = True
+        except JP2Error, e:
+            print '***', str(e)
+    finally:
+        infile.close()
+        outfile.close()
+        if done:
+            os.rename(temp,files[1])
+        else:
+            os.remove(temp)
+    for line in extractor.log:
+        print line
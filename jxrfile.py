@@ -4,8 +4,12 @@
 
 import getopt
 import sys
+import bisect
+import cStringIO
+import multiprocessing
 from jp2utils import *
 from icc import *
+from tiffifd import *
 
 def lordw(buffer):
     return (ord(buffer[1]) << 8) + \
@@ -27,9 +31,51 @@ def lordq(buffer):
            (ord(buffer[1]) <<  8) + \
            (ord(buffer[0]) <<  0)
 
+#
+# A read-only file on top of ranges prefetched from another file. Reads
+# inside a range are served from memory, all others from the file.
+#
+
+class RangeFile:
+    def __init__(self,file,ranges):
+        self.infile = file
+        self.ranges = ranges
+        self.starts = [start for start,data in ranges]
+        self.pos    = 0
+
+    def seek(self,pos):
+        self.pos = pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self,length):
+        idx = bisect.bisect_right(self.starts,self.pos) - 1
+        if idx >= 0:
+            start,data = self.ranges[idx]
+            if self.pos + length <= start + len(data):
+                self.pos += length
+                return data[self.pos - length - start:self.pos - start]
+        self.infile.seek(self.pos)
+        data = self.infile.read(length)
+        self.pos += len(data)
+        return data
+
 class JXRCodestream:
-    def __init__(self,file,indent):
+    def __init__(self,file,indent,size = None,blocksize = 4096):
         self.infile = file
+        self.start = file.tell()
+        self.size = size
+        self.sizes = None
+        self.num_tiles = 0
+        self.base = 0
+        self.planes = []
+        self.table_pos = None
+        self.subseq_pos = None
+        self.blocksize = blocksize
+        self.blockpos = self.start
+        self.block = ""
+        self.blockidx = 0
         self.indent = indent
         self.alpha_present = False
         self.index_table_present = False
@@ -46,36 +92,88 @@ class JXRCodestream:
         self.hp_variable = False
         self.num_components = 0
 
+    # The bit reader works on a prefetched block of the file and keeps
+    # up to 64 bits in an accumulator, refilled several bytes at once.
+    # tell() reports the first byte none of whose bits were consumed.
+    def prefetch(self,count):
+        if self.blockidx + count > len(self.block):
+            self.infile.seek(self.blockpos + len(self.block))
+            self.blockpos += self.blockidx
+            self.block    = self.block[self.blockidx:] + self.infile.read(max(count,self.blocksize))
+            self.blockidx = 0
+
+    def fill_bits(self):
+        count = (64 - self.bitpos) >> 3
+        self.prefetch(count)
+        data = self.block[self.blockidx:self.blockidx + count]
+        if data != "":
+            self.bitbuffer = (self.bitbuffer << (len(data) << 3)) | int(data.encode("hex"),16)
+            self.bitpos   += len(data) << 3
+            self.blockidx += len(data)
+
     def get_bits(self,bits):
-        result = 0
-        while bits > 0:
-            avail = self.bitpos
-            if avail == 0:
-                self.bitbuffer = ord(self.infile.read(1))
-                self.bitpos    = 8
-                avail          = 8
-            if avail > bits:
-                avail = bits
-            result = (result << avail) | ((self.bitbuffer >> (self.bitpos - avail)) & ((1 << avail) - 1))
-            bits  -= avail
-            self.bitpos -= avail
+        if bits > self.bitpos:
+            self.fill_bits()
+            if bits > self.bitpos:
+                raise JP2Error("unexpected end of codestream")
+        self.bitpos   -= bits
+        result         = self.bitbuffer >> self.bitpos
+        self.bitbuffer &= (1 << self.bitpos) - 1
         return result
 
     def align_to_byte(self):
-        self.bitpos = 0
-        
+        self.bitpos    &= ~7
+        self.bitbuffer &= (1 << self.bitpos) - 1
+
+    def read_bytes(self,count):
+        self.align_to_byte()
+        size = count
+        data = ""
+        if self.bitpos > 0:
+            avail = min(count,self.bitpos >> 3)
+            self.bitpos -= avail << 3
+            data = ("%0*x" % (avail << 1,self.bitbuffer >> self.bitpos)).decode("hex")
+            self.bitbuffer &= (1 << self.bitpos) - 1
+            count -= avail
+        if count > 0:
+            self.prefetch(count)
+        data += self.block[self.blockidx:self.blockidx + count]
+        self.blockidx += count
+        if len(data) < size:
+            raise JP2Error("unexpected end of codestream")
+        return data
+
+    def read_byte(self):
+        return ord(self.read_bytes(1))
+
+    def tell(self):
+        return self.blockpos + self.blockidx - (self.bitpos >> 3)
+
+    def bit_tell(self):
+        return ((self.blockpos + self.blockidx) << 3) - self.bitpos
+
+    def seek(self,pos):
+        self.bitpos    = 0
+        self.bitbuffer = 0
+        if pos >= self.blockpos and pos <= self.blockpos + len(self.block):
+            self.blockidx = pos - self.blockpos
+        else:
+            self.blockpos = pos
+            self.block    = ""
+            self.blockidx = 0
+
     def print_indent(self, buffer, nl = 1):
         print_indent(buffer, self.indent, nl)
 
     def print_position(self):
-        print "%i:" % self.infile.tell()
+        print "%i:" % self.tell()
             
     def parse_image_header(self):
         self.print_indent("Image Header Contents:")
         self.indent += 1
-        gdi=self.infile.read(8)
+        gdi=self.read_bytes(8)
         self.print_indent("GDI Signature     : %s" % gdi[0:7])
-        flags=ord(self.infile.read(1))
+        flags=self.read_byte()
         self.print_indent("Reserved B        : 0x%01x" % (flags >> 4))
         if flags & 0x08 != 0:
             hard_tiling="Enabled"
@@ -83,7 +181,7 @@ class JXRCodestream:
             hard_tiling="Disabled"
         self.print_indent("Hard Tiling       : %s" % hard_tiling)
         self.print_indent("Reserved C        : 0x%01x" % (flags & 0x07))
-        flags=ord(self.infile.read(1))
+        flags=self.read_byte()
         if flags & 0x80 != 0:
             tiling="Enabled"
             tiles=True
@@ -115,7 +213,7 @@ class JXRCodestream:
             idx="No"
         self.print_indent("Index Table       : %s" % idx)
         self.print_indent("Overlap Mode      : %d" % (flags & 0x03))
-        flags = ord(self.infile.read(1))
+        flags = self.read_byte()
         if flags & 0x80 != 0:
             shdr = "Short Headers"
             short = True
@@ -158,7 +256,7 @@ class JXRCodestream:
         else:
             alpha="Not Present"
         self.print_indent("Alpha Plane       : %s" % alpha)
-        flags = ord(self.infile.read(1))
+        flags = self.read_byte()
         color = (flags >> 4)
         bits  = flags & 0x0f
         self.output_bitdepth = bits
@@ -211,17 +309,17 @@ class JXRCodestream:
             bmode = "Reserved (%d)" % bits
         self.print_indent("Bit Depths        : %s" % bmode)
         if short:
-            width  = ordw(self.infile.read(2)) + 1
-            height = ordw(self.infile.read(2)) + 1
+            width  = ordw(self.read_bytes(2)) + 1
+            height = ordw(self.read_bytes(2)) + 1
         else:
-            width  = ordl(self.infile.read(4)) + 1
-            height = ordl(self.infile.read(4)) + 1
+            width  = ordl(self.read_bytes(4)) + 1
+            height = ordl(self.read_bytes(4)) + 1
         self.print_indent("Image Width       : %d" % width)
         self.print_indent("Image Height      : %d" % height)
         if tiles:
-            t1 = ord(self.infile.read(1))
-            t2 = ord(self.infile.read(1))
-            t3 = ord(self.infile.read(1))
+            t1 = self.read_byte()
+            t2 = self.read_byte()
+            t3 = self.read_byte()
             tilew = ((t1 << 4) | ((t2 & 0xf0) >> 4)) + 1
             tileh = (((t2 & 0x0f) << 8) | t3) + 1
             self.print_indent("Tiles Left-Right  : %d" % tilew)
@@ -234,9 +332,9 @@ class JXRCodestream:
         self.tiles_high = tileh
         for x in range(0,tilew-1):
             if short:
-                tw = ord(self.infile.read(1))
+                tw = self.read_byte()
             else:
-                tw = ordw(self.infile.read(2))
+                tw = ordw(self.read_bytes(2))
             self.print_indent("Width of Tile  %d : %d MBs" % (x,tw))
             totw -= tw << 4
         if tiles:
@@ -244,17 +342,17 @@ class JXRCodestream:
         toth = height
         for y in range(0,tileh-1):
             if short:
-                th = ord(self.infile.read(1))
+                th = self.read_byte()
             else:
-                th = ord(self.infile.read(2))
+                th = ordw(self.read_bytes(2))
             self.print_indent("Height of Tile %d : %d MBs" % (y,th))
             toth -= th << 4
         if tiles:
             self.print_indent("Height of Tile %d : %d MBs (computed)" % (tileh-1,(toth + 15) >> 4))
         if windowing:
-            t1 = ord(self.infile.read(1))
-            t2 = ord(self.infile.read(1))
-            t3 = ord(self.infile.read(1))
+            t1 = self.read_byte()
+            t2 = self.read_byte()
+            t3 = self.read_byte()
             top   = t1 >> 2
             left  = ((t1 & 0x03) << 4) | ((t2 & 0xf0) >> 4)
             bot   = ((t2 & 0x0f) << 2) | ((t3 & 0xc0) >> 6)
@@ -300,7 +398,10 @@ class JXRCodestream:
         else:
             self.print_indent("Image Plane Header Contents:")
         self.indent += 1
-        flags=ord(self.infile.read(1))
+        # start, bit positions of the LP and HP quantizers, end
+        plane = [self.tell(),None,None,None]
+        self.planes.append(plane)
+        flags=self.read_byte()
         cfmt = (flags & 0xe0) >> 5
         if cfmt == 0:
             cformat = "YOnly"
@@ -351,25 +452,25 @@ class JXRCodestream:
             self.num_bands = 0
         self.print_indent("Included Bands    : %s" % bd)
         if cfmt == 1 or cfmt == 2 or cfmt == 3:
-            flags = ord(self.infile.read(1))
+            flags = self.read_byte()
             self.print_indent("Chroma Centering X: %d" % (flags >> 4))
             self.print_indent("Chroma Centering Y: %d" % (flags & 0x0f))
         elif cfmt == 6:
-            comps = ord(self.infile.read(1))
+            comps = self.read_byte()
             if (comps >> 4) == 15:
-                comps = ((comps & 0x0f) | (ord(self.infile.read(1)))) + 16
+                comps = ((comps & 0x0f) | (self.read_byte())) + 16
             else:
                 self.print_indent("Reserved H        : %d" % (comps & 0x0f))
                 comps = ((comps >> 4) + 1)
         self.print_indent("Components        : %d" % comps)
         self.num_components = comps
         if self.output_bitdepth == 2 or self.output_bitdepth == 3 or self.output_bitdepth == 6:
-            flags=ord(self.infile.read(1))
+            flags=self.read_byte()
             self.print_indent("Output Upshift    : %d" % flags)
         elif self.output_bitdepth == 7:
-            flags=ord(self.infile.read(1))
+            flags=self.read_byte()
             self.print_indent("Mantissa Length   : %d" % flags)
-            flags=ord(self.infile.read(1))
+            flags=self.read_byte()
             self.print_indent("Exponent Bias     : %d" % flags)
         dcuniform = self.get_bits(1)
         if dcuniform == 1:
@@ -381,6 +482,7 @@ class JXRCodestream:
         if dcuniform:
             self.parse_quantizer(comps,"DC    ")
         if bands != 3:
+            plane[1] = self.bit_tell()
             self.print_indent("Reserved I        : %d" % self.get_bits(1))
             lpuniform = self.get_bits(1)
             if lpuniform == 1:
@@ -392,6 +494,7 @@ class JXRCodestream:
             if lpuniform:
                 self.parse_quantizer(comps,"LP    ")
             if bands != 2:
+                plane[2] = self.bit_tell()
                 self.print_indent("Reserved J        : %d" % self.get_bits(1))
                 hpuniform = self.get_bits(1)
                 if hpuniform == 1:
@@ -403,17 +506,18 @@ class JXRCodestream:
                 if hpuniform:
                     self.parse_quantizer(comps,"HP    ")
         self.align_to_byte()
+        plane[3] = self.tell()
         self.indent -= 1
 
     def vlw_esc(self):
-        first = ord(self.infile.read(1))
+        first = self.read_byte()
         if first < 0xfb:
-            second = ord(self.infile.read(1))
+            second = self.read_byte()
             return (first << 8) | second
         elif first == 0xfb:
-            return ordl(self.infile.read(4))
+            return ordl(self.read_bytes(4))
         elif first == 0xfc:
-            return ordq(self.infile.read(8))
+            return ordq(self.read_bytes(8))
         else:
             return 0
         
@@ -424,7 +528,7 @@ class JXRCodestream:
             entries = self.num_bands * self.tiles_wide * self.tiles_high
         else:
             entries = self.tiles_wide * self.tiles_high
-        startcode = ordw(self.infile.read(2))
+        startcode = ordw(self.read_bytes(2))
         self.print_indent("Start Code        : 0x%04lx" % startcode)
         self.print_indent("Number of Entries : %d" % entries)
         self.tile_offsets = []
@@ -492,7 +596,7 @@ class JXRCodestream:
     def tile_DC(self,tile):
         self.print_indent("Tile %d (DC)          :" % tile)
         self.indent += 1
-        startcode = ordl(self.infile.read(4))
+        startcode = ordl(self.read_bytes(4))
         self.print_indent("Start code            : 0x%08lx" % startcode)
         if self.num_bands > 1:
             self.tile_header_DC(False)
@@ -504,7 +608,7 @@ class JXRCodestream:
     def tile_LP(self,tile):
         self.print_indent("Tile %d (LP)          :" % tile)
         self.indent += 1
-        startcode = ordl(self.infile.read(4))
+        startcode = ordl(self.read_bytes(4))
         self.print_indent("Start code            : 0x%08lx" % startcode)
         self.tile_header_LP(False)
         if self.alpha_present:
@@ -515,7 +619,7 @@ class JXRCodestream:
     def tile_HP(self,tile):
         self.print_indent("Tile %d (HP)          :" % tile)
         self.indent += 1
-        startcode = ordl(self.infile.read(4))
+        startcode = ordl(self.read_bytes(4))
         self.print_indent("Start code            : 0x%08lx" % startcode)
         if self.num_bands > 2:
             self.tile_header_HP(False)
@@ -527,7 +631,7 @@ class JXRCodestream:
     def tile_FlexBits(self,tile):
         self.print_indent("Tile %d (FlexBits)    :" % tile)
         self.indent += 1
-        startcode = ordl(self.infile.read(4))
+        startcode = ordl(self.read_bytes(4))
         self.print_indent("Start code            : 0x%08lx" % startcode)
         if self.trim_flexbits:
             self.print_indent("Trim Flexbits         : %d" % self.get_bits(4))
@@ -537,7 +641,7 @@ class JXRCodestream:
     def tile_Spatial(self,tile):
         self.print_indent("Tile %d (spatial mode):" % tile)
         self.indent += 1
-        startcode = ordl(self.infile.read(4))
+        startcode = ordl(self.read_bytes(4))
         self.print_indent("Start code            : 0x%08lx" % startcode)
         if self.trim_flexbits:
             self.print_indent("Trim Flexbits         : %d" % self.get_bits(4))
@@ -577,7 +681,7 @@ class JXRCodestream:
             if self.get_bits(1) == 1:
                 last = True
             
-    def parse(self):
+    def parse_headers(self):
         self.indent += 1
         self.parse_image_header()
         print
@@ -590,56 +694,187 @@ class JXRCodestream:
         if self.index_table_present == True:
             print
             self.print_position()
+            self.table_pos = self.tell()
             self.parse_table_tiles()
+        self.subseq_pos = self.tell()
         subseqnt  = self.vlw_esc()
         if subseqnt > 0:
-            current = self.infile.tell()
+            current = self.tell()
             print
             self.print_position()
             self.parse_profile_info()
-            self.infile.seek(current + subseqnt)
+            self.seek(current + subseqnt)
         print
-        num_tiles = self.tiles_wide * self.tiles_high
-        base      = self.infile.tell()
+        self.num_tiles = self.tiles_wide * self.tiles_high
+        self.base      = self.tell()
+
+    # The size of each index table entry is the distance to the entry
+    # following it in the file, the last one extends to the end of the
+    # codestream if its size is known. No tile data is read.
+    def entry_sizes(self):
+        if self.sizes is None:
+            if self.tile_offsets is None:
+                offsets = [0]
+            else:
+                offsets = self.tile_offsets
+            order = sorted(range(len(offsets)),key = offsets.__getitem__)
+            self.sizes = [None] * len(offsets)
+            for k in range(len(order) - 1):
+                self.sizes[order[k]] = offsets[order[k + 1]] - offsets[order[k]]
+            if self.size is not None:
+                self.sizes[order[-1]] = self.start + self.size - self.base - offsets[order[-1]]
+        return self.sizes
+
+    def tile_entries(self,tile):
+        if tile < 0 or tile >= self.num_tiles:
+            raise JP2Error("tile %d does not exist, the image has %d tiles" % (tile,self.num_tiles))
         if self.frequency_mode:
-            for i in range(0,num_tiles):
-                self.infile.seek(base + self.tile_offsets[i * self.num_bands])
-                self.print_position()
-                self.tile_DC(i)
-            if self.num_bands > 1:
-                for i in range(0,num_tiles):
-                    self.infile.seek(base + self.tile_offsets[i * self.num_bands + 1])
-                    self.print_position()
-                    self.tile_LP(i)
-            if self.num_bands > 2:
-                for i in range(0,num_tiles):
-                    self.infile.seek(base + self.tile_offsets[i * self.num_bands + 2])
-                    self.print_position()
-                    self.tile_HP(i)
-            if self.num_bands > 3:
-                for i in range(0,num_tiles):
-                    self.infile.seek(base + self.tile_offsets[i * self.num_bands + 3])
-                    self.print_position()
-                    self.tile_FlexBits(i)
-        elif num_tiles > 1:
-            for i in range(0,num_tiles):
-                self.infile.seek(base + self.tile_offsets[i])
-                self.print_position()
-                self.tile_Spatial(i)
+            return range(tile * self.num_bands,(tile + 1) * self.num_bands)
+        return [tile]
+
+    def tile_sizes(self,tile):
+        sizes = self.entry_sizes()
+        return [sizes[entry] for entry in self.tile_entries(tile)]
+
+    def parse_entry(self,tile,band):
+        if self.tile_offsets is not None:
+            self.seek(self.base + self.tile_offsets[self.tile_entries(tile)[band]])
+        self.print_position()
+        if not self.frequency_mode:
+            self.tile_Spatial(tile)
+        elif band == 0:
+            self.tile_DC(tile)
+        elif band == 1:
+            self.tile_LP(tile)
+        elif band == 2:
+            self.tile_HP(tile)
         else:
-            self.print_position()
-            self.tile_Spatial(0)
+            self.tile_FlexBits(tile)
+
+    def parse_tile(self,tile):
+        if self.frequency_mode:
+            bands = ["DC","LP","HP","FlexBits"][:self.num_bands]
+        else:
+            bands = ["Spatial"]
+        sizes = self.tile_sizes(tile)
+        for band in range(len(bands)):
+            self.parse_entry(tile,band)
+        self.print_indent("Tile %d Sizes:" % tile)
+        self.indent += 1
+        for band in range(len(bands)):
+            if sizes[band] is None:
+                self.print_indent("%-8s : unknown" % bands[band])
+            else:
+                self.print_indent("%-8s : %d bytes" % (bands[band],sizes[band]))
+        self.indent -= 1
+        print
+
+    # The tile headers are read in file order before they are parsed in
+    # their logical order: the first window bytes of each wanted index
+    # table entry are read by ascending offset, overlapping windows are
+    # merged, and the result is served from memory. The bytes between
+    # the windows are not read, and at most maxbytes are held; headers
+    # beyond that are read from the file when they are parsed.
+    def plan_reads(self,entries,window = 256,maxbytes = 1 << 22):
+        sizes = self.entry_sizes()
+        spans = []
+        for entry in entries:
+            start  = self.base + self.tile_offsets[entry]
+            length = window
+            if sizes[entry] is not None:
+                length = min(window,sizes[entry])
+            spans.append((start,start + length))
+        spans.sort()
+        merged = []
+        for start,end in spans:
+            if len(merged) > 0 and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1],end)
+            else:
+                merged.append([start,end])
+        ranges = []
+        held   = 0
+        for start,end in merged:
+            if held + end - start > maxbytes:
+                break
+            self.infile.seek(start)
+            data = self.infile.read(end - start)
+            ranges.append((start,data))
+            held += len(data)
+        return RangeFile(self.infile,ranges)
+
+    def parse(self,tiles = None):
+        self.parse_headers()
+        if tiles is not None:
+            entries = [entry for tile in tiles for entry in self.tile_entries(tile)]
+        elif self.frequency_mode:
+            entries = range(0,self.num_tiles * self.num_bands)
+        elif self.num_tiles > 1:
+            entries = range(0,self.num_tiles)
+        else:
+            entries = []
+        infile    = self.infile
+        blocksize = self.blocksize
+        if self.tile_offsets is not None and len(entries) > 0:
+            self.infile    = self.plan_reads(entries)
+            self.blocksize = 64
+        try:
+            if tiles is not None:
+                for tile in tiles:
+                    self.parse_tile(tile)
+            elif self.frequency_mode:
+                for band in range(0,self.num_bands):
+                    for i in range(0,self.num_tiles):
+                        self.parse_entry(i,band)
+            elif self.num_tiles > 1:
+                for i in range(0,self.num_tiles):
+                    self.parse_entry(i,0)
+            else:
+                self.print_position()
+                self.tile_Spatial(0)
+        finally:
+            self.infile    = infile
+            self.blocksize = blocksize
+            self.seek(self.base)
         
-class JXRFile:
+#
+# Parse one codestream of a JXR file on a file handle of its own,
+# returning the output and the error, if any, for the main process.
+#
+
+def parse_codestream_job(job):
+    filename,offset,size,indent,tiles = job
+    file = open(filename,"rb")
+    try:
+        file.seek(offset)
+        jxrc       = JXRCodestream(file,indent,size)
+        error      = None
+        saved      = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        try:
+            try:
+                jxrc.parse(tiles)
+            except JP2Error, e:
+                error = str(e)
+            log = sys.stdout.getvalue()
+        finally:
+            sys.stdout = saved
+        return (log,error)
+    finally:
+        file.close()
+
+class JXRFile(IFDParser):
     def __init__(self,file,endian = 0):
+        IFDParser.__init__(self,IFDFileReader(file,endian))
         self.infile = file
-        self.indent = 0
         self.offset = 0
         self.endian = endian
         self.coffset = NotImplemented
         self.csize   = NotImplemented
         self.aoffset = NotImplemented
         self.asize   = NotImplemented
+        self.tiles   = None
+        self.filename  = None
+        self.processes = 1
         
     def readshort(self):
         if self.endian == 0:
@@ -662,9 +897,6 @@ class JXRFile:
     def print_hex(self, buffer):
         print_hex(buffer,self.indent)
         
-    def print_indent(self, buffer, nl = 1):
-        print_indent(buffer, self.indent, nl)
-        
     def print_position(self):
         print "0x%08lx:" % self.infile.tell()
 
@@ -845,15 +1077,6 @@ class JXRFile:
             rot += "Rotate Clockwise "
         self.print_indent("Orientation       : %s" % rot)
 
-    def print_colorspace(self,values):
-        if values[0] == 1:
-            cspace = "sRGB"
-        elif values[0] == 0xffff:
-            cspace = "sRGB not preferred"
-        else:
-            cspace = "Reserved (%d)" % values[0]
-        self.print_indent("Colorspace        : %s" % cspace)
-
     def print_imagetype(self,values):
         itype = ""
         if values[0] == 0:
@@ -954,243 +1177,9 @@ class JXRFile:
                 last = True
             idx += 3
 
-    def parse_exif(self,offset):
-        current = self.infile.tell()
-        self.infile.seek(offset)
-        count = self.readshort()
-        for i in range(0,count):
-            self.parse_ifd_entry()
-        self.infile.seek(current)
-
-    def print_componentsconfig(self,buffer):
-        self.print_indent("Components Config :")
-        px = ""
-        for i in range(0,len(buffer)):
-            c = ord(buffer[i])
-            if c == 0:
-                px += "not present "
-            elif c == 1:
-                px += "Y "
-            elif c == 2:
-                px += "Cb "
-            elif c == 3:
-                px += "Cr "
-            elif c == 4:
-                px += "R "
-            elif c == 5:
-                px += "G "
-            elif c == 6:
-                px += "B "
-            else:
-                px += "reserved (%d) " % c
-            self.print_indent("Pixel %2d Config   : %s" % (i+1,px))
-
-    def print_usercomment(self,buffer):
-        ctype = ordq(buffer[0:8])
-        if ctype == 0x4153424949000000:
-            comment = buffer[8:]
-            coding  = "ASCII"
-        elif ctype == 0x4a49530000000000:
-            comment = "???"
-            coding  = "JIS"
-        elif ctype == 0x554e49434f444500:
-            comment = buffer[8:]
-            coding  = "UNICODE"
-        else:
-            comment = "???"
-            coding  = "unknown"
-        self.print_indent("User Comment      : %s (%s)" % (comment,coding))
-
-    def parse_exposureprog(self,ep):
-        if ep == 0:
-            prog = "Undefined"
-        elif ep == 1:
-            prog = "Manual"
-        elif ep == 2:
-            prog = "Normal"
-        elif ep == 3:
-            prog = "Aperture Priority"
-        elif ep == 4:
-            prog = "Shutter Priority"
-        elif ep == 5:
-            prog = "Creative"
-        elif ep == 6:
-            prog = "Action"
-        elif ep == 7:
-            prog = "Portrait"
-        elif ep == 8:
-            prog = "Landscape"
-        else:
-            prog = "Reserved (%d)" % ep
-        self.print_indent("Exposure Program  : %s" % prog)
-
-    def parse_ifd_entry(self):
-        tag   = self.readshort()
-        type  = self.readshort()
-        count = self.readlong()
-        offset = 0
-        values = []
-        content = ""
-        if type == 1 or type == 6:
-            typename="Byte"
-            if count > 4:
-                offset = self.readlong()
-                current = self.infile.tell()
-                self.infile.seek(offset)
-                for i in range(0,count):
-                    v = ord(self.infile.read(1))
-                    content += "%02x " % v
-                    values.append(v)
-                self.infile.seek(current)
-            else:
-                buffer = self.infile.read(4)
-                if count > 0:
-                    v = ord(buffer[0:1])
-                    content += "%02x " % v
-                    values.append(v)
-                if count > 1:
-                    v = ord(buffer[1:2])
-                    content += "%02x " % v
-                    values.append(v)
-                if count > 2:
-                    v = ord(buffer[2:3])
-                    content += "%02x " % v
-                    values.append(v)
-                if count > 3:
-                    v = ord(buffer[3:4])
-                    content += "%02x " % v
-                    values.append(v)
-        elif type == 2:
-            typename="UTF-8"
-            if count > 4:
-                offset = self.readlong()
-                current = self.infile.tell()
-                self.infile.seek(offset)
-                buffer = self.infile.read(count)
-                for i in range(0,len(buffer)):
-                    content += "%02x " % ord(buffer[i])
-                if buffer[len(buffer)-1] == '\0':
-                    buffer = buffer[0:len(buffer)-1]
-                values.append(buffer)
-                self.infile.seek(current)
-            else:
-                buffer = self.infile.read(4)
-                buffer = buffer[0:count]
-                for i in range(0,len(buffer)):
-                    content += "%02x " % ord(buffer[i])
-                if buffer[len(buffer)-1] == '\0':
-                    buffer = buffer[0:len(buffer)-1]
-                values.append(buffer)
-        elif type == 3 or type == 8:
-            typename="Short"
-            if count > 2:
-                offset = self.readlong()
-                current = self.infile.tell()
-                self.infile.seek(offset)
-                for i in range(0,count):
-                    v = self.readshort()
-                    values.append(v)
-                    content += "%04x " % v
-                self.infile.seek(current)
-            else:
-                if count > 0:
-                    v = self.readshort()
-                    values.append(v)
-                    content += "%04x " % v
-                else:
-                    self.infile.read(2)
-                if count > 1:
-                    v = self.readshort()
-                    values.append(v)
-                    content += "%04x " % v
-                else:
-                    self.infile.read(2)
-        elif type == 4 or type == 9:
-            typename="Long"
-            if count > 1:
-                offset = self.readlong()
-                current = self.infile.tell()
-                self.infile.seek(offset)
-                for i in range(0,count):
-                    v = self.readlong()
-                    values.append(v)
-                    content += "%08x " % v
-                self.infile.seek(current)
-            else:
-                if count > 0:
-                    v = self.readlong()
-                    values.append(v)
-                    content += "%08x " % v
-                else:
-                    self.infile.read(4)
-        elif type == 5 or type == 10:
-            typename="Rational"
-            offset = self.readlong()
-            current = self.infile.tell()
-            self.infile.seek(offset)
-            for i in range(0,count):
-                num = self.readlong()
-                den = self.readlong()
-                content += "%d/%d " % (num,den)
-                values.append([num,den])
-            self.infile.seek(current)
-        elif type == 11:
-            typename="Float"
-            if count > 1:
-                offset = self.readlong()
-                current = self.infile.tell()
-                self.infile.seek(offset)
-                for i in range(0,count):
-                    v = ieee_float_to_float(self.readlong())
-                    values.append(v)
-                    content += "%g " % v
-                self.infile.seek(current)
-            else:
-                if count > 0:
-                    v = ieee_float_to_float(self.readlong())
-                    values.append(v)
-                    content += "%g " % v
-                else:
-                    self.infile.read(4)
-        elif type == 12:
-            typename="Double"
-            offset = self.readlong()
-            current = self.infile.tell()
-            self.infile.seek(offset)
-            for i in range(0,count):
-                v = ieee_double_to_float(self.readquad())
-                values.append(v)
-                content += "%g " % v
-            self.infile.seek(current)
-        elif type == 7:
-            typename="Undefined"
-            if count > 4:
-                offset = self.readlong()
-                current = self.infile.tell()
-                self.infile.seek(offset)
-                buffer = self.infile.read(count)
-                self.infile.seek(offset)
-                for i in range(0,count):
-                    content += "0x%02x " % ord(self.infile.read(1))
-                self.infile.seek(current)
-            else:
-                current = self.infile.tell()
-                buffer = self.infile.read(count)
-                self.infile.seek(current)
-                for i in range(0,count):
-                    content += "0x%02x " % ord(self.infile.read(1))
-                self.infile.seek(current + 4)
-        else:
-            typename="Unknown"
-            values.append(self.readlong())
-            self.infile.seek(self.infile.tell() - 4)
-            for i in range(0,4):
-                content += "0x%02x " % ord(self.infile.read(1))
-        if count <= 16:
-            self.print_indent("0x%04x(%8s[%2d]): %s" % (tag,typename,count,content))
-        else:
-            self.print_indent("0x%04x(%8s[%2d]): ..." % (tag,typename,count))
-        self.indent += 1
+    def parse_tag(self,entry):
+        tag    = entry.tag
+        values = entry.values
         if tag == 0xbc01:
             self.print_indent("Pixel Format      : %s" % self.pxFormatToString(values))
         elif tag == 0xbc80:
@@ -1207,96 +1196,6 @@ class JXRFile:
         elif tag == 0xbcc1:
             self.print_indent("Image Bytecount   : 0x%08lx" % values[0])
             self.csize = values[0]
-        elif tag == 0x010d:
-            self.print_indent("Document Name     : %s" % values[0])
-        elif tag == 0x010e:
-            self.print_indent("Image Description : %s" % values[0])
-        elif tag == 0x010f:
-            self.print_indent("Equipment Make    : %s" % values[0])
-        elif tag == 0x0110:
-            self.print_indent("Equipment Model   : %s" % values[0])
-        elif tag == 0x011d:
-            self.print_indent("Page Name         : %s" % values[0])
-        elif tag == 0x0129:
-            self.print_indent("Page Number       : %d-%d" % (values[0],values[1]))
-        elif tag == 0x0131:
-            self.print_indent("Software Version  : %s" % values[0])
-        elif tag == 0x0132:
-            self.print_indent("Date and Time     : %s" % values[0])
-        elif tag == 0x013b:
-            self.print_indent("Artist Name       : %s" % values[0])
-        elif tag == 0x013c:
-            self.print_indent("Host Computer     : %s" % values[0])
-        elif tag == 0x8222:
-            self.print_exposureprog(values[0])
-        elif tag == 0x8298:
-            self.print_indent("Copyright Notice  : %s" % values[0])
-        elif tag == 0x829a:
-            self.print_indent("Exposure Time     : %s" % content)
-        elif tag == 0x829d:
-            self.print_indent("F-Stops           : %s" % content)
-        elif tag == 0x8824:
-            self.print_indent("Spectral Sens.    : %s" % values[0])
-        elif tag == 0x8827:
-            self.print_indent("ISO Speed Rating  : %d" % values[0]) 
-        elif tag == 0x9000:
-            self.print_indent("EXIF Version      : %s" % content)
-        elif tag == 0x9003:
-            self.print_indent("Date & Time (Org) : %s" % values[0])
-        elif tag == 0x9004:
-            self.print_indent("Date & Time (Dgt) : %s" % values[0])
-        elif tag == 0x9101:
-            self.print_componentsconfig(buffer)
-        elif tag == 0x9102:
-            self.print_indent("Compressed BPP    : %s" % content)
-        elif tag == 0x9201:
-            self.print_indent("Shutter Speed     : %s" % content)
-        elif tag == 0x9202:
-            self.print_indent("Aperture          : %s" % content)
-        elif tag == 0x9203:
-            self.print_indent("Brightness        : %s" % content)
-        elif tag == 0x9204:
-            self.print_indent("Exposure Bias     : %s" % content)
-        elif tag == 0x9205:
-            self.print_indent("Max. Aperture     : %s" % content)
-        elif tag == 0x9206:
-            self.print_indent("Subject Distance  : %s" % content)
-        elif tag == 0x9290:
-            self.print_indent("Sub-Seconds       : %s" % values[0])
-        elif tag == 0x9291:
-            self.print_indent("Sub-Seconds (Org) : %s" % values[0])
-        elif tag == 0x9292:
-            self.print_indent("Sub-Seconds (Dgt) : %s" % values[0])
-        elif tag == 0x927c:
-            self.print_indent("Marker Note       : %s" % content)
-        elif tag == 0x9286:
-            self.print_usercomment(buffer)
-        elif tag == 0xa000:
-            self.print_indent("FlashPix Version  : %s" % content)
-        elif tag == 0xa001:
-            self.print_colorspace(values)
-        elif tag == 0xa002:
-            self.print_indent("PixelXDimension   : %s" % values[0])
-        elif tag == 0xa003:
-            self.print_indent("PixelYDimension   : %s" % values[0])
-        elif tag == 0xa004:
-            self.print_indent("Sound File        : %s" % values[0])
-        elif tag == 0xa20b:
-            self.print_indent("Flash Energy      : %s" % content)
-        elif tag == 0xa20e:
-            self.print_indent("Focal Plane X Res : %s" % content)
-        elif tag == 0xa20f:
-            self.print_indent("Focal Plane Y Res : %s" % content)
-        elif tag == 0xa214:
-            self.print_indent("Subject Location  : %d,%d" % (values[0],values[1]))
-        elif tag == 0xa215:
-            self.print_indent("Exposure Index    : %s" % content)
-        elif tag == 0xa404:
-            self.print_indent("Digital Zoom Ratio: %s" % content)
-        elif tag == 0xa405:
-            self.print_indent("Focal Len for 35mm: %d" % values[0])
-        elif tag == 0xa420:
-            self.print_indent("Unique ID         : %s" % values[0])
         elif tag == 0xbc02:
             self.print_rotation(values)
         elif tag == 0xbc04:
@@ -1315,24 +1214,9 @@ class JXRFile:
             self.print_indent("Image Bands       : %d" % values[0])
         elif tag == 0xbcc5:
             self.print_indent("Alpha Presence    : %d" % values[0])
-        elif tag == 0x02bc:
-            self.print_indent("Adobe XMP data:");
-            self.indent += 1
-            string = ""
-            for i in values:
-                string += chr(i)
-            print string
-        elif tag == 0x8769:
-            self.print_indent("EXIF 2.2 data:");
-            self.parse_exif(values[0])
-        elif tag == 0x8773:
-            self.print_indent("ICC Profile:");
-            parse_icc(self.indent+1,buffer)
-        elif tag == 0xea1c:
-            self.print_indent("Padding Data");
-        self.indent -= 1
+        else:
+            IFDParser.parse_tag(self,entry)
 
-        
     def parse(self):
         type = self.infile.read(2)
         id = self.readshort()
@@ -1340,38 +1224,75 @@ class JXRFile:
             raise JP2Error("not a valid JXR file, identifier is invalid")
         ifdoffset = self.readlong()
         self.print_indent("IFD at offset:         0x%04lx" % ifdoffset)
-        self.infile.seek(ifdoffset)
-        count = self.readshort()
-        self.print_indent("Number of IFD entries: %d" % count)
+        entries,next = self.reader.read_ifd(ifdoffset)
+        self.print_indent("Number of IFD entries: %d" % len(entries))
         self.indent+=1
-        for i in range(0,count):
-            self.parse_ifd_entry()
+        for entry in entries:
+            self.parse_ifd_entry(entry)
+        planes = []
         if self.coffset != NotImplemented:
-            self.infile.seek(self.coffset)
-            jxrc = JXRCodestream(self.infile,self.indent)
-            print
-            self.print_position()
-            self.print_indent("Codestream Contents:")
-            jxrc.parse()
+            planes.append((self.coffset,self.csize,"Codestream Contents:"))
         if self.aoffset != NotImplemented and self.aoffset != 0:
-            self.infile.seek(self.aoffset)
-            jxrc = JXRCodestream(self.infile,self.indent)
+            planes.append((self.aoffset,self.asize,"Codestream Alpha Plane Contents:"))
+        if self.processes > 1 and self.filename is not None and len(planes) > 1:
+            self.parse_planes(planes)
+            return
+        for offset,size,title in planes:
+            if size == NotImplemented:
+                size = None
+            self.infile.seek(offset)
+            jxrc = JXRCodestream(self.infile,self.indent,size)
             print
             self.print_position()
-            self.print_indent("Codestream Alpha Plane Contents:")
-            jxrc.parse()
+            self.print_indent(title)
+            jxrc.parse(self.tiles)
+
+    # The main and the alpha plane are independent codestreams, parse
+    # them concurrently and print their output in order.
+    def parse_planes(self,planes):
+        jobs = []
+        for offset,size,title in planes:
+            if size == NotImplemented:
+                size = None
+            jobs.append((self.filename,offset,size,self.indent,self.tiles))
+        pool = multiprocessing.Pool(min(self.processes,len(jobs)))
+        try:
+            results = pool.map(parse_codestream_job,jobs)
+        finally:
+            pool.close()
+            pool.join()
+        for (offset,size,title),(log,error) in zip(planes,results):
+            print
+            print "0x%08lx:" % offset
+            self.print_indent(title)
+            sys.stdout.write(log)
+            if error is not None:
+                raise JP2Error(error)
 
 ignore_codestream = 0
 if __name__ == "__main__":
     
     # Read Arguments
-    (args, files) = getopt.getopt(sys.argv[1:], "C", "ignore-codestream")
+    (args, files) = getopt.getopt(sys.argv[1:], "Ct:j:c:", ["ignore-codestream", "tiles=", "jobs=", "cache="])
+    tiles = None
+    processes = 1
+    cache = None
     for (o, a) in args:
         if o in ("-C", "--ignore-codestream"):
             ignore_codestream = 1
+        elif o in ("-t", "--tiles"):
+            tiles = [int(t) for t in a.split(",")]
+        elif o in ("-j", "--jobs"):
+            processes = int(a)
+        elif o in ("-c", "--cache"):
+            cache = a
 
     if len(files) != 1:
         print "Usage: [OPTIONS] %s FILE" % (sys.argv[0])
+        print "  -t N,M,...  only parse the headers of the listed tiles and report"
+        print "              the sizes of their bands from the index table"
+        print "  -j N        parse the main and the alpha plane concurrently"
+        print "  -c FILE     keep the parsed ICC profiles in the cache file FILE"
         sys.exit(1)
 
     print "###############################################################"
@@ -1383,18 +1304,31 @@ if __name__ == "__main__":
     file = open(files[0],"rb")
     type = file.read(2)
     file.seek(0)
+    if cache is not None:
+        load_icc_cache(cache)
     try:
         if ord(type[0]) == 0x57 and ord(type[1]) == 0x4d:
-            jxr = JXRCodestream(file,0)
-            jxr.parse()
+            file.seek(0,2)
+            size = file.tell()
+            file.seek(0)
+            jxr = JXRCodestream(file,0,size)
+            jxr.parse(tiles)
         elif ord(type[0]) == 0x49 and ord(type[1]) == 0x49:
             jxr = JXRFile(file,0)
+            jxr.tiles = tiles
+            jxr.filename  = files[0]
+            jxr.processes = processes
             jxr.parse()
         elif ord(type[0]) == 0x4d and ord(type[1]) == 0x4d:
             jxr = JXRFile(file,1)
+            jxr.tiles = tiles
+            jxr.filename  = files[0]
+            jxr.processes = processes
             jxr.parse()
         else:
             print 'Input file is neither a JXR codestream nor a JXR file'
             
     except JP2Error, e:
         print '***', str(e)
+    if cache is not None:
+        save_icc_cache(cache)
@@ -3,6 +3,12 @@
 # $Id: jxscodestream.py,v 1.24 2025/11/21 13:12:32 thor Exp $
 
 import sys
+import array
+import collections
+import getopt
+import zipfile
+import cStringIO
+import multiprocessing
 
 from jp2utils import *
 from jpgxtbox import *
@@ -142,6 +148,914 @@ def decode_Level(level):
         fstr = "invalid fbb (0x%x)" % fbl
     return "%s@%s %s" % (lstr,sstr,fstr)
 #
+# Profile constraints. Each profile lists its maximum bits per pixel and
+# a sequence of (guard, test, message) triples: if the guard holds, or is
+# None, the test must hold, otherwise the profile is violated. Guards and
+# tests are (field, operator, value) triples over the fields below.
+#
+
+profile_fields = ("profile","precision","sampling","vlevels","hlevels","columnsize",
+                  "sliceheight","colortrafo","longhdr","rawbyline","excluded",
+                  "fractional","nlt","extent","quant","precwidth")
+
+profile_table = {
+    0x1500 : (20, [ #light 422.10
+        (None, ("precision","in",(8,10)),
+         "Light422.10 only supports 8 and 10 bit sample precision"),
+        (None, ("sampling","in",("400","422")),
+         "Light422.20 only suppors 400 and 422 subsampling"),
+        (None, ("vlevels","<=",1),
+         "Light422.10 only supports up to 1 vertical decomposition level"),
+        (None, ("quant","in",("deadzone",)),
+         "Light422.10 only supports the deadzone quantizer"),
+        (None, ("columnsize","in",(0,)),
+         "Light422.10 does not support columns"),
+        (None, ("sliceheight","in",(16,)),
+         "Light422.10 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None",)),
+         "Light422.10 does not support any color decorrelation transformation"),
+        (None, ("longhdr","in",(0,)),
+         "Light422.10 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "Light422.10 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "Light422.10 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "Light422.10 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "Light422.10 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "Light422.10 does not support the CDT marker"),
+    ]),
+    0x1a00 : (36, [ #light 444.12
+        (None, ("precision","in",(8,10,12)),
+         "Light444.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444")),
+         "Light444.12 only supports 400, 422 and 444 subsampling"),
+        (None, ("vlevels","<=",1),
+         "Light444.12 only supports up to 1 vertical decomposition level"),
+        (None, ("quant","in",("deadzone",)),
+         "Light444.12 only supports the deadzone quantizer"),
+        (None, ("columnsize","in",(0,)),
+         "Light444.12 does not support columns"),
+        (None, ("sliceheight","in",(16,)),
+         "Light444.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "Light444.12 only supports the RCT or no color transformation"),
+        (None, ("longhdr","in",(0,)),
+         "Light444.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "Light444.12 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "Light444.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "Light444.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "Light444.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "Light422.12 does not support the CDT marker"),
+    ]),
+    0x2500 : (20, [ #light subline 422.10
+        (None, ("precision","in",(8,10)),
+         "Light subline 422.10 only supports 8 and 10 bit sample precision"),
+        (None, ("sampling","in",("400","422")),
+         "Light subline 422.10 only supports 400 and 444 subsampling"),
+        (None, ("vlevels","<=",0),
+         "Light subline 422.10 only supports 0 vertical decomposition levels"),
+        (None, ("precwidth","<=",2048),
+         "Light subline 422.10 allows precincts to be at most 2048 grid points large"),
+        (None, ("colortrafo","in",("None",)),
+         "Light subline 422.10 does not support any color decorrelation transformation"),
+        (None, ("longhdr","in",(0,)),
+         "Light subline 422.10 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "Light subline 422.10 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "Light subline 422.10 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "Light subline 422.10 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "Light subline 422.10 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "Light subline 422.10 does not support the CDT marker"),
+    ]),
+    0x3240 : (20, [ #main 420.12
+        (None, ("precision","in",(8,10,12)),
+         "Main420.10 only supports 8 and 10 bit sample precision"),
+        (None, ("sampling","in",("420",)),
+         "Main420.10 only supports 420 subsampling"),
+        (None, ("vlevels","<=",1),
+         "Main420.10 only supports up to 1 vertical decomposition level"),
+        (("vlevels","not in",(0,)), ("columnsize","in",(0,)),
+         "Main420.10 only supports columns for 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "Main420.10 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None",)),
+         "Main420.10 does not support any color decorrelation transformation"),
+        (None, ("longhdr","in",(0,)),
+         "Main420.10 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "Main420.10 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "Main420.10 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "Main420.10 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "Main420.10 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "Main420.10 does not support the CDT marker"),
+    ]),
+    0x3540 : (20, [ #main 422.10
+        (None, ("precision","in",(8,10)),
+         "Main 422.10 only supports 8 and 10 bit sample precision"),
+        (None, ("sampling","in",("400","422")),
+         "Main422.10 only supports 400 and 444 subsampling"),
+        (None, ("vlevels","<=",1),
+         "Main422.10 only supports up to 1 vertical decomposition level"),
+        (("vlevels","not in",(0,)), ("columnsize","in",(0,)),
+         "Main422.10 only supports columns for 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "Main422.10 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None",)),
+         "Main422.10 does not support any color decorrelation transformation"),
+        (None, ("longhdr","in",(0,)),
+         "Main422.10 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "Main422.10 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "Main422.10 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "Main422.10 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "Main422.10 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "Main422.10 does not support the CDT marker"),
+    ]),
+    0x3a40 : (36, [ #main 444.12
+        (None, ("precision","in",(8,10,12)),
+         "Main444.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444")),
+         "Main444.12 only supports 400, 422 and 444 subsampling"),
+        (None, ("vlevels","<=",1),
+         "Main444.12 only supports up to 1 vertical decomposition level"),
+        (("vlevels","not in",(0,)), ("columnsize","in",(0,)),
+         "Main444.10 only supports columns for 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "Main444.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "Main444.12 only supports RCT or no color transformation"),
+        (None, ("longhdr","in",(0,)),
+         "Main444.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "Main444.12 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "Main444.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "Main444.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "Main444.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "Main444.12 does not support the CDT marker"),
+    ]),
+    0x3e40 : (48, [ #main 4444.12
+        (None, ("precision","in",(8,10,12)),
+         "Main4444.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444","4224","4444")),
+         "Main4444.12 only supports 400, 422, 444, 4224 and 4444 subsampling"),
+        (None, ("vlevels","<=",1),
+         "Main4444.12 only supports up to 1 vertical decomposition level"),
+        (("vlevels","not in",(0,)), ("columnsize","in",(0,)),
+         "Main4444.12 only supports columns for 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "Main4444.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "Main4444.12 only supports RCT or no color transformation"),
+        (None, ("longhdr","in",(0,)),
+         "Main4444.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "Main4444.12 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "Main4444.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "Main4444.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "Main4444.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "Main4444.12 does not support the CDT marker"),
+    ]),
+    0x4240 : (18, [ #high 420.12
+        (None, ("precision","in",(8,10,12)),
+         "High420.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("420",)),
+         "High420.12 only supports 420 subsampling"),
+        (None, ("vlevels","<=",2),
+         "High420.12 only supports up to 2 vertical decomposition levels"),
+        (None, ("vlevels","not in",(0,)),
+         "High420.12 does not support 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "High420.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None",)),
+         "High420.12 does not allow any color transformation"),
+        (None, ("longhdr","in",(0,)),
+         "High420.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "High420.12 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "High420.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "High420.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "High420.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "High420.12 does not support the CDT marker"),
+    ]),
+    0x4a40 : (36, [ #high 444.12
+        (None, ("precision","in",(8,10,12)),
+         "High444.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444")),
+         "High444.12 only supports 400, 422 and 444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "High444.12 only supports up to 2 vertical decomposition levels"),
+        (("vlevels","not in",(0,)), ("columnsize","in",(0,)),
+         "High444.12 only supports columns for 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "High444.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "High444.12 only supports RCT or no color transformation"),
+        (None, ("longhdr","in",(0,)),
+         "High444.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "High444.12 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "High444.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "High444.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "High444.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "High444.12 does not support the CDT marker"),
+    ]),
+    0x4e40 : (48, [ #high 4444.12
+        (None, ("precision","in",(8,10,12)),
+         "High4444.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444","4224","4444")),
+         "High4444.12 only supports 400, 422, 444, 4224 and 4444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "High4444.12 only supports up to 2 vertical decomposition levels"),
+        (("vlevels","not in",(0,)), ("columnsize","in",(0,)),
+         "High4444.12 only supports columns for 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "High4444.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "High4444.12 only supports RCT or no color transformation"),
+        (None, ("longhdr","in",(0,)),
+         "High4444.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "High4444.12 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "High4444.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "High4444.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "High4444.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "High4444.12 does not support the CDT marker"),
+    ]),
+    0x6ec0 : (64, [ #MLS 12 - there is not really a limit
+        (None, ("precision","in",(8,10,12)),
+         "MLS.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","420","422","444","4224","4444")),
+         "MLS.12 only supports 400, 420, 422, 444, 4224 and 4444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "MLS.12 only supports up to 2 vertical decomposition levels"),
+        (("vlevels","not in",(0,)), ("columnsize","in",(0,)),
+         "MLS.12 only supports columns for 0 vertical levels"),
+        (None, ("sliceheight","in",(16,)),
+         "MLS.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "MLS.12 only supports RCT or no color transformation"),
+        (None, ("longhdr","in",(0,)),
+         "MLS.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(0,)),
+         "MLS.12 does not support the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "MLS.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(0,)),
+         "MLS.12 requires 0 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "MLS.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "MLS.12 does not support the CDT marker"),
+    ]),
+    0x9300 : (64, [ #LightBayer
+        (None, ("precision","in",(10,12,14,16)),
+         "LightBayer only supports 10,12,14 and 16 bit sample precision"),
+        (None, ("sampling","in",("4444",)),
+         "LightBayer only supports 4444 subsampling"),
+        (None, ("vlevels","<=",0),
+         "LightBayer does not support vertical decomposition"),
+        (None, ("columnsize","in",(0,)),
+         "LightBayer does not support colums"),
+        (None, ("sliceheight","in",(16,)),
+         "LightBayer only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("Star-Tetrix",)),
+         "LightBayer only supports the Star-Tetrix color transformation"),
+        (None, ("excluded","in",(1,)),
+         "LightBayer requires one component to be excluded from the transformation"),
+        (None, ("rawbyline","in",(1,)),
+         "LightBayer requires the raw-mode per packet switch"),
+        (("nlt","not in",("None",)), ("fractional","in",(6,)),
+         "LightBayer requires 6 fractional bits if a non-linear transform is present"),
+        (("nlt","in",("None",)), ("fractional","in",(8,)),
+         "LightBayer requires 8 fractional bits without a non-linear transform"),
+        (None, ("extent","in",("in-line",)),
+         "LightBayer only supports the in-line Star-Tetrix transformation"),
+    ]),
+    0xb340 : (64, [ #MainBayer
+        (None, ("precision","in",(10,12,14,16)),
+         "MainBayer only supports 10,12,14 and 16 bit sample precision"),
+        (None, ("sampling","in",("4444",)),
+         "MainBayer only supports 4444 subsampling"),
+        (None, ("vlevels","<=",1),
+         "MainBayer only supports 0 or 1 vertical decompositions"),
+        (None, ("columnsize","in",(0,)),
+         "MainBayer does not support colums"),
+        (None, ("sliceheight","in",(16,)),
+         "MainBayer only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("Star-Tetrix",)),
+         "MainBayer only supports the Star-Tetrix color transformation"),
+        (None, ("excluded","in",(1,)),
+         "MainBayer requires one component to be excluded from the transformation"),
+        (None, ("rawbyline","in",(1,)),
+         "MainBayer requires the raw-mode per packet switch"),
+        (("nlt","not in",("None",)), ("fractional","in",(6,)),
+         "MainBayer requires 6 fractional bits if a non-linear transform is present"),
+        (("nlt","in",("None",)), ("fractional","in",(8,)),
+         "MainBayer requires 8 fractional bits without a non-linear transform"),
+    ]),
+    0xc340 : (64, [ #HighBayer
+        (None, ("precision","in",(10,12,14,16)),
+         "HighBayer only supports 10,12,14 and 16 bit sample precision"),
+        (None, ("sampling","in",("4444",)),
+         "HighBayer only supports 4444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "HighBayer does not support more than 2 vertical decompositions"),
+        (None, ("columnsize","in",(0,)),
+         "HighBayer does not support colums"),
+        (None, ("sliceheight","in",(16,)),
+         "HighBayer only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("Star-Tetrix",)),
+         "HighBayer only supports the Star-Tetrix color transformation"),
+        (None, ("excluded","in",(1,)),
+         "HighBayer requires one component to be excluded from the transformation"),
+        (None, ("rawbyline","in",(1,)),
+         "HighBayer requires the raw-mode per packet switch"),
+        (("nlt","not in",("None",)), ("fractional","in",(6,)),
+         "HighBayer requires 6 fractional bits if a non-linear transform is present"),
+        (("nlt","in",("None",)), ("fractional","in",(8,)),
+         "HighBayer requires 8 fractional bits without a non-linear transform"),
+    ]),
+    0x4a44 : (36, [ # CHigh
+        (None, ("precision","in",(8,10,12)),
+         "CHigh only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444")),
+         "CHigh only supports 400, 422 and 444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "CHigh only supports up to 2 vertical decomposition levels"),
+        (("vlevels","in",(0,)), ("hlevels","in",(3,4)),
+         "CHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(0,)), ("sampling","not in",("420",)),
+         "CHigh does not support 0 vertical levels for 420 subsampling"),
+        (("vlevels","in",(1,)), ("hlevels","in",(4,5)),
+         "CHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(2,)), ("hlevels","in",(5,)),
+         "CHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (None, ("columnsize","in",(0,)),
+         "CHigh does not support columns"),
+        (None, ("sliceheight","in",(16,)),
+         "CHigh only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "CHigh only supports RCT or no color transformation"),
+        (("colortrafo","in",("RCT",)), ("sampling","in",("444",)),
+         "CHigh only supports RCT for 444 sampling"),
+        (None, ("longhdr","in",(0,)),
+         "CHigh does not support the long header mode switch"),
+        (None, ("rawbyline","in",(1,)),
+         "CHigh requires the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "CHigh does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "CHigh requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "CHigh does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "CHigh does not support the CDT marker"),
+    ]),
+    0x4a4c : (36, [ # EHigh
+        (None, ("precision","in",(8,10,12)),
+         "EHigh only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444")),
+         "EHigh only supports 400, 422 and 444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "EHigh only supports up to 2 vertical decomposition levels"),
+        (("vlevels","in",(0,)), ("hlevels","in",(3,4)),
+         "EHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(0,)), ("sampling","not in",("420",)),
+         "EHigh does not support 0 vertical levels for 420 subsampling"),
+        (("vlevels","in",(1,)), ("hlevels","in",(4,5)),
+         "EHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(2,)), ("hlevels","in",(5,)),
+         "EHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (None, ("columnsize","in",(0,)),
+         "EHigh does not support columns"),
+        (None, ("sliceheight","in",(16,)),
+         "EHigh only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "EHigh only supports RCT or no color transformation"),
+        (("colortrafo","in",("RCT",)), ("sampling","in",("444",)),
+         "EHigh only supports RCT for 444 sampling"),
+        (None, ("longhdr","in",(0,)),
+         "EHigh does not support the long header mode switch"),
+        (None, ("rawbyline","in",(1,)),
+         "EHigh requires the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "EHigh does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "EHigh requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "EHigh does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "EHigh does not support the CDT marker"),
+    ]),
+    0x4a45 : (36, [ # TDC 444.12
+        (None, ("precision","in",(8,10,12)),
+         "TDC444.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444")),
+         "TDC444.12 only supports 400, 422 and 444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "TDC444.12 only supports up to 2 vertical decomposition levels"),
+        (("vlevels","in",(0,)), ("hlevels","in",(3,4)),
+         "TDC444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(0,)), ("sampling","not in",("420",)),
+         "TDC444.12 does not support 0 vertical levels for 420 subsampling"),
+        (("vlevels","in",(1,)), ("hlevels","in",(4,5)),
+         "TDC444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(2,)), ("hlevels","in",(5,)),
+         "TDC444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (None, ("columnsize","in",(0,)),
+         "TDC444.12 does not support columns"),
+        (None, ("sliceheight","in",(16,)),
+         "TDC444.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "TDC444.12 only supports RCT or no color transformation"),
+        (("colortrafo","in",("RCT",)), ("sampling","in",("444",)),
+         "TDC444.12 only supports RCT for 444 sampling"),
+        (None, ("longhdr","in",(0,)),
+         "TDC444.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(1,)),
+         "TDC444.12 requires the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "TDC444.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "TDC444.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "TDC444.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "TDC444.12 does not support the CDT marker"),
+    ]),
+    0x6a45 : (36, [ # TDC MLS 444.12
+        (None, ("precision","in",(8,10,12)),
+         "TDC MLS 444.12 only supports 8,10 and 12 bit sample precision"),
+        (None, ("sampling","in",("400","422","444")),
+         "TDC MLS 444.12 only supports 400, 422 and 444 subsampling"),
+        (None, ("vlevels","<=",2),
+         "TDC MLS 444.12 only supports up to 2 vertical decomposition levels"),
+        (("vlevels","in",(0,)), ("hlevels","in",(3,4)),
+         "TDC MLS 444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(0,)), ("sampling","not in",("420",)),
+         "TDC MLS 444.12 does not support 0 vertical levels for 420 subsampling"),
+        (("vlevels","in",(1,)), ("hlevels","in",(4,5)),
+         "TDC MLS 444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (("vlevels","in",(2,)), ("hlevels","in",(5,)),
+         "TDC MLS 444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions"),
+        (None, ("columnsize","in",(0,)),
+         "TDC MLS 444.12 does not support columns"),
+        (None, ("sliceheight","in",(16,)),
+         "TDC MLS 444.12 only supports slices of 16 grid points"),
+        (None, ("colortrafo","in",("None","RCT")),
+         "TDC MLS 444.12 only supports RCT or no color transformation"),
+        (("colortrafo","in",("RCT",)), ("sampling","in",("444",)),
+         "TDC MLS 444.12 only supports RCT for 444 sampling"),
+        (None, ("longhdr","in",(0,)),
+         "TDC MLS 444.12 does not support the long header mode switch"),
+        (None, ("rawbyline","in",(1,)),
+         "TDC MLS 444.12 requires the raw mode by line switch"),
+        (None, ("excluded","in",(0,)),
+         "TDC MLS 444.12 does not support excluding components from the transformation"),
+        (None, ("fractional","in",(8,)),
+         "TDC MLS 444.12 requires 8 fractional bits"),
+        (None, ("nlt","in",("None",)),
+         "TDC MLS 444.12 does not support non-linear transforms"),
+        (None, ("extent","in",("Unspecified",)),
+         "TDC MLS 444.12 does not support the CDT marker"),
+    ]),
+}
+
+profile_cache = dict()
+
+def profile_test(state,test):
+    field,op,value = test
+    if op == "in":
+        return state[field] in value
+    elif op == "not in":
+        return state[field] not in value
+    else:
+        return state[field] <= value
+
+def evaluate_profile(state):
+    if state["profile"] == 0x0000:
+        return (None,None)
+    if not profile_table.has_key(state["profile"]):
+        return (None,"invalid profile indicator %s" % state["profile"])
+    nbpp,constraints = profile_table[state["profile"]]
+    for guard,test,message in constraints:
+        if (guard is None or profile_test(state,guard)) and not profile_test(state,test):
+            return (None,message)
+    return (nbpp,None)
+
+#
+# Band coding modes of precinct headers, two bits per band, most
+# significant bits first. The table gives the four modes of each byte.
+#
+
+band_mode_lut = [chr(b >> 6) + chr((b >> 4) & 3) + chr((b >> 2) & 3) + chr(b & 3) for b in range(256)]
+
+band_mode_names = ("no prediction, no sigflags",
+                   "vertical prediction, no sigflags",
+                   "no prediction, sigflags",
+                   "vertical prediction, sigflags")
+
+temporal_mode_names = ("intra","refresh band","inter band","inter flags")
+
+def decode_band_modes(buffer,count):
+    modes = "".join([band_mode_lut[byte] for byte in bytearray(buffer[:(count + 3) >> 2])])
+    return array.array('B',modes[:count])
+
+#
+# The rate map: one entry per precinct in codestream order, i.e. raster
+# order on the precinct grid, kept in columnar arrays.
+#
+
+class RateMap:
+    def __init__(self):
+        self.slice  = array.array('H')
+        self.row    = array.array('H')
+        self.column = array.array('H')
+        self.offset = array.array('L')
+        self.psize  = array.array('I')
+        self.qp     = array.array('B')
+        self.rp     = array.array('B')
+        self.modes  = array.array('B')
+        self.tmodes = array.array('B')
+        self.bands  = 0
+        self.rows   = 0
+        self.columns = 0
+
+    def __len__(self):
+        return len(self.psize)
+
+    def add(self,slice,row,column,offset,psize,qp,rp,modes,tmodes):
+        if len(self.psize) == 0:
+            self.bands = len(modes)
+        elif len(modes) != self.bands:
+            raise JP2Error("number of bands changes within the codestream, cannot build a rate map")
+        self.slice.append(slice)
+        self.row.append(row)
+        self.column.append(column)
+        self.offset.append(offset)
+        self.psize.append(psize)
+        self.qp.append(qp)
+        self.rp.append(rp)
+        self.modes.extend(modes)
+        if tmodes is not None:
+            self.tmodes.extend(tmodes)
+
+    def extend(self,other):
+        if len(other) == 0:
+            return
+        if len(self) > 0 and other.bands != self.bands:
+            raise JP2Error("number of bands changes within the codestream, cannot build a rate map")
+        self.bands = other.bands
+        for name in ("slice","row","column","offset","psize","qp","rp","modes","tmodes"):
+            getattr(self,name).extend(getattr(other,name))
+
+    def shape(self):
+        if self.rows * self.columns == len(self):
+            return (self.rows,self.columns)
+        return (len(self),)
+
+    def aggregate(self):
+        slices = array.array('H')
+        count  = array.array('I')
+        size   = array.array('L')
+        qpmin  = array.array('B')
+        qpmax  = array.array('B')
+        for i in range(len(self)):
+            if len(slices) == 0 or slices[-1] != self.slice[i]:
+                slices.append(self.slice[i])
+                count.append(0)
+                size.append(0)
+                qpmin.append(self.qp[i])
+                qpmax.append(self.qp[i])
+            count[-1] += 1
+            size[-1]  += self.psize[i]
+            qpmin[-1]  = min(qpmin[-1],self.qp[i])
+            qpmax[-1]  = max(qpmax[-1],self.qp[i])
+        return (slices,count,size,qpmin,qpmax)
+
+    def write_npz(self,filename,perslice = False):
+        shape = self.shape()
+        npz   = zipfile.ZipFile(filename,"w",zipfile.ZIP_DEFLATED)
+        try:
+            if perslice:
+                slices,count,size,qpmin,qpmax = self.aggregate()
+                npz.writestr("slice.npy",npy_bytes(slices))
+                npz.writestr("precincts.npy",npy_bytes(count))
+                npz.writestr("bytes.npy",npy_bytes(size))
+                npz.writestr("qpmin.npy",npy_bytes(qpmin))
+                npz.writestr("qpmax.npy",npy_bytes(qpmax))
+            else:
+                for name in ("slice","row","column","offset","psize","qp","rp"):
+                    npz.writestr(name + ".npy",npy_bytes(getattr(self,name),shape))
+                npz.writestr("modes.npy",npy_bytes(self.modes,shape + (self.bands,)))
+                if len(self.tmodes) > 0:
+                    npz.writestr("tmodes.npy",npy_bytes(self.tmodes,shape + (self.bands,)))
+        finally:
+            npz.close()
+
+    def write_csv(self,filename,perslice = False):
+        file = open(filename,"w")
+        try:
+            if perslice:
+                slices,count,size,qpmin,qpmax = self.aggregate()
+                file.write("slice,precincts,bytes,qpmin,qpmax\n")
+                for i in range(len(slices)):
+                    file.write("%d,%d,%d,%d,%d\n" % (slices[i],count[i],size[i],qpmin[i],qpmax[i]))
+            else:
+                bands = self.bands
+                names = ["mode%d" % b for b in range(bands)]
+                if len(self.tmodes) > 0:
+                    names = names + ["tmode%d" % b for b in range(bands)]
+                file.write("slice,row,column,offset,psize,qp,rp,%s\n" % ",".join(names))
+                for i in range(len(self)):
+                    modes = self.modes[i * bands:(i + 1) * bands].tolist()
+                    if len(self.tmodes) > 0:
+                        modes = modes + self.tmodes[i * bands:(i + 1) * bands].tolist()
+                    file.write("%d,%d,%d,%d,%d,%d,%d,%s\n" % \
+                               (self.slice[i],self.row[i],self.column[i],self.offset[i],
+                                self.psize[i],self.qp[i],self.rp[i],",".join(map(str,modes))))
+        finally:
+            file.close()
+
+    def write(self,filename,perslice = False):
+        if filename.lower().endswith(".csv"):
+            self.write_csv(filename,perslice)
+        else:
+            self.write_npz(filename,perslice)
+
+#
+# Decoder buffer model for a constant bit rate channel. The bytes of a
+# frame enter the link at the link rate C, no earlier than the start of
+# the frame, and the decoder removes a precinct at t_k + D, with t_k the
+# time of the first line of the precinct in the raster and D the decoder
+# latency. With A_k the arrival time of the last byte of precinct k,
+# the minimum latency is D = max(A_k - t_k), which equals
+# max(B_k / C - t_k) for a saturated link carrying B_k bytes up to
+# precinct k. The buffer occupancy is evaluated at the latency budget if
+# one is given, otherwise at the running minimum latency. Only precincts
+# not yet removed from the buffer are retained, so the model runs in
+# bounded memory on long streams.
+#
+
+class LatencyModel:
+    def __init__(self, rate, framerate, vtotal = None, budget = None):
+        self.rate      = rate / 8.0
+        self.framerate = framerate
+        self.vtotal    = vtotal
+        self.budget    = budget
+        self.base      = None
+        self.frame     = -1
+        self.newframe  = False
+        self.linetime  = None
+        self.latency   = None
+        self.arrival   = 0.0
+        self.consumed  = 0
+        self.pending   = collections.deque()
+        self.peak      = 0
+        self.precincts = 0
+        self.exceeded  = 0
+        self.flagged   = None
+        self.output    = sys.stdout
+
+    def start_frame(self, offset):
+        if self.base is None:
+            self.base = offset
+        self.frame      = self.frame + 1
+        self.framestart = self.frame / self.framerate
+        self.newframe   = True
+
+    def remove(self, until, start, size):
+        while len(self.pending) > 0 and self.pending[0][0] <= until:
+            removal,previous = self.pending.popleft()
+            arrived = self.consumed + min(max(0.0,(removal - start) * self.rate),size)
+            self.peak = max(self.peak,arrived - previous)
+
+    def add(self, end, line, height):
+        if self.linetime is None:
+            if self.vtotal is None:
+                self.vtotal = height
+            self.linetime = 1.0 / (self.framerate * self.vtotal)
+        total   = end - self.base
+        size    = total - self.consumed
+        start   = self.arrival
+        if self.newframe:
+            start = max(start,self.framestart)
+            self.newframe = False
+        arrival = start + size / self.rate
+        t       = self.framestart + line * self.linetime
+        self.remove(arrival,start,size)
+        if self.budget is not None and arrival - t > self.budget * self.linetime and self.flagged != self.frame:
+            self.flagged  = self.frame
+            self.exceeded = self.exceeded + 1
+            self.output.write("*** latency budget exceeded in frame %d, line %d, offset %d: %.2f lines\n" % \
+                              (self.frame,line,end,(arrival - t) / self.linetime))
+            self.output.flush()
+        if self.latency is None or arrival - t > self.latency:
+            self.latency = arrival - t
+        if self.budget is not None:
+            self.pending.append((t + self.budget * self.linetime,self.consumed))
+        else:
+            self.pending.append((t + self.latency,self.consumed))
+        self.arrival   = arrival
+        self.consumed  = total
+        self.precincts = self.precincts + 1
+
+    def report(self):
+        self.remove(float("inf"),self.arrival,0)
+        print "Link rate          : %.3f Mbit/s" % (self.rate * 8.0 / 1000000.0)
+        print "Frame rate         : %.3f Hz" % self.framerate
+        if self.precincts == 0:
+            print "Precincts          : 0"
+            return
+        print "Lines per frame    : %d" % self.vtotal
+        print "Line time          : %.3f us" % (self.linetime * 1000000.0)
+        print "Frames             : %d" % (self.frame + 1)
+        print "Precincts          : %d" % self.precincts
+        print "Minimum latency    : %.2f lines (%.3f us)" % \
+              (self.latency / self.linetime,self.latency * 1000000.0)
+        if self.budget is not None:
+            print "Latency budget     : %.2f lines, exceeded in %d frames" % (self.budget,self.exceeded)
+            print "Peak buffer        : %d bytes at the latency budget" % self.peak
+        else:
+            print "Peak buffer        : %d bytes" % self.peak
+
+#
+# Parse a run of slices in a worker process. The job carries the state
+# of the codestream parser at the slice, the slice offset in the file and
+# the vertical position of its first precinct row.
+#
+
+def parse_slice_job(job):
+    filename,state,offset,ypos = job
+    file = open(filename,"rb")
+    try:
+        file.seek(offset)
+        jxs = JXSCodestream()
+        jxs.__dict__.update(state)
+        jxs.offset    = offset
+        jxs.ypos      = ypos
+        jxs.datacount = 0
+        jxs.bytecount = 0
+        jxs.bandstats = []
+        if state["ratemap"]:
+            jxs.ratemap = RateMap()
+        else:
+            jxs.ratemap = None
+        error         = None
+        saved         = sys.stdout
+        sys.stdout    = cStringIO.StringIO()
+        try:
+            try:
+                jxs.parse_marker_at(file)
+            except JP2Error, e:
+                error = str(e)
+            log = sys.stdout.getvalue()
+        finally:
+            sys.stdout = saved
+        return (log,error,jxs.nbpp,jxs.inter,jxs.datacount,jxs.bytecount,jxs.bandstats,jxs.ratemap)
+    finally:
+        file.close()
+
+#
+# Monitor a sequence of concatenated codestreams. Frames are located by
+# the Lcod field of the picture header, or by walking the precinct
+# lengths of the slices if Lcod is zero or per-slice rates are requested.
+# One line is printed per frame, limits are checked on the frame, on
+# a sliding window of frames and on each slice.
+#
+
+class NullOutput:
+    def write(self, buffer):
+        pass
+
+    def flush(self):
+        pass
+
+def sequence_parse(file, window = 8, slices = False, latency = None):
+    if latency is not None:
+        slices = True
+    print "%6s %10s %9s %7s %7s %7s %9s %s" % \
+          ("frame","offset","bytes","bpp","winbpp","limit","maxslice","flags")
+    offset  = 0
+    frame   = 0
+    rates   = []
+    peak    = 0.0
+    total   = 0
+    flagged = 0
+    while True:
+        file.seek(offset)
+        if len(file.read(2)) < 2:
+            break
+        file.seek(offset)
+        jxs        = JXSCodestream(offset = offset)
+        jxs.latency = latency
+        flags      = []
+        sizes      = []
+        saved      = sys.stdout
+        sys.stdout = NullOutput()
+        try:
+            try:
+                jxs.parse_headers(file,offset)
+                limit = jxs.sublevel_limit()
+                if slices or jxs.lcod == 0:
+                    sizes = jxs.slice_sizes(file)
+            except JP2Error, e:
+                sys.stdout = saved
+                print "%6d %10d *** %s" % (frame,offset,str(e))
+                break
+        finally:
+            sys.stdout = saved
+        if slices or jxs.lcod == 0:
+            size = jxs.offset - offset
+            if jxs.lcod != 0 and jxs.lcod != size:
+                flags.append("lcod=%d" % jxs.lcod)
+        else:
+            size = jxs.lcod
+            file.seek(offset + size - 2)
+            if file.read(2) != "\xff\x11":
+                flags.append("no EOC at Lcod")
+        bpp   = jxs.bits_per_pixel(size)
+        rates.append(bpp)
+        if len(rates) > window:
+            del rates[0]
+        winbpp = sum(rates) / len(rates)
+        peak   = max(peak,winbpp)
+        maxslice = ""
+        if len(sizes) > 0:
+            lines    = jxs.sliceheight << jxs.vlevels
+            slicebpp = []
+            for i in range(len(sizes)):
+                slicebpp.append(jxs.bits_per_pixel(sizes[i],min(lines,jxs.height - i * lines)))
+            maxslice = "%.3f" % max(slicebpp)
+        if limit is None:
+            limitstr = "-"
+        else:
+            limitstr = "%.1f" % limit
+            if bpp > limit:
+                flags.append("frame")
+            if winbpp > limit:
+                flags.append("window")
+            if len(sizes) > 0 and max(slicebpp) > limit:
+                flags.append("slice")
+        if len(flags) > 0:
+            flagged = flagged + 1
+        print "%6d %10d %9d %7.3f %7.3f %7s %9s %s" % \
+              (frame,offset,size,bpp,winbpp,limitstr,maxslice," ".join(flags))
+        if len(flags) > 0:
+            sys.stdout.flush()
+        total  = total + size
+        offset = offset + size
+        frame  = frame + 1
+    print
+    print "Frames           : %d" % frame
+    print "Total size       : %d bytes" % total
+    print "Peak window rate : %.3f bpp (%d frames)" % (peak,window)
+    print "Flagged frames   : %d" % flagged
+    if latency is not None:
+        print
+        latency.report()
+
+#
 # The Codestream Class
 #
 
@@ -181,6 +1095,20 @@ class JXSCodestream:
         self.nlt         = "None"
         self.extent      = "Unspecified"
         self.boxlist     = BoxList()
+        self.precincts   = None
+        self.bandstats   = []
+        self.filename    = None
+        self.processes   = None
+        self.statistics  = False
+        self.lcod        = 0
+        self.profilekey  = None
+        self.bandmodes   = None
+        self.ratemap     = None
+        self.quiet       = False
+        self.sliceindex  = 0
+        self.latency     = None
+        self.temporalmodes = None
+        self.levelkey    = None
 
     def print_indent(self, buffer, nl = 1):
         print_indent(buffer, self.indent, nl)
@@ -239,512 +1167,29 @@ class JXSCodestream:
             self.load_marker(file,marker)
             self.offset = self.offset + len(self.buffer)
 
+    def profile_key(self):
+        return (self.profile,self.precision,self.sampling,self.vlevels,self.hlevels,
+                self.columnsize,self.sliceheight << self.vlevels,self.colortrafo,
+                self.longhdr,self.rawbyline,self.excluded,self.fractional,
+                self.nlt,self.extent,self.quant,self.precwidth)
+
     def check_profile(self):
-        sliceheight = self.sliceheight << self.vlevels # this is in image lines (grid points)
-        if self.profile == 0x1500: #light 422.10
-            if self.precision != 8 and self.precision != 10:
-                raise JP2Error("Light422.10 only supports 8 and 10 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422":
-                raise JP2Error("Light422.20 only suppors 400 and 422 subsampling")
-            if self.vlevels > 1:
-                raise JP2Error("Light422.10 only supports up to 1 vertical decomposition level")
-            if self.quant != "deadzone":
-                raise JP2Error("Light422.10 only supports the deadzone quantizer")
-            if self.columnsize != 0:
-                raise JP2Error("Light422.10 does not support columns")
-            if sliceheight != 16:
-                raise JP2Error("Light422.10 only supports slices of 16 grid points")
-            if self.colortrafo != "None":
-                raise JP2Error("Light422.10 does not support any color decorrelation transformation")
-            if self.longhdr != 0:
-                raise JP2Error("Light422.10 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("Light422.10 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("Light422.10 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("Light422.10 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("Light422.10 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("Light422.10 does not support the CDT marker")
-            self.nbpp = 20
-        elif self.profile == 0x1a00: #light 444.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("Light444.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444":
-                raise JP2Error("Light444.12 only supports 400, 422 and 444 subsampling")
-            if self.vlevels > 1:
-                raise JP2Error("Light444.12 only supports up to 1 vertical decomposition level")
-            if self.quant != "deadzone":
-                raise JP2Error("Light444.12 only supports the deadzone quantizer")
-            if self.columnsize != 0:
-                raise JP2Error("Light444.12 does not support columns")
-            if sliceheight != 16:
-                raise JP2Error("Light444.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("Light444.12 only supports the RCT or no color transformation")
-            if self.longhdr != 0:
-                raise JP2Error("Light444.12 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("Light444.12 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("Light444.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("Light444.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("Light444.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("Light422.12 does not support the CDT marker")
-            self.nbpp = 36
-        elif self.profile == 0x2500: #light subline 422.10
-            if self.precision != 8 and self.precision != 10:
-                raise JP2Error("Light subline 422.10 only supports 8 and 10 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422":
-                raise JP2Error("Light subline 422.10 only supports 400 and 444 subsampling")
-            if self.vlevels > 0:
-                raise JP2Error("Light subline 422.10 only supports 0 vertical decomposition levels")
-            if self.precwidth > 2048:
-                raise JP2Error("Light subline 422.10 allows precincts to be at most 2048 grid points large")
-            if self.colortrafo != "None":
-                raise JP2Error("Light subline 422.10 does not support any color decorrelation transformation")
-            if self.longhdr != 0:
-                raise JP2Error("Light subline 422.10 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("Light subline 422.10 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("Light subline 422.10 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("Light subline 422.10 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("Light subline 422.10 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("Light subline 422.10 does not support the CDT marker")
-            self.nbpp = 20
-        elif self.profile == 0x3240: #main 420.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("Main420.10 only supports 8 and 10 bit sample precision")
-            if self.sampling != "420":
-                raise JP2Error("Main420.10 only supports 420 subsampling")
-            if self.vlevels > 1:
-                raise JP2Error("Main420.10 only supports up to 1 vertical decomposition level")
-            if self.columnsize != 0 and self.vlevels > 0:
-                raise JP2Error("Main420.10 only supports columns for 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("Main420.10 only supports slices of 16 grid points")
-            if self.colortrafo != "None":
-                raise JP2Error("Main420.10 does not support any color decorrelation transformation")
-            if self.longhdr != 0:
-                raise JP2Error("Main420.10 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("Main420.10 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("Main420.10 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("Main420.10 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("Main420.10 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("Main420.10 does not support the CDT marker")
-            self.nbpp = 20
-        elif self.profile == 0x3540: #main 422.10
-            if self.precision != 8 and self.precision != 10:
-                raise JP2Error("Main 422.10 only supports 8 and 10 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422":
-                raise JP2Error("Main422.10 only supports 400 and 444 subsampling")
-            if self.vlevels > 1:
-                raise JP2Error("Main422.10 only supports up to 1 vertical decomposition level")
-            if self.columnsize != 0 and self.vlevels > 0:
-                raise JP2Error("Main422.10 only supports columns for 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("Main422.10 only supports slices of 16 grid points")
-            if self.colortrafo != "None":
-                raise JP2Error("Main422.10 does not support any color decorrelation transformation")
-            if self.longhdr != 0:
-                raise JP2Error("Main422.10 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("Main422.10 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("Main422.10 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("Main422.10 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("Main422.10 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("Main422.10 does not support the CDT marker")
-            self.nbpp = 20
-        elif self.profile == 0x3a40: #main 444.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("Main444.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444":
-                raise JP2Error("Main444.12 only supports 400, 422 and 444 subsampling")
-            if self.vlevels > 1:
-                raise JP2Error("Main444.12 only supports up to 1 vertical decomposition level")
-            if self.columnsize != 0 and self.vlevels > 0:
-                raise JP2Error("Main444.10 only supports columns for 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("Main444.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("Main444.12 only supports RCT or no color transformation")
-            if self.longhdr != 0:
-                raise JP2Error("Main444.12 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("Main444.12 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("Main444.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("Main444.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("Main444.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("Main444.12 does not support the CDT marker")
-            self.nbpp = 36
-        elif self.profile == 0x3e40: #main 4444.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("Main4444.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444" and self.sampling != "4224" and self.sampling != "4444":
-                raise JP2Error("Main4444.12 only supports 400, 422, 444, 4224 and 4444 subsampling")
-            if self.vlevels > 1:
-                raise JP2Error("Main4444.12 only supports up to 1 vertical decomposition level")
-            if self.columnsize != 0 and self.vlevels > 0:
-                raise JP2Error("Main4444.12 only supports columns for 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("Main4444.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("Main4444.12 only supports RCT or no color transformation")
-            if self.longhdr != 0:
-                raise JP2Error("Main4444.12 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("Main4444.12 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("Main4444.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("Main4444.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("Main4444.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("Main4444.12 does not support the CDT marker")
-            self.nbpp = 48
-        elif self.profile == 0x4240: #high 420.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("High420.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "420":
-                raise JP2Error("High420.12 only supports 420 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("High420.12 only supports up to 2 vertical decomposition levels")
-            if self.vlevels == 0:
-                raise JP2Error("High420.12 does not support 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("High420.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None":
-                raise JP2Error("High420.12 does not allow any color transformation")
-            if self.longhdr != 0:
-                raise JP2Error("High420.12 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("High420.12 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("High420.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("High420.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("High420.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("High420.12 does not support the CDT marker")
-            self.nbpp = 18
-        elif self.profile == 0x4a40: #high 444.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("High444.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444":
-                raise JP2Error("High444.12 only supports 400, 422 and 444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("High444.12 only supports up to 2 vertical decomposition levels")
-            if self.columnsize != 0 and self.vlevels > 0:
-                raise JP2Error("High444.12 only supports columns for 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("High444.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("High444.12 only supports RCT or no color transformation")
-            if self.longhdr != 0:
-                raise JP2Error("High444.12 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("High444.12 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("High444.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("High444.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("High444.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("High444.12 does not support the CDT marker")
-            self.nbpp = 36
-        elif self.profile == 0x4e40: #high 4444.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("High4444.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444" and self.sampling != "4224" and self.sampling != "4444":
-                raise JP2Error("High4444.12 only supports 400, 422, 444, 4224 and 4444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("High4444.12 only supports up to 2 vertical decomposition levels")
-            if self.columnsize != 0 and self.vlevels > 0:
-                raise JP2Error("High4444.12 only supports columns for 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("High4444.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("High4444.12 only supports RCT or no color transformation")
-            if self.longhdr != 0:
-                raise JP2Error("High4444.12 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("High4444.12 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("High4444.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("High4444.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("High4444.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("High4444.12 does not support the CDT marker")
-            self.nbpp = 48
-        elif self.profile == 0x6ec0: #MLS 12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("MLS.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "420" and self.sampling != "422" and self.sampling != "444" and self.sampling != "4224" and self.sampling != "4444":
-                raise JP2Error("MLS.12 only supports 400, 420, 422, 444, 4224 and 4444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("MLS.12 only supports up to 2 vertical decomposition levels")
-            if self.columnsize != 0 and self.vlevels > 0:
-                raise JP2Error("MLS.12 only supports columns for 0 vertical levels")
-            if sliceheight != 16:
-                raise JP2Error("MLS.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("MLS.12 only supports RCT or no color transformation")
-            if self.longhdr != 0:
-                raise JP2Error("MLS.12 does not support the long header mode switch")
-            if self.rawbyline != 0:
-                raise JP2Error("MLS.12 does not support the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("MLS.12 does not support excluding components from the transformation")
-            if self.fractional != 0:
-                raise JP2Error("MLS.12 requires 0 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("MLS.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("MLS.12 does not support the CDT marker")
-            self.nbpp = 64 # there is not really a limit
-        elif self.profile == 0x9300: #LightBayer
-            if self.precision != 10 and self.precision != 12 and self.precision != 14 and self.precision != 16:
-                raise JP2Error("LightBayer only supports 10,12,14 and 16 bit sample precision")
-            if self.sampling != "4444":
-                raise JP2Error("LightBayer only supports 4444 subsampling")
-            if self.vlevels > 0:
-                raise JP2Error("LightBayer does not support vertical decomposition")
-            if self.columnsize != 0:
-                raise JP2Error("LightBayer does not support colums")
-            if sliceheight != 16:
-                raise JP2Error("LightBayer only supports slices of 16 grid points")
-            if self.colortrafo != "Star-Tetrix":
-                raise JP2Error("LightBayer only supports the Star-Tetrix color transformation")
-            if self.excluded != 1:
-                raise JP2Error("LightBayer requires one component to be excluded from the transformation")
-            if self.rawbyline != 1:
-                raise JP2Error("LightBayer requires the raw-mode per packet switch")
-            if self.fractional != 6 and self.nlt != "None":
-                raise JP2Error("LightBayer requires 6 fractional bits if a non-linear transform is present")
-            if self.fractional != 8 and self.nlt == "None":
-                raise JP2Error("LightBayer requires 8 fractional bits without a non-linear transform")
-            if self.extent != "in-line":
-                raise JP2Error("LightBayer only supports the in-line Star-Tetrix transformation")
-            self.nbpp = 64
-        elif self.profile == 0xb340: #MainBayer
-            if self.precision != 10 and self.precision != 12 and self.precision != 14 and self.precision != 16:
-                raise JP2Error("MainBayer only supports 10,12,14 and 16 bit sample precision")
-            if self.sampling != "4444":
-                raise JP2Error("MainBayer only supports 4444 subsampling")
-            if self.vlevels > 1:
-                raise JP2Error("MainBayer only supports 0 or 1 vertical decompositions")
-            if self.columnsize != 0:
-                raise JP2Error("MainBayer does not support colums")
-            if sliceheight != 16:
-                raise JP2Error("MainBayer only supports slices of 16 grid points")
-            if self.colortrafo != "Star-Tetrix":
-                raise JP2Error("MainBayer only supports the Star-Tetrix color transformation")
-            if self.excluded != 1:
-                raise JP2Error("MainBayer requires one component to be excluded from the transformation")
-            if self.rawbyline != 1:
-                raise JP2Error("MainBayer requires the raw-mode per packet switch")
-            if self.fractional != 6 and self.nlt != "None":
-                raise JP2Error("MainBayer requires 6 fractional bits if a non-linear transform is present")
-            if self.fractional != 8 and self.nlt == "None":
-                raise JP2Error("MainBayer requires 8 fractional bits without a non-linear transform")
-            self.nbpp = 64
-        elif self.profile == 0xc340: #HighBayer
-            if self.precision != 10 and self.precision != 12 and self.precision != 14 and self.precision != 16:
-                raise JP2Error("HighBayer only supports 10,12,14 and 16 bit sample precision")
-            if self.sampling != "4444":
-                raise JP2Error("HighBayer only supports 4444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("HighBayer does not support more than 2 vertical decompositions")
-            if self.columnsize != 0:
-                raise JP2Error("HighBayer does not support colums")
-            if sliceheight != 16:
-                raise JP2Error("HighBayer only supports slices of 16 grid points")
-            if self.colortrafo != "Star-Tetrix":
-                raise JP2Error("HighBayer only supports the Star-Tetrix color transformation")
-            if self.excluded != 1:
-                raise JP2Error("HighBayer requires one component to be excluded from the transformation")
-            if self.rawbyline != 1:
-                raise JP2Error("HighBayer requires the raw-mode per packet switch")
-            if self.fractional != 6 and self.nlt != "None":
-                raise JP2Error("HighBayer requires 6 fractional bits if a non-linear transform is present")
-            if self.fractional != 8 and self.nlt == "None":
-                raise JP2Error("HighBayer requires 8 fractional bits without a non-linear transform")
-            self.nbpp = 64
-        elif self.profile == 0x4a44: # CHigh
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("CHigh only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444":
-                raise JP2Error("CHigh only supports 400, 422 and 444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("CHigh only supports up to 2 vertical decomposition levels")
-            if self.vlevels == 0 and self.hlevels != 3 and self.hlevels != 4:
-                raise JP2Error("CHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 0 and self.sampling == "420":
-                raise JP2Error("CHigh does not support 0 vertical levels for 420 subsampling")
-            if self.vlevels == 1 and self.hlevels != 4 and self.hlevels != 5:
-                raise JP2Error("CHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 2 and self.hlevels != 5:
-                raise JP2Error("CHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.columnsize != 0:
-                raise JP2Error("CHigh does not support columns")
-            if sliceheight != 16:
-                raise JP2Error("CHigh only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("CHigh only supports RCT or no color transformation")
-            if self.colortrafo == "RCT" and self.sampling != "444":
-                raise JP2Error("CHigh only supports RCT for 444 sampling")
-            if self.longhdr != 0:
-                raise JP2Error("CHigh does not support the long header mode switch")
-            if self.rawbyline != 1:
-                raise JP2Error("CHigh requires the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("CHigh does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("CHigh requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("CHigh does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("CHigh does not support the CDT marker")
-            self.nbpp = 36
-        elif self.profile == 0x4a4c: # EHigh
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("EHigh only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444":
-                raise JP2Error("EHigh only supports 400, 422 and 444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("EHigh only supports up to 2 vertical decomposition levels")
-            if self.vlevels == 0 and self.hlevels != 3 and self.hlevels != 4:
-                raise JP2Error("EHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 0 and self.sampling == "420":
-                raise JP2Error("EHigh does not support 0 vertical levels for 420 subsampling")
-            if self.vlevels == 1 and self.hlevels != 4 and self.hlevels != 5:
-                raise JP2Error("EHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 2 and self.hlevels != 5:
-                raise JP2Error("EHigh only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.columnsize != 0:
-                raise JP2Error("EHigh does not support columns")
-            if sliceheight != 16:
-                raise JP2Error("EHigh only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("EHigh only supports RCT or no color transformation")
-            if self.colortrafo == "RCT" and self.sampling != "444":
-                raise JP2Error("EHigh only supports RCT for 444 sampling")
-            if self.longhdr != 0:
-                raise JP2Error("EHigh does not support the long header mode switch")
-            if self.rawbyline != 1:
-                raise JP2Error("EHigh requires the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("EHigh does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("EHigh requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("EHigh does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("EHigh does not support the CDT marker")
-            self.nbpp = 36
-        elif self.profile == 0x4a45: # TDC 444.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("TDC444.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444":
-                raise JP2Error("TDC444.12 only supports 400, 422 and 444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("TDC444.12 only supports up to 2 vertical decomposition levels")
-            if self.vlevels == 0 and self.hlevels != 3 and self.hlevels != 4:
-                raise JP2Error("TDC444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 0 and self.sampling == "420":
-                raise JP2Error("TDC444.12 does not support 0 vertical levels for 420 subsampling")
-            if self.vlevels == 1 and self.hlevels != 4 and self.hlevels != 5:
-                raise JP2Error("TDC444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 2 and self.hlevels != 5:
-                raise JP2Error("TDC444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.columnsize != 0:
-                raise JP2Error("TDC444.12 does not support columns")
-            if sliceheight != 16:
-                raise JP2Error("TDC444.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("TDC444.12 only supports RCT or no color transformation")
-            if self.colortrafo == "RCT" and self.sampling != "444":
-                raise JP2Error("TDC444.12 only supports RCT for 444 sampling")
-            if self.longhdr != 0:
-                raise JP2Error("TDC444.12 does not support the long header mode switch")
-            if self.rawbyline != 1:
-                raise JP2Error("TDC444.12 requires the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("TDC444.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("TDC444.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("TDC444.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("TDC444.12 does not support the CDT marker")
-            self.nbpp = 36
-        elif self.profile == 0x6a45: # TDC MLS 444.12
-            if self.precision != 8 and self.precision != 10 and self.precision != 12:
-                raise JP2Error("TDC MLS 444.12 only supports 8,10 and 12 bit sample precision")
-            if self.sampling != "400" and self.sampling != "422" and self.sampling != "444":
-                raise JP2Error("TDC MLS 444.12 only supports 400, 422 and 444 subsampling")
-            if self.vlevels > 2:
-                raise JP2Error("TDC MLS 444.12 only supports up to 2 vertical decomposition levels")
-            if self.vlevels == 0 and self.hlevels != 3 and self.hlevels != 4:
-                raise JP2Error("TDC MLS 444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 0 and self.sampling == "420":
-                raise JP2Error("TDC MLS 444.12 does not support 0 vertical levels for 420 subsampling")
-            if self.vlevels == 1 and self.hlevels != 4 and self.hlevels != 5:
-                raise JP2Error("TDC MLS 444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.vlevels == 2 and self.hlevels != 5:
-                raise JP2Error("TDC MLS 444.12 only supports (3,0),(4,0),(4,1),(5,1),(5,2) as wavelet decompositions")
-            if self.columnsize != 0:
-                raise JP2Error("TDC MLS 444.12 does not support columns")
-            if sliceheight != 16:
-                raise JP2Error("TDC MLS 444.12 only supports slices of 16 grid points")
-            if self.colortrafo != "None" and self.colortrafo != "RCT":
-                raise JP2Error("TDC MLS 444.12 only supports RCT or no color transformation")
-            if self.colortrafo == "RCT" and self.sampling != "444":
-                raise JP2Error("TDC MLS 444.12 only supports RCT for 444 sampling")
-            if self.longhdr != 0:
-                raise JP2Error("TDC MLS 444.12 does not support the long header mode switch")
-            if self.rawbyline != 1:
-                raise JP2Error("TDC MLS 444.12 requires the raw mode by line switch")
-            if self.excluded != 0:
-                raise JP2Error("TDC MLS 444.12 does not support excluding components from the transformation")
-            if self.fractional != 8:
-                raise JP2Error("TDC MLS 444.12 requires 8 fractional bits")
-            if self.nlt != "None":
-                raise JP2Error("TDC MLS 444.12 does not support non-linear transforms")
-            if self.extent != "Unspecified":
-                raise JP2Error("TDC MLS 444.12 does not support the CDT marker")
-            self.nbpp = 36
-        elif self.profile != 0x0000:
-            raise JP2Error("invalid profile indicator %s" % self.profile)
-            
+        key = self.profile_key()
+        if key == self.profilekey:
+            return
+        if not profile_cache.has_key(key):
+            profile_cache[key] = evaluate_profile(dict(zip(profile_fields,key)))
+        nbpp,error = profile_cache[key]
+        if error is not None:
+            raise JP2Error(error)
+        if nbpp is not None:
+            self.nbpp = nbpp
+        self.profilekey = key
+
     def check_level(self):
+        key   = (self.level,self.width,self.height)
+        if key == self.levelkey:
+            return
         level = (self.level >> 8) & 0xfc # the rest is the sublevel and frame buffer level
         if level == 0x04: #1k-1 level
             if self.width > 1280 or self.height > 5120 or self.width * self.height > 2621440:
@@ -775,35 +1220,43 @@ class JXSCodestream:
                 raise JP2Error("image is too large for 10K-1 level")
         elif level != 0x00:
             raise JP2Error("invalid level specification")
+        self.levelkey = key
 
-    def check_sublevel(self,bytecount):
+    def sublevel_limit(self):
         sublevel = self.level & 0xff
-        bpp      = 8.0 * bytecount / (self.width * self.height)
-        if self.colortrafo == "Star-Tetrix":
-            bpp = bpp / 4.0
         if sublevel == 0x80: # full
-            if bpp > self.nbpp:
-                raise JP2Error("bitrate exceeds maximum permissible bitrate of %d for full sublevel" % self.nbpp)
+            return self.nbpp
         elif sublevel == 0x10: # 12bpp
-            if bpp > 12.0:
-                raise JP2Error("bitrate exceeds 12bpp for 12bpp sublevel")
+            return 12.0
         elif sublevel == 0x0c: # 9bpp
-            if bpp > 9.0:
-                raise JP2Error("bitrate exceeds 9bpp for 9bpp sublevel")
+            return 9.0
         elif sublevel == 0x08: #6bpp
-            if bpp > 6.0:
-                raise JP2Error("bitrate exceeds 6bpp for 6bpp sublevel")
+            return 6.0
         elif sublevel == 0x06: #4bpp
-            if bpp > 4.0:
-                raise JP2Error("bitrate exceeds 4bpp for 4bpp sublevel")
+            return 4.0
         elif sublevel == 0x04: #3bpp
-            if bpp > 3.0:
-                raise JP2Error("bitrate exceeds 3bpp for 3bpp sublevel")
+            return 3.0
         elif sublevel == 0x03: #2bpp
-            if bpp > 2.0:
-                raise JP2Error("bitrate exceeds 2bpp for 2bpp sublevel")
+            return 2.0
         elif sublevel != 0x00:
-                raise JP2Error("invalid sublevel specification")
+            raise JP2Error("invalid sublevel specification")
+        return None
+
+    def bits_per_pixel(self,bytecount,lines = None):
+        if lines is None:
+            lines = self.height
+        bpp = 8.0 * bytecount / (self.width * lines)
+        if self.colortrafo == "Star-Tetrix":
+            bpp = bpp / 4.0
+        return bpp
+
+    def check_sublevel(self,bytecount):
+        limit = self.sublevel_limit()
+        if limit is not None and self.bits_per_pixel(bytecount) > limit:
+            if (self.level & 0xff) == 0x80:
+                raise JP2Error("bitrate exceeds maximum permissible bitrate of %d for full sublevel" % self.nbpp)
+            raise JP2Error("bitrate exceeds %dbpp for %dbpp sublevel" % (limit,limit))
+        return limit
         
     def parse_PIH(self):
         self.new_marker("PIH", "Picture header")
@@ -863,6 +1316,7 @@ class JXSCodestream:
             progression = "resolution-line-band-component"
         else:
             progression = "invalid (%s)" % ppoc
+        self.lcod        = lcod
         self.print_indent("Size of the codestream    : %s" % lcod)
         self.print_indent("Profile                   : %s" % decode_Profile(ppih))
         self.print_indent("Level                     : %s" % decode_Level(plev))
@@ -1133,7 +1587,8 @@ class JXSCodestream:
         self.new_marker("SLC","Slice Header")
         if len(self.buffer) != 2 + 4:
             raise InvalidSizedMarker("Size of the SLC marker shall be 4 bytes")
-        self.print_indent("Slice index : %s" % ordw(self.buffer[4:6]))
+        self.sliceindex = ordw(self.buffer[4:6])
+        self.print_indent("Slice index : %s" % self.sliceindex)
         self.inter = False
         self.check_profile()
         self.check_level()
@@ -1152,7 +1607,8 @@ class JXSCodestream:
         self.new_marker("SLI","TDC enabled Slice Header")
         if len(self.buffer) != 2 + 4:
             raise InvalidSizedMarker("Size of the SLI marker shall be 4 bytes")
-        self.print_indent("Slice index : %s" % ordw(self.buffer[4:6]))
+        self.sliceindex = ordw(self.buffer[4:6])
+        self.print_indent("Slice index : %s" % self.sliceindex)
         self.inter = True
         self.check_profile()
         self.check_level()
@@ -1165,51 +1621,56 @@ class JXSCodestream:
         else:
             bytesize = (24 + 8 + 8 + 2 * self.bandcount + 7) >> 3
             title    = "Precinct"
-        self.print_indent("%-8s: %s (%s,%s)" % (self.offset,title,px,py))
+        if not self.quiet:
+            self.print_indent("%-8s: %s (%s,%s)" % (self.offset,title,px,py))
         self.indent  = self.indent + 1
         header       = file.read(bytesize)
         self.offset  = self.offset + bytesize
         psize        = (ord(header[0:1]) << 16) + (ord(header[1:2]) << 8) + (ord(header[2:3]) << 0)
         qp           = ord(header[3:4])
         rp           = ord(header[4:5])
-        self.print_indent("Data length   : %s bytes" %  psize)
-        self.print_indent("Quantization  : %s" % qp)
-        self.print_indent("Refinement    : %s" % rp)
+        if not self.quiet:
+            self.print_indent("Data length   : %s bytes" %  psize)
+            self.print_indent("Quantization  : %s" % qp)
+            self.print_indent("Refinement    : %s" % rp)
         self.pos     = 5
         if self.inter:
             fbqp     = ord(header[5:6])
             fbrp     = ord(header[6:7])
             self.pos = 7
-            self.print_indent("Frame Buffer Quantization  : %s" % fbqp)
-            self.print_indent("Frame Buffer Refinement    : %s" % fbrp)
-        for b in range(self.bandcount):
-            offset = (b >> 2) + self.pos
-            mode = (ord(header[offset:offset + 1]) >> (6 - ((b & 0x03) << 1))) & 0x03
-            if mode == 0:
-                modestr = "no prediction, no sigflags"
-            elif mode == 1:
-                modestr = "vertical prediction, no sigflags"
-            elif mode == 2:
-                modestr = "no prediction, sigflags"
-            elif mode == 3:
-                modestr = "vertical prediction, sigflags"
-            self.print_indent("Band %3s mode : %s" % (b,modestr))
+            if not self.quiet:
+                self.print_indent("Frame Buffer Quantization  : %s" % fbqp)
+                self.print_indent("Frame Buffer Refinement    : %s" % fbrp)
         if self.inter:
-            for b in range(self.bandcount):
-                bi = b + self.bandcount
-                offset = (bi >> 2) + self.pos
-                mode = (ord(header[offset:offset + 1]) >> (6 - ((bi & 0x03) << 1))) & 0x03
-                if mode == 0:
-                    modestr = "intra"
-                elif mode == 2:
-                    modestr = "inter band"
-                elif mode == 3:
-                    modestr = "inter flags"
-                elif mode == 1:
-                    modestr = "refresh band"
-                self.print_indent("Band %3s temporal mode : %s" % (b,modestr))
-        file.read(psize)
-        print
+            modes = decode_band_modes(header[self.pos:],2 * self.bandcount)
+            self.temporalmodes = modes[self.bandcount:]
+        else:
+            modes = decode_band_modes(header[self.pos:],self.bandcount)
+            self.temporalmodes = None
+        self.bandmodes = modes[:self.bandcount]
+        while len(self.bandstats) < len(self.bandmodes):
+            self.bandstats.append([0,0,0,0])
+        for b in range(len(self.bandmodes)):
+            self.bandstats[b][self.bandmodes[b]] += 1
+        if not self.quiet:
+            prefix = "  " * self.indent
+            lines  = []
+            for b in range(len(self.bandmodes)):
+                lines.append("%sBand %3s mode : %s\n" % (prefix,b,band_mode_names[self.bandmodes[b]]))
+            if self.inter:
+                for b in range(len(self.temporalmodes)):
+                    lines.append("%sBand %3s temporal mode : %s\n" % (prefix,b,temporal_mode_names[self.temporalmodes[b]]))
+            sys.stdout.write("".join(lines))
+        if self.ratemap is not None:
+            self.ratemap.add(self.sliceindex,py,px / self.precwidth,self.offset,psize,qp,rp,
+                             self.bandmodes,self.temporalmodes)
+        if self.precincts is not None:
+            self.precincts.append((self.offset,psize))
+        if self.latency is not None:
+            self.latency.add(self.offset + psize,self.ypos,self.height)
+        skip_bytes(file,psize)
+        if not self.quiet:
+            print
         self.offset    = self.offset + psize
         self.datacount = self.datacount + psize
         self.bytecount = self.bytecount + psize + bytesize
@@ -1222,56 +1683,170 @@ class JXSCodestream:
                     self.parse_Precinct(file,px,self.ypos / self.precheight)
             self.ypos = self.ypos + self.precheight
 
+    def parse_marker(self, file):
+        if ordw(self.buffer) == 0xff10:
+            self.new_marker("SOC","Start of Codestream");
+            self.end_marker()
+        elif ordw(self.buffer) == 0xff12:
+            self.parse_PIH()
+        elif ordw(self.buffer) == 0xff13:
+            self.parse_CDT()
+        elif ordw(self.buffer) == 0xff14:
+            self.parse_WGT()
+        elif ordw(self.buffer) == 0xff1b:
+            self.parse_WGI()
+        elif ordw(self.buffer) == 0xff15:
+            self.parse_COM()
+        elif ordw(self.buffer) == 0xff16:
+            self.parse_NLT()
+        elif ordw(self.buffer) == 0xff17:
+            self.parse_CWD()
+        elif ordw(self.buffer) == 0xff18:
+            self.parse_CTS()
+        elif ordw(self.buffer) == 0xff19:
+            self.parse_CRG()
+        elif ordw(self.buffer) == 0xff1a:
+            self.parse_TPC()
+        elif ordw(self.buffer) == 0xff20:
+            self.parse_SLC()
+            self.parse_Slice(file)
+        elif ordw(self.buffer) == 0xff21:
+            self.parse_SLI()
+            self.parse_Slice(file)
+        elif ordw(self.buffer) == 0xff25:
+            self.parse_SYN()
+        elif ordw(self.buffer) == 0xff50:
+            self.parse_CAP()
+        else:
+            self.new_marker("???","Unknown marker %04x" % ordw(self.buffer))
+            if len(self.buffer) < 256:
+                print_hex(self.buffer)
+            self.end_marker()
+
+    def parse_marker_at(self, file):
+        self.load_buffer(file)
+        self.parse_marker(file)
+
+    def index_Slices(self, file):
+        jobs  = []
+        count = self.bytecount - len(self.buffer)
+        while len(self.buffer) >= 2 and (ordw(self.buffer) == 0xff20 or ordw(self.buffer) == 0xff21):
+            jobs.append((self.markerpos,self.ypos))
+            if ordw(self.buffer) == 0xff21:
+                bytesize = (24 + 8 + 8 + 8 + 8 + 4 * self.bandcount + 7) >> 3
+            else:
+                bytesize = (24 + 8 + 8 + 2 * self.bandcount + 7) >> 3
+            for py in range(self.sliceheight):
+                if self.ypos < self.height:
+                    for px in range(0,self.width,self.precwidth):
+                        header = file.read(3)
+                        if len(header) != 3:
+                            raise UnexpectedEOC()
+                        psize  = (ord(header[0:1]) << 16) + (ord(header[1:2]) << 8) + (ord(header[2:3]) << 0)
+                        skip_bytes(file,bytesize - 3 + psize)
+                        self.offset = self.offset + bytesize + psize
+                        if self.latency is not None:
+                            self.latency.add(self.offset,self.ypos,self.height)
+                self.ypos = self.ypos + self.precheight
+            self.load_buffer(file)
+        self.bytecount = count + len(self.buffer)
+        return jobs
+
+    def parse_Slices(self, file):
+        state = dict()
+        for key,value in self.__dict__.items():
+            if key not in ("boxlist","buffer","precincts","bandstats","ratemap","latency"):
+                state[key] = value
+        # Only whether to collect one, each job returns its own rows
+        state["ratemap"] = self.ratemap is not None
+        jobs = []
+        for offset,ypos in self.index_Slices(file):
+            jobs.append((self.filename,state,offset,ypos))
+        if self.processes == 1 or len(jobs) <= 1:
+            results = map(parse_slice_job,jobs)
+        else:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                results = pool.map(parse_slice_job,jobs)
+            finally:
+                pool.close()
+                pool.join()
+        for log,error,nbpp,inter,datacount,bytecount,bandstats,ratemap in results:
+            sys.stdout.write(log)
+            if ratemap is not None:
+                self.ratemap.extend(ratemap)
+            if error is not None:
+                raise JP2Error(error)
+            self.nbpp      = nbpp
+            self.inter     = inter
+            self.datacount = self.datacount + datacount
+            self.bytecount = self.bytecount + bytecount
+            for b in range(len(bandstats)):
+                if b >= len(self.bandstats):
+                    self.bandstats.append([0,0,0,0])
+                for mode in range(4):
+                    self.bandstats[b][mode] += bandstats[b][mode]
+
+    def print_bandstats(self):
+        self.print_indent("Band mode statistics (precincts per mode):")
+        self.print_indent("Band   no pred  vertical  sigflags  vertical+sigflags")
+        for b in range(len(self.bandstats)):
+            stats = self.bandstats[b]
+            self.print_indent("%4d  %8d  %8d  %8d  %8d" % (b,stats[0],stats[1],stats[2],stats[3]))
+        print
+
+    def parse_headers(self, file, startpos):
+        self.pos       = 0
+        self.datacount = 0
+        self.bytecount = 0
+        self.offset    = startpos
+
+        if self.latency is not None:
+            self.latency.start_frame(startpos)
+        self.load_buffer(file)
+        if len(self.buffer) < 2 or ordw(self.buffer) != 0xff10:
+            raise RequiredMarkerMissing("SOI marker missing")
+        while len(self.buffer) >= 2 and ordw(self.buffer) != 0xff11:
+            if ordw(self.buffer) == 0xff20 or ordw(self.buffer) == 0xff21:
+                self.check_profile()
+                self.check_level()
+                return
+            self.parse_marker(file)
+            self.load_buffer(file)
+
+    def slice_sizes(self, file):
+        sizes = []
+        while len(self.buffer) >= 2 and ordw(self.buffer) != 0xff11:
+            if ordw(self.buffer) == 0xff20 or ordw(self.buffer) == 0xff21:
+                starts = [start for start,ypos in self.index_Slices(file)]
+                starts.append(self.markerpos)
+                for i in range(len(starts) - 1):
+                    sizes.append(starts[i + 1] - starts[i])
+                continue
+            self.parse_marker(file)
+            self.load_buffer(file)
+        if len(self.buffer) < 2:
+            raise UnexpectedEOC()
+        return sizes
+
     def stream_parse(self, file, startpos):
         self.pos       = 0
         self.datacount = 0
         self.bytecount = 0
         self.offset    = startpos
 
+        if self.latency is not None:
+            self.latency.start_frame(startpos)
         self.load_buffer(file)
         if ordw(self.buffer) != 0xff10:
             raise RequiredMarkerMissing("SOI marker missing")
 
                 
         while len(self.buffer) >= 2 and ordw(self.buffer) != 0xff11:
-            if ordw(self.buffer) == 0xff10:
-                self.new_marker("SOC","Start of Codestream");
-                self.end_marker()
-            elif ordw(self.buffer) == 0xff12:
-                self.parse_PIH()
-            elif ordw(self.buffer) == 0xff13:
-                self.parse_CDT()
-            elif ordw(self.buffer) == 0xff14:
-                self.parse_WGT()
-            elif ordw(self.buffer) == 0xff1b:
-                self.parse_WGI()
-            elif ordw(self.buffer) == 0xff15:
-                self.parse_COM()
-            elif ordw(self.buffer) == 0xff16:
-                self.parse_NLT()
-            elif ordw(self.buffer) == 0xff17:
-                self.parse_CWD()
-            elif ordw(self.buffer) == 0xff18:
-                self.parse_CTS()
-            elif ordw(self.buffer) == 0xff19:
-                self.parse_CRG()
-            elif ordw(self.buffer) == 0xff1a:
-                self.parse_TPC()
-            elif ordw(self.buffer) == 0xff20:
-                self.parse_SLC()
-                self.parse_Slice(file)
-            elif ordw(self.buffer) == 0xff21:
-                self.parse_SLI()
-                self.parse_Slice(file)
-            elif ordw(self.buffer) == 0xff25:
-                self.parse_SYN()
-            elif ordw(self.buffer) == 0xff50:
-                self.parse_CAP()
-            else:
-                self.new_marker("???","Unknown marker %04x" % marker)
-                if len(self.buffer) < 256:
-                    print_hex(self.buffer)
-                self.end_marker()
+            if self.filename is not None and (ordw(self.buffer) == 0xff20 or ordw(self.buffer) == 0xff21):
+                self.parse_Slices(file)
+                continue
+            self.parse_marker(file)
             self.load_buffer(file)
 
         if len(self.buffer) >= 2:
@@ -1282,6 +1857,12 @@ class JXSCodestream:
         self.print_indent("Size      : %d bytes" % (self.bytecount))
         self.print_indent("Data Size : %d bytes" % (self.datacount))
         self.print_indent("Overhead  : %d bytes (%d%%)" % (oh, 100 * oh / self.bytecount))
+        if self.statistics:
+            print
+            self.print_bandstats()
+        if self.ratemap is not None:
+            self.ratemap.rows    = (self.height + self.precheight - 1) / self.precheight
+            self.ratemap.columns = (self.width + self.precwidth - 1) / self.precwidth
 
 
 #
@@ -1290,8 +1871,65 @@ class JXSCodestream:
 
 if __name__ == "__main__":
     # Read Arguments
-    if len(sys.argv) != 2:
-        print "Usage: %s FILE" % (sys.argv[0])
+    (args, files) = getopt.getopt(sys.argv[1:], "j:sfw:Sr:aqL:F:V:B:", ["jobs=", "statistics", "frames", "window=", "slices",
+                                                                       "ratemap=", "aggregate", "quiet", "linkrate=",
+                                                                       "framerate=", "vtotal=", "budget="])
+    processes  = None
+    parallel   = False
+    statistics = False
+    sequence   = False
+    window     = 8
+    slices     = False
+    ratemap    = None
+    perslice   = False
+    quiet      = False
+    linkrate   = None
+    framerate  = 60.0
+    vtotal     = None
+    budget     = None
+    for (o, a) in args:
+        if o in ("-j", "--jobs"):
+            processes = int(a) or None
+            parallel  = True
+        elif o in ("-s", "--statistics"):
+            statistics = True
+        elif o in ("-f", "--frames"):
+            sequence   = True
+        elif o in ("-w", "--window"):
+            sequence   = True
+            window     = max(1,int(a))
+        elif o in ("-S", "--slices"):
+            sequence   = True
+            slices     = True
+        elif o in ("-r", "--ratemap"):
+            ratemap    = a
+        elif o in ("-a", "--aggregate"):
+            perslice   = True
+        elif o in ("-q", "--quiet"):
+            quiet      = True
+        elif o in ("-L", "--linkrate"):
+            linkrate   = float(a) * 1000000.0
+        elif o in ("-F", "--framerate"):
+            framerate  = float(a)
+        elif o in ("-V", "--vtotal"):
+            vtotal     = int(a)
+        elif o in ("-B", "--budget"):
+            budget     = float(a)
+
+    if len(files) != 1:
+        print "Usage: %s [OPTIONS] FILE" % (sys.argv[0])
+        print "  -j N   parse the slices in N worker processes"
+        print "  -s     print band mode statistics"
+        print "  -f     monitor a sequence of concatenated codestreams, one line per frame"
+        print "  -w N   average the bitrate over a window of N frames (default 8)"
+        print "  -S     also measure the bitrate of each slice"
+        print "  -r F   write the precinct rate map to F, as CSV if F ends in .csv, else as .npz"
+        print "  -a     aggregate the rate map per slice"
+        print "  -q     do not list the individual precincts"
+        print "  -L R   simulate the decoder buffer for a link rate of R Mbit/s"
+        print "  -F R   frame rate for the buffer model (default 60)"
+        print "  -V N   total number of lines per frame including blanking (default: height)"
+        print "  -B N   report when the latency exceeds N lines"
         sys.exit(1)
 
     print "###############################################################"
@@ -1300,10 +1938,29 @@ if __name__ == "__main__":
     print
 
     # Parse Files
-    filename  = sys.argv[1]
+    filename  = files[0]
     file = open(filename,"rb")
     jxs  = JXSCodestream()
+    jxs.statistics = statistics
+    jxs.quiet      = quiet
+    if ratemap:
+        jxs.ratemap = RateMap()
+    latency = None
+    if linkrate:
+        latency     = LatencyModel(linkrate,framerate,vtotal,budget)
+        jxs.latency = latency
+    if parallel:
+        jxs.filename  = filename
+        jxs.processes = processes
     try:
-        jxs.stream_parse(file,0)        
+        if sequence:
+            sequence_parse(file,window,slices,latency)
+        else:
+            jxs.stream_parse(file,0)        
+            if latency is not None:
+                print
+                latency.report()
     except JP2Error, e:
         print '***', str(e)
+    if ratemap and jxs.ratemap is not None and len(jxs.ratemap) > 0:
+        jxs.ratemap.write(ratemap,perslice)
@@ -0,0 +1,349 @@
+#!/usr/bin/python
+
+# $Id$
+
+import sys
+import getopt
+import struct
+
+from jp2utils import *
+from jxscodestream import *
+
+#
+# Some Exceptions
+#
+
+class PcapError(JP2Error):
+    def __init__(self, reason):
+        JP2Error.__init__(self, 'pcap: %s' % reason)
+
+#
+# A sequential reader for classic libpcap capture files. Records are
+# read one at a time, so memory does not depend on the capture size.
+#
+
+class PcapReader:
+    def __init__(self, file):
+        self.file = file
+        header    = file.read(24)
+        if len(header) != 24:
+            raise PcapError("file too short")
+        magic = header[0:4]
+        if magic == "\xd4\xc3\xb2\xa1":
+            self.endian = "<"
+            self.scale  = 1e-6
+        elif magic == "\xa1\xb2\xc3\xd4":
+            self.endian = ">"
+            self.scale  = 1e-6
+        elif magic == "\x4d\x3c\xb2\xa1":
+            self.endian = "<"
+            self.scale  = 1e-9
+        elif magic == "\xa1\xb2\x3c\x4d":
+            self.endian = ">"
+            self.scale  = 1e-9
+        elif magic == "\x0a\x0d\x0d\x0a":
+            raise PcapError("pcapng files are not supported, convert with editcap -F pcap")
+        else:
+            raise PcapError("not a pcap file")
+        self.record   = struct.Struct(self.endian + "LLLL")
+        self.linktype = struct.unpack(self.endian + "L",header[20:24])[0] & 0xffff
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        header = self.file.read(16)
+        if len(header) < 16:
+            raise StopIteration
+        sec,frac,incl,orig = self.record.unpack(header)
+        data = self.file.read(incl)
+        if len(data) != incl:
+            raise StopIteration
+        return (sec + frac * self.scale,data)
+
+#
+# Link, network and transport layer decoding. Returns the source and
+# destination address and port and the offset of the UDP payload, or
+# None if the packet is not UDP.
+#
+
+def decode_udp(linktype, data):
+    if linktype == 1: # Ethernet
+        offset = 12
+        ethertype = struct.unpack_from(">H",data,offset)[0]
+        offset = offset + 2
+        while ethertype == 0x8100 or ethertype == 0x88a8:
+            ethertype = struct.unpack_from(">H",data,offset + 2)[0]
+            offset    = offset + 4
+    elif linktype == 113: # Linux cooked capture
+        ethertype = struct.unpack_from(">H",data,14)[0]
+        offset    = 16
+    elif linktype == 101 or linktype == 12: # raw IP
+        offset = 0
+        if ord(data[0]) >> 4 == 6:
+            ethertype = 0x86dd
+        else:
+            ethertype = 0x0800
+    else:
+        raise PcapError("unsupported link type %d" % linktype)
+    if ethertype == 0x0800:
+        vihl,length,fragment,proto = struct.unpack_from(">BxHxxHxB",data,offset)
+        if proto != 17 or (fragment & 0x3fff) != 0:
+            return None
+        src    = data[offset + 12:offset + 16]
+        dst    = data[offset + 16:offset + 20]
+        offset = offset + ((vihl & 0x0f) << 2)
+    elif ethertype == 0x86dd:
+        if ord(data[offset + 6]) != 17:
+            return None
+        src    = data[offset +  8:offset + 24]
+        dst    = data[offset + 24:offset + 40]
+        offset = offset + 40
+    else:
+        return None
+    sport,dport,length = struct.unpack_from(">HHH",data,offset)
+    return (src,dst,sport,dport,offset + 8,min(offset + length,len(data)))
+
+def format_address(address):
+    if len(address) == 4:
+        return ".".join([str(ord(c)) for c in address])
+    return ":".join(["%x" % struct.unpack_from(">H",address,i)[0] for i in range(0,16,2)])
+
+#
+# An RTP packet carrying JPEG XS (RFC 9134).
+#
+
+class RTPPacket:
+    def __init__(self, data, start, end, arrival):
+        if end - start < 16:
+            raise PcapError("RTP packet too short")
+        b0,b1,self.seq,self.timestamp,self.ssrc = struct.unpack_from(">BBHLL",data,start)
+        if (b0 >> 6) != 2:
+            raise PcapError("not an RTP version 2 packet")
+        self.marker  = b1 >> 7
+        self.type    = b1 & 0x7f
+        self.arrival = arrival
+        offset       = start + 12 + ((b0 & 0x0f) << 2)
+        if b0 & 0x10:
+            extlen = struct.unpack_from(">H",data,offset + 2)[0]
+            offset = offset + 4 + (extlen << 2)
+        if b0 & 0x20:
+            end = end - ord(data[end - 1])
+        if end - offset < 4:
+            raise PcapError("RTP payload header missing")
+        header       = struct.unpack_from(">L",data,offset)[0]
+        self.T       = header >> 31
+        self.K       = (header >> 30) & 1
+        self.L       = (header >> 29) & 1
+        self.I       = (header >> 27) & 3
+        self.F       = (header >> 22) & 0x1f
+        self.SEP     = (header >> 11) & 0x7ff
+        self.P       = header & 0x7ff
+        self.payload = data[offset + 4:end]
+
+    def order(self):
+        return (self.SEP << 11) | self.P
+
+#
+# The depacketizer: collects the packets of one frame, identified by
+# the RTP timestamp, and rebuilds the codestream in (SEP,P) order once
+# the frame is complete. Only the packets of the current frame are kept.
+#
+
+class JXSDepacketizer:
+    def __init__(self, port = None, ssrc = None, quiet = False, output = None, clock = 90000.0):
+        self.port      = port
+        self.ssrc      = ssrc
+        self.quiet     = quiet
+        self.output    = output
+        self.clock     = clock
+        self.flow      = None
+        self.packets   = []
+        self.timestamp = None
+        self.closed    = False
+        self.frames    = 0
+        self.received  = 0
+        self.firstseq  = None
+        self.highest   = None
+        self.reordered = 0
+        self.late      = 0
+        self.broken    = 0
+        self.jitter    = 0.0
+        self.transit   = None
+        self.maxspread = 0.0
+
+    def extend_seq(self, seq):
+        if self.highest is None:
+            return seq
+        delta = (seq - self.highest) & 0xffff
+        if delta >= 0x8000:
+            delta = delta - 0x10000
+        return self.highest + delta
+
+    def add_packet(self, packet):
+        if self.ssrc is None:
+            self.ssrc = packet.ssrc
+        elif packet.ssrc != self.ssrc:
+            return
+        seq = self.extend_seq(packet.seq)
+        packet.extseq = seq
+        self.received = self.received + 1
+        if self.firstseq is None:
+            self.firstseq = seq
+            self.highest  = seq
+        elif seq < self.highest:
+            self.reordered = self.reordered + 1
+        else:
+            self.highest = seq
+        if self.timestamp is not None:
+            if packet.timestamp == self.timestamp:
+                late = self.closed
+            else:
+                late = ((packet.timestamp - self.timestamp) & 0xffffffff) >= 0x80000000
+            if late:
+                self.late = self.late + 1
+                return
+            if packet.timestamp != self.timestamp:
+                self.end_frame()
+        self.closed    = False
+        self.timestamp = packet.timestamp
+        self.packets.append(packet)
+        if packet.marker:
+            self.end_frame()
+
+    def end_frame(self):
+        packets = self.packets
+        self.closed = True
+        if len(packets) == 0:
+            return
+        self.packets = []
+        packets.sort(key = RTPPacket.order)
+        seqs     = [packet.extseq for packet in packets]
+        orders   = [packet.order() for packet in packets]
+        missing  = max(max(seqs) - min(seqs) + 1,orders[-1] + 1) - len(packets)
+        complete = missing == 0 and orders == range(len(packets)) and packets[-1].marker == 1
+        arrivals = [packet.arrival for packet in packets]
+        first    = min(arrivals)
+        spread   = max(arrivals) - first
+        self.maxspread = max(self.maxspread,spread)
+        timestamp = packets[0].timestamp
+        if self.transit is not None:
+            arrival,previous = self.transit
+            delta = (timestamp - previous) & 0xffffffff
+            if delta >= 0x80000000:
+                delta = delta - 0x100000000
+            d = abs((first - arrival) - delta / self.clock)
+            self.jitter = self.jitter + (d - self.jitter) / 16.0
+        self.transit = (first,timestamp)
+        codestream = "".join([packet.payload for packet in packets])
+        if packets[0].K:
+            mode = "slice"
+        else:
+            mode = "codestream"
+        status = "complete"
+        if not complete:
+            status = "incomplete, %d packets missing" % max(missing,0)
+            self.broken = self.broken + 1
+        print "Frame %6d F=%2d ts=%10d : %5d packets, %8d bytes, %s mode, spread %8.1f us, jitter %8.1f us, %s" % \
+              (self.frames,packets[0].F,packets[0].timestamp,len(packets),len(codestream),mode,
+               spread * 1e6,self.jitter * 1e6,status)
+        if complete:
+            if self.output is not None:
+                self.output.write(codestream)
+            if not self.quiet:
+                print
+                jxs = JXSCodestream(indent = 1)
+                try:
+                    jxs.stream_parse(Buffer(codestream),0)
+                except JP2Error, e:
+                    print '***', str(e)
+                print
+        self.frames = self.frames + 1
+
+    def parse(self, file):
+        pcap = PcapReader(file)
+        for arrival,data in pcap:
+            try:
+                udp = decode_udp(pcap.linktype,data)
+            except struct.error:
+                continue
+            if udp is None:
+                continue
+            src,dst,sport,dport,start,end = udp
+            if self.port is not None and dport != self.port:
+                continue
+            if self.flow is not None and self.flow != (dst,dport):
+                continue
+            try:
+                packet = RTPPacket(data,start,end,arrival)
+            except (PcapError,struct.error):
+                continue
+            if self.flow is None:
+                if packet.type < 96:
+                    continue
+                self.flow = (dst,dport)
+                print "Stream %s:%d -> %s:%d, payload type %d, SSRC 0x%08x" % \
+                      (format_address(src),sport,format_address(dst),dport,packet.type,packet.ssrc)
+                print
+            self.add_packet(packet)
+        self.end_frame()
+        self.report()
+
+    def report(self):
+        print
+        if self.firstseq is None:
+            print "No JPEG XS RTP stream found"
+            return
+        expected = self.highest - self.firstseq + 1
+        print "Frames            : %d" % self.frames
+        print "Incomplete frames : %d" % self.broken
+        print "Packets received  : %d" % self.received
+        print "Packets lost      : %d" % max(0,expected - self.received)
+        print "Packets reordered : %d" % self.reordered
+        print "Late packets      : %d" % self.late
+        print "Arrival jitter    : %.1f us" % (self.jitter * 1e6)
+        print "Max. frame spread : %.1f us" % (self.maxspread * 1e6)
+
+#
+# Main Function
+#
+
+if __name__ == "__main__":
+    # Read Arguments
+    (args, files) = getopt.getopt(sys.argv[1:], "p:s:qw:", ["port=", "ssrc=", "quiet", "write="])
+    port   = None
+    ssrc   = None
+    quiet  = False
+    output = None
+    for (o, a) in args:
+        if o in ("-p", "--port"):
+            port  = int(a)
+        elif o in ("-s", "--ssrc"):
+            ssrc  = int(a,0)
+        elif o in ("-q", "--quiet"):
+            quiet = True
+        elif o in ("-w", "--write"):
+            output = open(a,"wb")
+
+    if len(files) != 1:
+        print "Usage: %s [OPTIONS] FILE.pcap" % (sys.argv[0])
+        print "  -p PORT   only consider UDP packets to this port"
+        print "  -s SSRC   only consider RTP packets of this synchronization source"
+        print "  -q        do not parse the rebuilt codestreams"
+        print "  -w FILE   write the rebuilt codestreams to FILE"
+        sys.exit(1)
+
+    print "###############################################################"
+    print "# JPEG XS RTP log file generated by jxsrtp.py                 #"
+    print "###############################################################"
+    print
+
+    file = open(files[0],"rb")
+    rtp  = JXSDepacketizer(port,ssrc,quiet,output)
+    try:
+        rtp.parse(file)
+    except JP2Error, e:
+        print '***', str(e)
+    file.close()
+    if output is not None:
+        output.close()
@@ -0,0 +1,386 @@
+#!/usr/bin/python
+
+# $Id$
+
+import struct
+
+from jp2utils import *
+from icc import *
+
+#
+# TIFF/EXIF IFD decoding, shared by the JPEG XR file format parser
+# and the EXIF (APP1) marker of JPEG.
+#
+
+class IFDTruncated(JP2Error):
+    def __init__(self):
+        JP2Error.__init__(self, 'IFD or IFD value extends beyond the end of the data')
+
+# Type : (name, struct format, size of one element)
+ifd_types = {
+    1  : ("Byte",      "B", 1),
+    2  : ("UTF-8",     "s", 1),
+    3  : ("Short",     "H", 2),
+    4  : ("Long",      "L", 4),
+    5  : ("Rational",  "L", 8),
+    6  : ("Byte",      "b", 1),
+    7  : ("Undefined", "B", 1),
+    8  : ("Short",     "h", 2),
+    9  : ("Long",      "l", 4),
+    10 : ("Rational",  "l", 8),
+    11 : ("Float",     "f", 4),
+    12 : ("Double",    "d", 8)
+    }
+
+# Byte order prefixes, 0 is little endian (II), 1 is big endian (MM)
+ifd_endian  = ["<", ">"]
+ifd_short   = [struct.Struct("<H"), struct.Struct(">H")]
+ifd_long    = [struct.Struct("<L"), struct.Struct(">L")]
+ifd_entry   = [struct.Struct("<HHL4s"), struct.Struct(">HHL4s")]
+
+class IFDEntry:
+    def __init__(self,tag,type,count,offset):
+        self.tag      = tag
+        self.type     = type
+        self.count    = count
+        self.offset   = offset
+        self.voffset  = NotImplemented
+        self.values   = []
+        self.data     = ""
+        if type in ifd_types:
+            self.typename = ifd_types[type][0]
+        else:
+            self.typename = "Unknown"
+
+    def content(self):
+        content = ""
+        if self.type == 1 or self.type == 6:
+            for v in self.values:
+                content += "%02x " % (v & 0xff)
+        elif self.type == 2:
+            for c in self.data:
+                content += "%02x " % ord(c)
+        elif self.type == 3 or self.type == 8:
+            for v in self.values:
+                content += "%04x " % (v & 0xffff)
+        elif self.type == 4 or self.type == 9:
+            for v in self.values:
+                content += "%08x " % (v & 0xffffffff)
+        elif self.type == 5 or self.type == 10:
+            for v in self.values:
+                content += "%d/%d " % (v[0],v[1])
+        elif self.type == 11 or self.type == 12:
+            for v in self.values:
+                content += "%g " % v
+        else:
+            for c in self.data:
+                content += "0x%02x " % ord(c)
+        return content
+
+#
+# The IFD reader works on an in-memory buffer (a string or a memoryview);
+# offsets are relative to the TIFF header, base is the position of the
+# TIFF header in the file and only used for reporting.
+#
+
+class IFDReader:
+    def __init__(self,buffer,endian = 0,base = 0):
+        self.buffer = buffer
+        self.endian = endian
+        self.base   = base
+
+    def fetch(self,offset,length):
+        data = self.buffer[offset:offset + length]
+        if isinstance(data,memoryview):
+            data = data.tobytes()
+        return data
+
+    def read_short(self,offset):
+        data = self.fetch(offset,2)
+        if len(data) < 2:
+            raise IFDTruncated()
+        return ifd_short[self.endian].unpack(data)[0]
+
+    def read_long(self,offset):
+        data = self.fetch(offset,4)
+        if len(data) < 4:
+            raise IFDTruncated()
+        return ifd_long[self.endian].unpack(data)[0]
+
+    def read_ifd(self,offset):
+        count   = self.read_short(offset)
+        data    = self.fetch(offset + 2,12 * count + 4)
+        if len(data) < 12 * count:
+            raise IFDTruncated()
+        entries = []
+        unpack  = ifd_entry[self.endian].unpack_from
+        for i in range(count):
+            tag,type,cnt,field = unpack(data,12 * i)
+            entry = IFDEntry(tag,type,cnt,self.base + offset + 2 + 12 * i)
+            self.read_values(entry,field)
+            entries.append(entry)
+        if len(data) < 12 * count + 4:
+            next = 0
+        else:
+            next = ifd_long[self.endian].unpack_from(data,12 * count)[0]
+        return (entries,next)
+
+    def read_values(self,entry,field):
+        if not entry.type in ifd_types:
+            entry.values.append(ifd_long[self.endian].unpack(field)[0])
+            entry.data = field
+            return
+        name,fmt,size = ifd_types[entry.type]
+        length = size * entry.count
+        if length <= 4:
+            data = field[0:length]
+        else:
+            entry.voffset = ifd_long[self.endian].unpack(field)[0]
+            data = self.fetch(entry.voffset,length)
+            if len(data) < length:
+                raise IFDTruncated()
+        entry.data = data
+        if entry.type == 2:
+            if len(data) > 0 and data[len(data)-1] == '\0':
+                data = data[0:len(data)-1]
+            entry.values.append(data)
+        elif entry.type != 7:
+            if entry.type == 5 or entry.type == 10:
+                values = struct.unpack("%s%d%s" % (ifd_endian[self.endian],2 * entry.count,fmt),data)
+                entry.values = [[values[i],values[i+1]] for i in range(0,len(values),2)]
+            else:
+                entry.values = list(struct.unpack("%s%d%s" % (ifd_endian[self.endian],entry.count,fmt),data))
+
+#
+# The same on top of a file, values are read with one seek and one read
+# each.
+#
+
+class IFDFileReader(IFDReader):
+    def __init__(self,file,endian = 0):
+        IFDReader.__init__(self,None,endian)
+        self.infile = file
+
+    def fetch(self,offset,length):
+        self.infile.seek(offset)
+        return self.infile.read(length)
+
+#
+# Printing of IFD entries for the tags of TIFF and EXIF.
+#
+
+class IFDParser:
+    def __init__(self,reader,indent = 0):
+        self.reader  = reader
+        self.indent  = indent
+        self.visited = set()
+
+    def print_indent(self, buffer, nl = 1):
+        print_indent(buffer, self.indent, nl)
+
+    # An IFD is parsed only once, a sub-IFD or next IFD pointer back to
+    # an IFD already parsed would otherwise loop forever
+    def parse_ifd(self,offset):
+        if offset in self.visited:
+            self.print_indent("*** IFD at offset 0x%04lx already parsed" % offset)
+            return 0
+        self.visited.add(offset)
+        entries,next = self.reader.read_ifd(offset)
+        for entry in entries:
+            self.parse_ifd_entry(entry)
+        return next
+
+    def parse_ifd_entry(self,entry):
+        if entry.count <= 16:
+            self.print_indent("0x%04x(%8s[%2d]): %s" % (entry.tag,entry.typename,entry.count,entry.content()))
+        else:
+            self.print_indent("0x%04x(%8s[%2d]): ..." % (entry.tag,entry.typename,entry.count))
+        self.indent += 1
+        self.parse_tag(entry)
+        self.indent -= 1
+
+    def print_colorspace(self,values):
+        if values[0] == 1:
+            cspace = "sRGB"
+        elif values[0] == 0xffff:
+            cspace = "sRGB not preferred"
+        else:
+            cspace = "Reserved (%d)" % values[0]
+        self.print_indent("Colorspace        : %s" % cspace)
+
+    def print_componentsconfig(self,buffer):
+        self.print_indent("Components Config :")
+        px = ""
+        for i in range(0,len(buffer)):
+            c = ord(buffer[i])
+            if c == 0:
+                px += "not present "
+            elif c == 1:
+                px += "Y "
+            elif c == 2:
+                px += "Cb "
+            elif c == 3:
+                px += "Cr "
+            elif c == 4:
+                px += "R "
+            elif c == 5:
+                px += "G "
+            elif c == 6:
+                px += "B "
+            else:
+                px += "reserved (%d) " % c
+            self.print_indent("Pixel %2d Config   : %s" % (i+1,px))
+
+    def print_usercomment(self,buffer):
+        ctype = ordq(buffer[0:8])
+        if ctype == 0x4153424949000000:
+            comment = buffer[8:]
+            coding  = "ASCII"
+        elif ctype == 0x4a49530000000000:
+            comment = "???"
+            coding  = "JIS"
+        elif ctype == 0x554e49434f444500:
+            comment = buffer[8:]
+            coding  = "UNICODE"
+        else:
+            comment = "???"
+            coding  = "unknown"
+        self.print_indent("User Comment      : %s (%s)" % (comment,coding))
+
+    def print_exposureprog(self,ep):
+        if ep == 0:
+            prog = "Undefined"
+        elif ep == 1:
+            prog = "Manual"
+        elif ep == 2:
+            prog = "Normal"
+        elif ep == 3:
+            prog = "Aperture Priority"
+        elif ep == 4:
+            prog = "Shutter Priority"
+        elif ep == 5:
+            prog = "Creative"
+        elif ep == 6:
+            prog = "Action"
+        elif ep == 7:
+            prog = "Portrait"
+        elif ep == 8:
+            prog = "Landscape"
+        else:
+            prog = "Reserved (%d)" % ep
+        self.print_indent("Exposure Program  : %s" % prog)
+
+    def parse_tag(self,entry):
+        tag    = entry.tag
+        values = entry.values
+        if tag == 0x010d:
+            self.print_indent("Document Name     : %s" % values[0])
+        elif tag == 0x010e:
+            self.print_indent("Image Description : %s" % values[0])
+        elif tag == 0x010f:
+            self.print_indent("Equipment Make    : %s" % values[0])
+        elif tag == 0x0110:
+            self.print_indent("Equipment Model   : %s" % values[0])
+        elif tag == 0x011d:
+            self.print_indent("Page Name         : %s" % values[0])
+        elif tag == 0x0129:
+            self.print_indent("Page Number       : %d-%d" % (values[0],values[1]))
+        elif tag == 0x0131:
+            self.print_indent("Software Version  : %s" % values[0])
+        elif tag == 0x0132:
+            self.print_indent("Date and Time     : %s" % values[0])
+        elif tag == 0x013b:
+            self.print_indent("Artist Name       : %s" % values[0])
+        elif tag == 0x013c:
+            self.print_indent("Host Computer     : %s" % values[0])
+        elif tag == 0x0201:
+            self.print_indent("Thumbnail Offset  : 0x%08lx" % values[0])
+        elif tag == 0x0202:
+            self.print_indent("Thumbnail Length  : %d" % values[0])
+        elif tag == 0x8822:
+            self.print_exposureprog(values[0])
+        elif tag == 0x8298:
+            self.print_indent("Copyright Notice  : %s" % values[0])
+        elif tag == 0x829a:
+            self.print_indent("Exposure Time     : %s" % entry.content())
+        elif tag == 0x829d:
+            self.print_indent("F-Stops           : %s" % entry.content())
+        elif tag == 0x8824:
+            self.print_indent("Spectral Sens.    : %s" % values[0])
+        elif tag == 0x8827:
+            self.print_indent("ISO Speed Rating  : %d" % values[0])
+        elif tag == 0x9000:
+            self.print_indent("EXIF Version      : %s" % entry.content())
+        elif tag == 0x9003:
+            self.print_indent("Date & Time (Org) : %s" % values[0])
+        elif tag == 0x9004:
+            self.print_indent("Date & Time (Dgt) : %s" % values[0])
+        elif tag == 0x9101:
+            self.print_componentsconfig(entry.data)
+        elif tag == 0x9102:
+            self.print_indent("Compressed BPP    : %s" % entry.content())
+        elif tag == 0x9201:
+            self.print_indent("Shutter Speed     : %s" % entry.content())
+        elif tag == 0x9202:
+            self.print_indent("Aperture          : %s" % entry.content())
+        elif tag == 0x9203:
+            self.print_indent("Brightness        : %s" % entry.content())
+        elif tag == 0x9204:
+            self.print_indent("Exposure Bias     : %s" % entry.content())
+        elif tag == 0x9205:
+            self.print_indent("Max. Aperture     : %s" % entry.content())
+        elif tag == 0x9206:
+            self.print_indent("Subject Distance  : %s" % entry.content())
+        elif tag == 0x9290:
+            self.print_indent("Sub-Seconds       : %s" % values[0])
+        elif tag == 0x9291:
+            self.print_indent("Sub-Seconds (Org) : %s" % values[0])
+        elif tag == 0x9292:
+            self.print_indent("Sub-Seconds (Dgt) : %s" % values[0])
+        elif tag == 0x927c:
+            self.print_indent("Marker Note       : %d bytes" % len(entry.data))
+        elif tag == 0x9286:
+            self.print_usercomment(entry.data)
+        elif tag == 0xa000:
+            self.print_indent("FlashPix Version  : %s" % entry.content())
+        elif tag == 0xa001:
+            self.print_colorspace(values)
+        elif tag == 0xa002:
+            self.print_indent("PixelXDimension   : %s" % values[0])
+        elif tag == 0xa003:
+            self.print_indent("PixelYDimension   : %s" % values[0])
+        elif tag == 0xa004:
+            self.print_indent("Sound File        : %s" % values[0])
+        elif tag == 0xa20b:
+            self.print_indent("Flash Energy      : %s" % entry.content())
+        elif tag == 0xa20e:
+            self.print_indent("Focal Plane X Res : %s" % entry.content())
+        elif tag == 0xa20f:
+            self.print_indent("Focal Plane Y Res : %s" % entry.content())
+        elif tag == 0xa214:
+            self.print_indent("Subject Location  : %d,%d" % (values[0],values[1]))
+        elif tag == 0xa215:
+            self.print_indent("Exposure Index    : %s" % entry.content())
+        elif tag == 0xa404:
+            self.print_indent("Digital Zoom Ratio: %s" % entry.content())
+        elif tag == 0xa405:
+            self.print_indent("Focal Len for 35mm: %d" % values[0])
+        elif tag == 0xa420:
+            self.print_indent("Unique ID         : %s" % values[0])
+        elif tag == 0x02bc:
+            self.print_indent("Adobe XMP data:")
+            print entry.data
+        elif tag == 0x8769:
+            self.print_indent("EXIF 2.2 data:")
+            self.parse_ifd(values[0])
+        elif tag == 0x8825:
+            self.print_indent("GPS data:")
+            self.parse_ifd(values[0])
+        elif tag == 0xa005:
+            self.print_indent("Interoperability data:")
+            self.parse_ifd(values[0])
+        elif tag == 0x8773:
+            self.print_indent("ICC Profile:")
+            parse_icc(self.indent+1,entry.data)
+        elif tag == 0xea1c:
+            self.print_indent("Padding Data")